@@ -0,0 +1,194 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+# -------------------------
+# Stockage des images par adresse de contenu
+# -------------------------
+# Les messages ne contiennent plus l'image elle-même mais une référence
+# "sha256:<hex>" ; deux messages portant la même image partagent le même blob.
+# Backends :
+#   - StorageBlobStore : Supabase Storage / API compatible S3 (BLOB_STORE=supabase,
+#     BLOB_STORE_BUCKET), par défaut dès qu'un client Supabase est disponible.
+#     LocalStorageBucket le remplace hors ligne.
+#   - LocalBlobStore : système de fichiers, seulement sur demande explicite
+#     (BLOB_STORE=local, BLOB_STORE_DIR sur un disque persistant)
+# Les archives de conversations (retention_worker.py) utilisent un second
+# magasin, configuré de la même façon par ARCHIVE_STORE / ARCHIVE_STORE_DIR /
+# ARCHIVE_STORE_BUCKET.
+
+REF_PREFIX = "sha256:"
+
+
+class BlobNotFound(Exception):
+    """Aucun blob pour cette référence"""
+
+
+def blob_ref(data):
+    return REF_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def _blob_key(ref):
+    if not is_blob_ref(ref):
+        raise ValueError(f"Référence de blob invalide: {ref!r}")
+    digest = ref[len(REF_PREFIX):]
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class BlobStore(ABC):
+    @abstractmethod
+    def put(self, data, content_type="application/octet-stream"):
+        """Stocke data s'il n'existe pas déjà et retourne sa référence"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, ref):
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, ref):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ref):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ref):
+        return os.path.join(self.root, *_blob_key(ref).split("/"))
+
+    def put(self, data, content_type="application/octet-stream"):
+        ref = blob_ref(data)
+        path = self._path(ref)
+        if os.path.exists(path):
+            return ref
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return ref
+
+    def get(self, ref):
+        try:
+            with open(self._path(ref), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFound(ref)
+
+    def exists(self, ref):
+        return os.path.exists(self._path(ref))
+
+    def delete(self, ref):
+        try:
+            os.remove(self._path(ref))
+        except FileNotFoundError:
+            pass
+
+
+class StorageBlobStore(BlobStore):
+    """Backend objet : bucket Supabase Storage (supabase.storage.from_(bucket)) ou équivalent.
+    Aucun état local : retention_worker.py supprime des blobs depuis un autre processus,
+    chaque put repasse donc par le bucket (un doublon coûte une réponse 409)."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, data, content_type="application/octet-stream"):
+        ref = blob_ref(data)
+        try:
+            self.bucket.upload(_blob_key(ref), data, {"content-type": content_type, "upsert": "false"})
+        except Exception as e:
+            # Même contenu déjà présent : la déduplication est portée par la clé
+            if "exists" not in str(e).lower() and "duplicate" not in str(e).lower() and "409" not in str(e):
+                raise
+        return ref
+
+    def get(self, ref):
+        try:
+            data = self.bucket.download(_blob_key(ref))
+        except Exception as e:
+            raise BlobNotFound(f"{ref}: {e}")
+        if not data:
+            raise BlobNotFound(ref)
+        return data
+
+    def exists(self, ref):
+        try:
+            self.get(ref)
+            return True
+        except BlobNotFound:
+            return False
+
+    def delete(self, ref):
+        self.bucket.remove([_blob_key(ref)])
+
+
+class LocalStorageBucket:
+    """Remplaçant local d'un bucket Supabase Storage (mêmes méthodes upload/download/remove)"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def upload(self, key, data, file_options=None):
+        path = self._path(key)
+        if os.path.exists(path) and (file_options or {}).get("upsert") != "true":
+            raise Exception("409 Duplicate: The resource already exists")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def download(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def remove(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+def create_blob_store(supabase_client=None, env_prefix="BLOB_STORE", default_dir="blob_store",
+                      default_bucket="message-images"):
+    """Construit le backend configuré par BLOB_STORE ; env_prefix permet un second magasin
+    configuré à part (ex. ARCHIVE_STORE pour les archives froides). Sans configuration :
+    Supabase Storage si un client est fourni, sinon erreur — jamais de repli silencieux
+    sur le disque local, perdu au redémarrage des hébergements éphémères."""
+    kind = os.environ.get(env_prefix, "").lower()
+    if not kind:
+        if not supabase_client:
+            raise ValueError(
+                f"{env_prefix} non défini et aucun client Supabase : définir {env_prefix}=local "
+                f"(avec {env_prefix}_DIR sur un disque persistant) ou fournir un client Supabase"
+            )
+        kind = "supabase"
+    directory = os.environ.get(f"{env_prefix}_DIR", default_dir)
+    if kind == "local":
+        return LocalBlobStore(directory)
+    if kind == "supabase":
+        if not supabase_client:
+            raise ValueError(f"{env_prefix}=supabase nécessite un client Supabase")
+        return StorageBlobStore(supabase_client.storage.from_(os.environ.get(f"{env_prefix}_BUCKET", default_bucket)))
+    if kind == "storage-local":
+        return StorageBlobStore(LocalStorageBucket(directory))
+    raise ValueError(f"{env_prefix} inconnu: {kind}")
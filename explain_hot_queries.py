@@ -0,0 +1,153 @@
+"""Vérifie par EXPLAIN que chaque requête fréquente est servie par un index.
+
+Prépare les requêtes exactement comme PostgresRepository (repository.PREPARED_STATEMENTS),
+les exécute sous EXPLAIN (FORMAT JSON) avec des paramètres tirés de la base, et
+échoue si un plan contient un Seq Scan ou un Sort sur une requête ordonnée. Sur
+une petite base locale le planificateur peut préférer un Seq Scan même avec
+l'index : la requête est alors rejouée avec enable_seqscan/enable_sort désactivés
+pour prouver que l'index peut la servir. Code de sortie 1 si une requête ne l'est pas.
+
+Usage:
+    python migrate.py up && python explain_hot_queries.py
+    python explain_hot_queries.py --verbose
+"""
+import argparse
+import json
+import re
+import sys
+
+import psycopg2
+
+from repository import PREPARED_STATEMENTS, postgres_settings_from_env
+
+EXTRA_STATEMENTS = {
+    "messages_by_type": "SELECT COUNT(*) FROM public.messages WHERE type = $1",
+    # Le filtre de search_messages, hors fonction : EXPLAIN ne voit pas l'intérieur d'une fonction
+    # dans sa première fenêtre récente (migration 0015) ; le tri top-N des correspondances de la
+    # fenêtre est attendu : requête non marquée ordonnée
+    "messages_match": (
+        "SELECT id FROM public.messages WHERE content_tsv @@ websearch_to_tsquery('simple', $1) "
+        "AND created_at >= now() - interval '7 days' ORDER BY created_at DESC, id DESC LIMIT 10001"
+    ),
+}
+
+# nom -> (fonction des paramètres à partir de l'échantillon, requête ordonnée ?)
+HOT_QUERIES = {
+    "messages_latest": (lambda s: (s["conversation_id"], 51), True),
+    "messages_before": (lambda s: (s["conversation_id"], s["created_at"], s["message_id"], 51), True),
+    "conversations_by_user": (lambda s: (s["user_id"],), True),
+    "user_by_email": (lambda s: (s["email"],), False),
+    "messages_by_type": (lambda s: ("image",), False),
+    "message_counts": (lambda s: ([s["conversation_id"]],), False),
+    "messages_match": (lambda s: (s["word"],), False),
+}
+
+
+def sample_parameters(cur):
+    """Conversation la plus longue, son propriétaire, et un message au milieu de l'historique"""
+    cur.execute("""
+        SELECT conversation_id FROM public.messages
+        GROUP BY conversation_id ORDER BY COUNT(*) DESC LIMIT 1
+    """)
+    row = cur.fetchone()
+    if not row:
+        raise SystemExit("❌ Table messages vide : impossible de choisir des paramètres représentatifs")
+    conversation_id = row[0]
+    cur.execute("""
+        SELECT created_at, id FROM public.messages WHERE conversation_id = %s
+        ORDER BY created_at DESC, id DESC
+        OFFSET (SELECT COUNT(*) / 2 FROM public.messages WHERE conversation_id = %s) LIMIT 1
+    """, (conversation_id, conversation_id))
+    created_at, message_id = cur.fetchone()
+    cur.execute("SELECT content FROM public.messages WHERE id = %s", (message_id,))
+    words = re.findall(r"\w{4,}", cur.fetchone()[0] or "")
+    cur.execute("SELECT user_id FROM public.conversations WHERE conversation_id = %s", (conversation_id,))
+    user_id = cur.fetchone()[0]
+    cur.execute("SELECT email FROM public.users WHERE id = %s", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        cur.execute("SELECT email FROM public.users LIMIT 1")
+        row = cur.fetchone()
+    return {
+        "conversation_id": conversation_id,
+        "created_at": created_at,
+        "message_id": message_id,
+        "user_id": user_id,
+        "email": row[0] if row else "",
+        "word": words[0] if words else "image",
+    }
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, name, params):
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXPLAIN (FORMAT JSON) EXECUTE {name} ({placeholders})", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def problems(plan, ordered):
+    found = []
+    for node in plan_nodes(plan):
+        if node["Node Type"] == "Seq Scan":
+            found.append(f"Seq Scan sur {node.get('Relation Name')}")
+        if ordered and node["Node Type"] in ("Sort", "Incremental Sort"):
+            found.append(f"{node['Node Type']} ({', '.join(node.get('Sort Key', []))})")
+    return found
+
+
+def describe(plan):
+    return " → ".join(
+        f"{n['Node Type']}" + (f" [{n['Index Name']}]" if n.get("Index Name") else "")
+        for n in plan_nodes(plan)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="afficher les plans JSON complets")
+    args = parser.parse_args()
+
+    statements = dict(PREPARED_STATEMENTS, **EXTRA_STATEMENTS)
+    conn = psycopg2.connect(**postgres_settings_from_env())
+    conn.autocommit = True
+    failures = 0
+    try:
+        with conn.cursor() as cur:
+            sample = sample_parameters(cur)
+            for name, (make_params, ordered) in HOT_QUERIES.items():
+                cur.execute(f"PREPARE {name} AS {statements[name]}")
+                params = make_params(sample)
+                plan = explain(cur, name, params)
+                issues = problems(plan, ordered)
+                verdict = "✅ index"
+                if issues:
+                    # Petite table : le planificateur peut préférer un Seq Scan ; l'index sait-il servir la requête ?
+                    cur.execute("SET enable_seqscan = off")
+                    cur.execute("SET enable_sort = off")
+                    forced = explain(cur, name, params)
+                    cur.execute("RESET enable_seqscan")
+                    cur.execute("RESET enable_sort")
+                    if problems(forced, ordered):
+                        verdict = f"❌ {'; '.join(issues)}"
+                        failures += 1
+                    else:
+                        verdict = f"✅ index utilisable ({issues[0]} choisi sur cette petite table)"
+                        plan = forced
+                print(f"{name:24s} {verdict}\n{'':24s} {describe(plan)}")
+                if args.verbose:
+                    print(json.dumps(plan, indent=2, default=str))
+    finally:
+        conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
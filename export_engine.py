@@ -0,0 +1,303 @@
+"""Export en flux d'une table (CSV ou Parquet) à mémoire constante.
+
+Les lignes sont lues page par page — pagination par clé via Supabase, ou curseur
+serveur PostgreSQL — et écrites au fil de l'eau : la mémoire utilisée dépend de
+la taille d'une page, pas de celle de la table. Projection de colonnes et plage
+de dates [début, fin) optionnelles.
+
+Usage:
+    python export_engine.py messages --format parquet --out messages.parquet
+    python export_engine.py users --columns id,email,role,created_at --out users.csv
+    python export_engine.py messages --since 2025-01-01 --until 2025-02-01 --out - > janvier.csv
+    python export_engine.py messages --backend postgres --page-size 5000 --out messages.csv
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import zipfile
+
+DEFAULT_PAGE_SIZE = 1000
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_identifiers(*names):
+    for name in names:
+        if not IDENTIFIER.match(name or ""):
+            raise ValueError(f"Identifiant SQL invalide: {name!r}")
+
+
+def _keyset_filter(key_columns, last_row):
+    """Filtre PostgREST « après la dernière ligne » pour une clé d'une ou deux colonnes"""
+    if len(key_columns) == 1:
+        return None, (key_columns[0], last_row[key_columns[0]])
+    first, second = key_columns
+    a, b = last_row[first], last_row[second]
+    return f'{first}.gt."{a}",and({first}.eq."{a}",{second}.gt."{b}")', None
+
+
+# -------------------------
+# Sources de pages
+# -------------------------
+
+def supabase_pages(client, table, columns=None, key_columns=("id",), date_column="created_at",
+                   since=None, until=None, filters=None, page_size=DEFAULT_PAGE_SIZE):
+    """Pages de lignes (listes de dicts) par pagination par clé ; coût constant par page"""
+    key_columns = tuple(key_columns)
+    select = "*" if not columns else ", ".join(dict.fromkeys(list(columns) + list(key_columns)))
+    last_row = None
+    while True:
+        query = client.table(table).select(select)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        if since:
+            query = query.gte(date_column, since)
+        if until:
+            query = query.lt(date_column, until)
+        if last_row is not None:
+            or_filter, gt_filter = _keyset_filter(key_columns, last_row)
+            query = query.or_(or_filter) if or_filter else query.gt(*gt_filter)
+        for column in key_columns:
+            query = query.order(column)
+        rows = query.limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_row = rows[-1]
+
+
+def postgres_pages(conn, table, columns=None, key_columns=("id",), date_column="created_at",
+                   since=None, until=None, filters=None, page_size=DEFAULT_PAGE_SIZE):
+    """Pages de lignes via un curseur serveur nommé (la requête n'est exécutée qu'une fois)"""
+    _check_identifiers(table, date_column, *key_columns, *(columns or []), *(filters or {}))
+    select = "*" if not columns else ", ".join(columns)
+    where, params = [], []
+    for column, value in (filters or {}).items():
+        where.append(f"{column} = %s")
+        params.append(value)
+    if since:
+        where.append(f"{date_column} >= %s")
+        params.append(since)
+    if until:
+        where.append(f"{date_column} < %s")
+        params.append(until)
+    sql = f"SELECT {select} FROM public.{table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(key_columns)
+    with conn.cursor(name=f"export_{table}") as cur:
+        cur.itersize = page_size
+        cur.execute(sql, params)
+        names = None
+        while True:
+            rows = cur.fetchmany(page_size)
+            if names is None and cur.description:
+                names = [c.name for c in cur.description]
+            if not rows:
+                return
+            yield [dict(zip(names, row)) for row in rows]
+
+
+# -------------------------
+# Écrivains
+# -------------------------
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def write_csv(pages, out, columns=None):
+    """Écrit les pages en CSV dans un fichier texte ; retourne le nombre de lignes"""
+    writer = None
+    count = 0
+    for rows in pages:
+        if writer is None:
+            fieldnames = list(columns) if columns else list(rows[0].keys())
+            writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _cell(v) for k, v in row.items()})
+        count += len(rows)
+    return count
+
+
+def iter_csv_chunks(pages, columns=None, encoding="utf-8"):
+    """Variante génératrice : un bloc d'octets par page, pour une réponse HTTP en flux"""
+    buffer = io.StringIO()
+    writer = None
+    for rows in pages:
+        if writer is None:
+            fieldnames = list(columns) if columns else list(rows[0].keys())
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _cell(v) for k, v in row.items()})
+        yield buffer.getvalue().encode(encoding)
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# Types Parquet déclarés par table : le schéma ne dépend pas de la première page
+# (une colonne nulle en page 1 puis texte ensuite ferait échouer l'écriture).
+# Colonnes non déclarées, et tables inconnues : texte. Dates exportées en ISO 8601.
+TABLE_SCHEMAS = {
+    # Identifiants UUID, texte et dates : uniquement des colonnes texte
+    "users": {},
+    "conversations": {},
+    "messages": {},
+    "messager": {},
+    "password_resets": {"id": "int64", "expires_at": "float64", "used": "bool"},
+    "daily_message_stats": {
+        "messages": "int64", "text_messages": "int64", "image_messages": "int64",
+        "edits": "int64", "active_users": "int64", "new_conversations": "int64",
+    },
+    "conversation_archives": {"message_count": "int64", "archive_bytes": "int64"},
+}
+_CONVERTERS = {"int64": int, "float64": float, "bool": bool}
+
+
+def _arrow_schema(table, columns):
+    import pyarrow as pa
+
+    declared = TABLE_SCHEMAS.get(table, {})
+    types = {"int64": pa.int64(), "float64": pa.float64(), "bool": pa.bool_()}
+    return pa.schema([pa.field(name, types.get(declared.get(name), pa.string())) for name in columns])
+
+
+def write_parquet(pages, out, columns=None, compression="zstd", table=None):
+    """Écrit les pages en Parquet, un groupe de lignes par page ; retourne le nombre de lignes"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    declared = TABLE_SCHEMAS.get(table, {})
+    writer = None
+    schema = None
+    count = 0
+    try:
+        for rows in pages:
+            if writer is None:
+                names = list(columns) if columns else list(rows[0].keys())
+                schema = _arrow_schema(table, names)
+                writer = pq.ParquetWriter(out, schema, compression=compression)
+            data = {}
+            for field in schema:
+                values = [row.get(field.name) for row in rows]
+                convert = _CONVERTERS.get(declared.get(field.name))
+                if convert:
+                    values = [None if v is None else convert(v) for v in values]
+                else:
+                    values = [None if v is None else str(_cell(v)) for v in values]
+                data[field.name] = values
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export(pages, out, fmt="csv", columns=None, table=None):
+    """Exporte vers un chemin ou un fichier ouvert (binaire pour Parquet, texte pour CSV) ;
+    table choisit le schéma Parquet déclaré"""
+    if fmt == "parquet":
+        return write_parquet(pages, out, columns, table=table)
+    if fmt != "csv":
+        raise ValueError(f"Format d'export inconnu: {fmt}")
+    if isinstance(out, str):
+        with open(out, "w", encoding="utf-8", newline="") as f:
+            return write_csv(pages, f, columns)
+    return write_csv(pages, out, columns)
+
+
+def _safe_name(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value))
+
+
+def export_partitioned(pages, out, fmt="csv", partition_column="conversation_id", columns=None, table=None):
+    """Archive zip d'un fichier par partition (CSV, ou Parquet en répertoires partition=valeur).
+    Les pages doivent être triées par partition_column : un seul passage, groupe par groupe.
+    Retourne (nombre de partitions, nombre de lignes)."""
+    rows = itertools.chain.from_iterable(pages)
+    partitions = count = 0
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for value, group in itertools.groupby(rows, key=lambda row: row.get(partition_column)):
+            name = _safe_name(value)
+            # Re-découpe le groupe en pages pour les écrivains
+            group_pages = iter(lambda: list(itertools.islice(group, DEFAULT_PAGE_SIZE)), [])
+            if fmt == "csv":
+                with archive.open(f"{partition_column}_{name}.csv", "w") as entry:
+                    text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+                    count += write_csv(group_pages, text, columns)
+                    text.flush()
+                    text.detach()
+            elif fmt == "parquet":
+                # Parquet écrit son pied de page à la fin : fichier temporaire puis ajout à l'archive
+                fd, tmp_path = tempfile.mkstemp(suffix=".parquet")
+                os.close(fd)
+                try:
+                    count += write_parquet(group_pages, tmp_path, columns, table=table)
+                    archive.write(tmp_path, f"{partition_column}={name}/part-0.parquet")
+                finally:
+                    os.remove(tmp_path)
+            else:
+                raise ValueError(f"Format d'export inconnu: {fmt}")
+            partitions += 1
+    return partitions, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("table")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None,
+                        help="déduit de l'extension de --out par défaut")
+    parser.add_argument("--out", default="-", help="fichier de sortie, ou - pour la sortie standard (CSV)")
+    parser.add_argument("--columns", help="colonnes à exporter, séparées par des virgules")
+    parser.add_argument("--key", default="id", help="colonne(s) de pagination, uniques ensemble (ex. conversation_id,id)")
+    parser.add_argument("--date-column", default="created_at")
+    parser.add_argument("--since", help="début inclus (ISO 8601)")
+    parser.add_argument("--until", help="fin exclue (ISO 8601)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--backend", choices=["supabase", "postgres"], default="supabase")
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "csv")
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    key_columns = tuple(c.strip() for c in args.key.split(","))
+    options = dict(columns=columns, key_columns=key_columns, date_column=args.date_column,
+                   since=args.since, until=args.until, page_size=args.page_size)
+    conn = None
+    if args.backend == "postgres":
+        import psycopg2
+        from repository import postgres_settings_from_env
+        conn = psycopg2.connect(**postgres_settings_from_env())
+        pages = postgres_pages(conn, args.table, **options)
+    else:
+        from supabase import create_client
+        client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+        pages = supabase_pages(client, args.table, **options)
+    try:
+        if args.out == "-":
+            if fmt != "csv":
+                raise SystemExit("❌ Parquet nécessite un fichier de sortie (--out)")
+            count = write_csv(pages, sys.stdout, columns)
+        else:
+            count = export(pages, args.out, fmt, columns, table=args.table)
+    finally:
+        if conn is not None:
+            conn.close()
+    print(f"✅ {count} lignes exportées ({fmt})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
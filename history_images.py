@@ -0,0 +1,48 @@
+# -------------------------
+# Images de l'historique du chat
+# -------------------------
+# Une ligne de messages porte son image sous l'une de ces formes :
+#   - image_ref + thumb_ref : original et miniature dans le blob store ;
+#   - image_data : base64 des lignes pas encore migrées (sans miniature), hors
+#     de la projection de l'historique : une ligne type="image" sans référence
+#     est chargée à l'affichage par son id ;
+#   - thumb_ref seul : original supprimé par la rétention (retention_worker.py
+#     --image-policy drop), la miniature est tout ce qui reste.
+# Le rendu reçoit le module d'interface (st) et les chargeurs en paramètres :
+# il ne dépend ni de Streamlit ni du blob store, et se teste avec des doublures.
+
+
+def is_legacy_image(msg):
+    """Ligne pas encore migrée : image_data (non chargé avec l'historique) est sa seule image"""
+    return msg.get("type") == "image" and not (msg.get("image_ref") or msg.get("thumb_ref"))
+
+
+def message_has_image(msg):
+    """Vrai si la ligne porte une image affichable sous l'une des trois formes"""
+    return bool(msg.get("image_ref") or msg.get("thumb_ref") or msg.get("image_data") or is_legacy_image(msg))
+
+
+def message_has_original(msg):
+    return bool(msg.get("image_ref") or msg.get("image_data") or is_legacy_image(msg))
+
+
+def render_message_image(ui, msg, expanded, load_thumbnail, load_original):
+    """Affiche la miniature ; l'original n'est chargé qu'à la demande (et seulement s'il existe encore).
+    Retourne True si l'utilisateur vient de demander l'original (l'appelant relance le rendu)."""
+    message_id = msg.get("message_id")
+    has_original = message_has_original(msg)
+    if msg.get("thumb_ref") and (message_id not in expanded or not has_original):
+        ui.image(load_thumbnail(msg["thumb_ref"]), width=300)
+        if not has_original:
+            ui.caption("Original archivé : miniature uniquement")
+        elif ui.button("🔍 Voir l'original", key=f"original_{message_id}"):
+            expanded.add(message_id)
+            return True
+        return False
+    data = load_original(msg)
+    if data:
+        if message_id in expanded:
+            ui.image(data, use_column_width=True)
+        else:
+            ui.image(data, width=300)
+    return False
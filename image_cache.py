@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+# -------------------------
+# Cache LRU des images affichées dans l'historique
+# -------------------------
+# Chaque rerun Streamlit réaffiche tout l'historique : sans cache, chaque image
+# est relue dans le blob store (ou redécodée depuis le base64) à chaque clic.
+# Le cache est partagé par toutes les sessions du processus (st.cache_resource)
+# et borné en octets : on compte la taille réelle des données conservées, pas
+# le nombre d'entrées. Les clés sont des références "sha256:..." (contenu) ou
+# "message:<id>" pour les lignes base64 pas encore migrées.
+
+
+class ImageCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        # Une seule image ne doit pas pouvoir vider tout le cache
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "oversized": 0}
+
+    # -------------------------
+    # API publique
+    # -------------------------
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self._stats["oversized"] += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key, loader):
+        """Retourne la valeur en cache, sinon appelle loader() et la conserve"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,161 @@
+import io
+import os
+
+from PIL import Image
+
+# -------------------------
+# Dérivés d'images pour l'affichage du chat
+# -------------------------
+# L'historique affiche les images sur 300 px : on génère une seule fois, à
+# l'écriture, une miniature (2x pour les écrans haute densité) en WebP, ou en
+# JPEG si Pillow n'a pas été compilé avec WebP. L'original n'est chargé que sur demande.
+
+THUMBNAIL_MAX_EDGE = 600
+THUMBNAIL_QUALITY = 75
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _save_webp_or_jpeg(image, quality, prefer_webp=True):
+    """Encode en WebP (ou JPEG, fond blanc sous la transparence) ; retourne (bytes, content_type)"""
+    has_alpha = _has_alpha(image)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    if prefer_webp:
+        buffer = io.BytesIO()
+        try:
+            image.save(buffer, format="WEBP", quality=quality, method=4)
+            return buffer.getvalue(), "image/webp"
+        except (OSError, KeyError, ValueError):
+            pass
+    buffer = io.BytesIO()
+    if has_alpha:
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def make_thumbnail(image, max_edge=THUMBNAIL_MAX_EDGE, quality=THUMBNAIL_QUALITY):
+    """Retourne (bytes, content_type) d'une miniature dont le plus grand côté vaut au plus max_edge"""
+    thumb = image.copy()
+    thumb.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return _save_webp_or_jpeg(thumb, quality)
+
+
+def store_derivatives(store, image, original_bytes, original_content_type):
+    """Stocke l'original et sa miniature ; retourne (image_ref, thumb_ref)"""
+    image_ref = store.put(original_bytes, original_content_type)
+    thumb_bytes, thumb_type = make_thumbnail(image)
+    thumb_ref = store.put(thumb_bytes, thumb_type)
+    return image_ref, thumb_ref
+
+
+# -------------------------
+# Politique d'encodage des originaux
+# -------------------------
+# Sans perte uniquement si la source l'était (PNG, BMP, GIF, TIFF) ; sinon WebP
+# ou JPEG à qualité fixe. Les octets encodés servent à la fois au stockage et au
+# bouton de téléchargement. Configuration : IMAGE_FORMAT (webp|jpeg),
+# IMAGE_QUALITY, IMAGE_MAX_EDGE (0 = pas de limite), IMAGE_LOSSLESS_FORMAT (png|webp).
+
+LOSSLESS_SOURCE_FORMATS = {"PNG", "BMP", "GIF", "TIFF", "PPM", "TGA"}
+
+_MIME_FORMATS = {
+    "image/png": "PNG",
+    "image/jpeg": "JPEG",
+    "image/jpg": "JPEG",
+    "image/webp": "WEBP",
+    "image/gif": "GIF",
+    "image/bmp": "BMP",
+    "image/tiff": "TIFF",
+}
+
+_EXTENSIONS = {
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/jpeg": "jpg",
+}
+
+
+def normalize_source_format(source_format):
+    """Accepte un format PIL ("PNG") ou un type MIME ("image/png")"""
+    if not source_format:
+        return None
+    value = str(source_format).strip()
+    if "/" in value:
+        return _MIME_FORMATS.get(value.lower())
+    value = value.upper()
+    return "JPEG" if value == "JPG" else value
+
+
+class EncodedImage:
+    def __init__(self, data, content_type, size, lossless, baseline_bytes):
+        self.data = data
+        self.content_type = content_type
+        self.size = size
+        self.lossless = lossless
+        # Taille de la source si connue, sinon du bitmap brut
+        self.baseline_bytes = baseline_bytes
+
+    @property
+    def extension(self):
+        return _EXTENSIONS.get(self.content_type, "bin")
+
+    @property
+    def bytes_saved(self):
+        return self.baseline_bytes - len(self.data)
+
+    def describe(self):
+        ratio = len(self.data) / self.baseline_bytes if self.baseline_bytes else 1.0
+        return (
+            f"{self.extension.upper()} {self.size[0]}x{self.size[1]}, {len(self.data) / 1024:.0f} Ko "
+            f"({self.bytes_saved / 1024:+.0f} Ko économisés, {ratio:.0%} de la source)"
+        )
+
+
+class ImageEncodingPolicy:
+    def __init__(self, lossy_format="webp", quality=85, max_edge=None, lossless_format="png"):
+        self.lossy_format = lossy_format.lower()
+        self.quality = quality
+        self.max_edge = max_edge or None
+        self.lossless_format = lossless_format.lower()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            lossy_format=os.environ.get("IMAGE_FORMAT", "webp"),
+            quality=int(os.environ.get("IMAGE_QUALITY", "85")),
+            max_edge=int(os.environ.get("IMAGE_MAX_EDGE", "0")),
+            lossless_format=os.environ.get("IMAGE_LOSSLESS_FORMAT", "png"),
+        )
+
+    def encode(self, image, source_format=None, source_bytes=None):
+        """Encode l'image une seule fois selon la politique ; retourne un EncodedImage"""
+        source_format = normalize_source_format(source_format or image.format)
+        lossless = source_format in LOSSLESS_SOURCE_FORMATS
+        baseline = source_bytes or image.width * image.height * len(image.getbands())
+        if self.max_edge and max(image.size) > self.max_edge:
+            image = image.copy()
+            image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+        if lossless:
+            data, content_type = self._encode_lossless(image)
+        else:
+            data, content_type = _save_webp_or_jpeg(image, self.quality, prefer_webp=self.lossy_format == "webp")
+        return EncodedImage(data, content_type, image.size, lossless, baseline)
+
+    def _encode_lossless(self, image):
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+        if self.lossless_format == "webp":
+            buffer = io.BytesIO()
+            try:
+                image.save(buffer, format="WEBP", lossless=True, method=4)
+                return buffer.getvalue(), "image/webp"
+            except (OSError, KeyError, ValueError):
+                pass
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
@@ -0,0 +1,105 @@
+import os
+from abc import ABC, abstractmethod
+
+import requests
+
+# -------------------------
+# Backends de génération de réponses
+# -------------------------
+# get_ai_response ne connaît que l'interface LLMBackend.generate ; le backend est
+# choisi par la variable d'environnement LLM_BACKEND :
+#   - "gradio" (défaut) : Space Hugging Face via gradio_client
+#   - "openai"          : endpoint compatible OpenAI (vLLM, TGI...) via LLM_BASE_URL
+#   - "stub"            : serveur local déterministe (stub_llm_server.py) via LLM_STUB_URL
+
+DEFAULT_GRADIO_SPACE = "muryshev/LLaMA-3.1-70b-it-NeMo"
+
+
+class LLMBackendError(Exception):
+    """Erreur de génération côté backend"""
+
+
+class LLMBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def generate(self, prompt, max_tokens=8192, temperature=0.7, top_p=0.95):
+        raise NotImplementedError
+
+
+class GradioBackend(LLMBackend):
+    name = "gradio"
+
+    def __init__(self, space=DEFAULT_GRADIO_SPACE, api_name="/chat"):
+        from gradio_client import Client
+        self.space = space
+        self.api_name = api_name
+        self.client = Client(space)
+
+    def generate(self, prompt, max_tokens=8192, temperature=0.7, top_p=0.95):
+        resp = self.client.predict(
+            message=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            api_name=self.api_name
+        )
+        return str(resp)
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, base_url, model, api_key=None, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def generate(self, prompt, max_tokens=8192, temperature=0.7, top_p=0.95):
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "stream": False
+        }
+        response = self.session.post(f"{self.base_url}/v1/chat/completions", json=payload, timeout=self.timeout)
+        if response.status_code != 200:
+            raise LLMBackendError(f"HTTP {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, ValueError) as e:
+            raise LLMBackendError(f"Réponse invalide: {e}")
+
+
+class StubBackend(OpenAICompatibleBackend):
+    name = "stub"
+
+    def __init__(self, base_url="http://127.0.0.1:8765", timeout=300):
+        super().__init__(base_url, model="stub", timeout=timeout)
+
+
+def create_llm_backend(kind=None):
+    """Construit le backend configuré par LLM_BACKEND (ou kind)"""
+    kind = (kind or os.environ.get("LLM_BACKEND", "gradio")).lower()
+    if kind == "gradio":
+        return GradioBackend(
+            space=os.environ.get("LLM_GRADIO_SPACE", DEFAULT_GRADIO_SPACE),
+            api_name=os.environ.get("LLM_GRADIO_API_NAME", "/chat")
+        )
+    if kind == "openai":
+        base_url = os.environ.get("LLM_BASE_URL")
+        if not base_url:
+            raise LLMBackendError("Variable LLM_BASE_URL manquante")
+        return OpenAICompatibleBackend(
+            base_url,
+            model=os.environ.get("LLM_MODEL", "meta-llama/Llama-3.1-70B-Instruct"),
+            api_key=os.environ.get("LLM_API_KEY")
+        )
+    if kind == "stub":
+        return StubBackend(os.environ.get("LLM_STUB_URL", "http://127.0.0.1:8765"))
+    raise LLMBackendError(f"LLM_BACKEND inconnu: {kind}")
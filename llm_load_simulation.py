@@ -0,0 +1,113 @@
+"""Simulation de charge de l'ordonnanceur LLM contre un faux backend local.
+
+Par défaut le backend est une fonction qui dort ; avec --stub, les requêtes passent
+par StubBackend vers un stub_llm_server.py démarré dans le même processus.
+
+Usage:
+    python llm_load_simulation.py --users 6 --spammer-requests 20 --concurrency 2
+    python llm_load_simulation.py --stub --token-rate 60
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from llm_scheduler import FairScheduler, SchedulerOverloaded
+
+
+def fake_backend(prompt, latency, jitter):
+    """Faux modèle : dort pendant une latence aléatoire puis renvoie un texte"""
+    time.sleep(max(0.0, random.gauss(latency, jitter)))
+    return f"réponse à {prompt}"
+
+
+def run_client(scheduler, user_id, n_requests, think_time, call, results):
+    for i in range(n_requests):
+        started = time.monotonic()
+        try:
+            scheduler.submit(user_id, call, f"{user_id}-{i}")
+            results.append((user_id, "ok", time.monotonic() - started))
+        except SchedulerOverloaded:
+            results.append((user_id, "shed", time.monotonic() - started))
+        time.sleep(think_time)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=6, help="utilisateurs normaux")
+    parser.add_argument("--requests-per-user", type=int, default=3)
+    parser.add_argument("--spammer-requests", type=int, default=20)
+    parser.add_argument("--spammer-threads", type=int, default=4, help="onglets ouverts par le spammeur")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--max-queue-wait", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--stub", action="store_true", help="passer par le serveur stub HTTP local")
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--token-rate", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    args = parser.parse_args()
+
+    stub_server = None
+    if args.stub:
+        from llm_backends import StubBackend
+        from stub_llm_server import serve
+        stub_server = serve(port=args.stub_port, latency=args.latency, token_rate=args.token_rate, tokens=args.tokens)
+        threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+        backend = StubBackend(f"http://127.0.0.1:{args.stub_port}")
+        call = lambda prompt: backend.generate(prompt, max_tokens=args.tokens)
+    else:
+        call = lambda prompt: fake_backend(prompt, args.latency, args.jitter)
+
+    scheduler = FairScheduler(
+        max_concurrency=args.concurrency,
+        max_queue_wait=args.max_queue_wait,
+        max_pending_per_user=args.spammer_threads,
+        poll_interval=0.05,
+    )
+    results = []
+    threads = []
+    per_thread = max(1, args.spammer_requests // args.spammer_threads)
+    for _ in range(args.spammer_threads):
+        threads.append(threading.Thread(
+            target=run_client,
+            args=(scheduler, "spammer", per_thread, 0.0, call, results)
+        ))
+    for u in range(args.users):
+        threads.append(threading.Thread(
+            target=run_client,
+            args=(scheduler, f"user{u}", args.requests_per_user, 0.2, call, results)
+        ))
+
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    print(f"Durée totale: {elapsed:.2f}s  ({len(results)} requêtes)")
+    for group in ("spammer", "normal"):
+        rows = [r for r in results if (r[0] == "spammer") == (group == "spammer")]
+        ok = [d for _, status, d in rows if status == "ok"]
+        shed = sum(1 for _, status, _ in rows if status == "shed")
+        print(
+            f"{group:8s} ok={len(ok):3d} shed={shed:3d} "
+            f"p50={percentile(ok, 50):.2f}s p95={percentile(ok, 95):.2f}s "
+            f"moyenne={statistics.mean(ok) if ok else 0:.2f}s"
+        )
+    print("Ordonnanceur:", scheduler.snapshot())
+    if stub_server:
+        stub_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
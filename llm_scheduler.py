@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+
+# -------------------------
+# Ordonnanceur équitable des appels LLM
+# -------------------------
+# Un seul ordonnanceur par processus (voir get_llm_scheduler dans streamlit_app.py).
+# Chaque utilisateur possède sa propre file ; les créneaux libérés sont attribués
+# à tour de rôle entre les utilisateurs en attente, si bien qu'un utilisateur qui
+# envoie beaucoup de messages ne peut pas affamer les autres.
+
+
+class SchedulerOverloaded(Exception):
+    """Levée quand une requête est refusée ou abandonnée pour délester la charge"""
+
+
+class _Ticket:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+
+
+class FairScheduler:
+    def __init__(self, max_concurrency=2, max_queue_wait=90.0, max_pending_per_user=3, poll_interval=0.5):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue_wait = float(max_queue_wait)
+        self.max_pending_per_user = max(1, int(max_pending_per_user))
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._rotation = deque()
+        self._active = 0
+        self._avg_service_time = None
+        self._stats = {"completed": 0, "shed": 0, "rejected": 0, "total_wait": 0.0}
+
+    # -------------------------
+    # API publique
+    # -------------------------
+    def submit(self, user_id, fn, *args, on_position=None, **kwargs):
+        """Exécute fn(*args, **kwargs) dès qu'un créneau est attribué à user_id"""
+        ticket = self._enqueue(user_id)
+        try:
+            self._wait_for_slot(ticket, on_position)
+        except BaseException:
+            # Attente interrompue (délestage, ou Streamlit qui lève StopException /
+            # RerunException dans on_position) : le ticket ne doit garder ni sa place ni son créneau
+            with self._lock:
+                self._abandon_locked(ticket)
+            raise
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(time.monotonic() - started)
+
+    def snapshot(self):
+        """Retourne l'état courant de l'ordonnanceur (pour l'affichage et les tests de charge)"""
+        with self._lock:
+            completed = self._stats["completed"]
+            return {
+                "active": self._active,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "queued_by_user": {u: len(q) for u, q in self._queues.items()},
+                "avg_service_time": self._avg_service_time,
+                "avg_queue_wait": self._stats["total_wait"] / completed if completed else 0.0,
+                "completed": completed,
+                "shed": self._stats["shed"],
+                "rejected": self._stats["rejected"],
+            }
+
+    # -------------------------
+    # Interne
+    # -------------------------
+    def _enqueue(self, user_id):
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is not None and len(queue) >= self.max_pending_per_user:
+                self._stats["rejected"] += 1
+                raise SchedulerOverloaded(
+                    f"Trop de requêtes en attente pour cet utilisateur ({len(queue)}). "
+                    "Attendez la réponse précédente."
+                )
+            predicted = self._predicted_wait_locked(extra_ahead=self._queued_count_locked())
+            if predicted is not None and predicted > self.max_queue_wait:
+                self._stats["rejected"] += 1
+                raise SchedulerOverloaded(
+                    f"Vision AI est surchargé (attente estimée {int(predicted)}s). Réessayez plus tard."
+                )
+            ticket = _Ticket(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+                self._rotation.append(user_id)
+            queue.append(ticket)
+            self._dispatch_locked()
+            return ticket
+
+    def _wait_for_slot(self, ticket, on_position):
+        while not ticket.granted.wait(self.poll_interval):
+            with self._lock:
+                if ticket.granted.is_set():
+                    break
+                waited = time.monotonic() - ticket.enqueued_at
+                if waited > self.max_queue_wait:
+                    self._remove_locked(ticket)
+                    self._stats["shed"] += 1
+                    raise SchedulerOverloaded(
+                        f"Vision AI est surchargé : aucune place libérée après {int(waited)}s d'attente. Réessayez plus tard."
+                    )
+                position = self._position_locked(ticket)
+            if on_position:
+                on_position(position)
+        with self._lock:
+            self._stats["total_wait"] += time.monotonic() - ticket.enqueued_at
+
+    def _release(self, service_time):
+        with self._lock:
+            self._active -= 1
+            self._stats["completed"] += 1
+            if self._avg_service_time is None:
+                self._avg_service_time = service_time
+            else:
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._dispatch_locked()
+
+    def _dispatch_locked(self):
+        while self._active < self.max_concurrency and self._rotation:
+            user_id = self._rotation.popleft()
+            queue = self._queues[user_id]
+            ticket = queue.popleft()
+            if queue:
+                self._rotation.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._active += 1
+            ticket.granted.set()
+
+    def _abandon_locked(self, ticket):
+        if ticket.granted.is_set():
+            # Créneau déjà attribué mais jamais utilisé : on le rend sans compter de service
+            self._active -= 1
+            self._dispatch_locked()
+        else:
+            self._remove_locked(ticket)
+
+    def _remove_locked(self, ticket):
+        queue = self._queues.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[ticket.user_id]
+            self._rotation.remove(ticket.user_id)
+
+    def _queued_count_locked(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def _position_locked(self, ticket):
+        """Position approximative (1 = prochain servi) sous un tour de rôle par utilisateur"""
+        queue = self._queues.get(ticket.user_id)
+        if not queue or ticket not in queue:
+            return 0
+        index = queue.index(ticket)
+        ahead = index
+        for user_id, other in self._queues.items():
+            if user_id != ticket.user_id:
+                ahead += min(len(other), index + 1)
+        return ahead + 1
+
+    def _predicted_wait_locked(self, extra_ahead):
+        if self._avg_service_time is None or (self._active < self.max_concurrency and extra_ahead == 0):
+            return None
+        return (extra_ahead / self.max_concurrency + 1) * self._avg_service_time
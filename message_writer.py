@@ -0,0 +1,222 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("vision_ai.message_writer")
+
+# -------------------------
+# File d'écriture différée des messages
+# -------------------------
+# add_message acquitte localement puis la ligne part dans cette file ; un thread
+# unique regroupe les lignes de toutes les sessions en insertions multi-lignes.
+# Les identifiants sont générés côté client (uuid4), donc un lot rejoué après une
+# erreur réseau est idempotent tant que insert_batch fait un upsert sur "id".
+# Une erreur transitoire (connexion, délai, base indisponible) fait rejouer le
+# lot entier avec un délai croissant. Une erreur propre aux lignes (contrainte
+# violée, donnée invalide) fait couper le lot en deux, une seule fois, jusqu'à
+# isoler les lignes fautives : seules celles-ci partent en lettres mortes,
+# ajoutées au fichier JSON Lines dead_letter_path pour survivre à un redémarrage.
+
+
+def is_row_level_error(error):
+    """Vrai si l'erreur tient au contenu des lignes : SQLSTATE de classe 22 (donnée
+    invalide) ou 23 (contrainte), via pgcode (psycopg2) ou code (PostgREST)"""
+    if isinstance(error, (ValueError, TypeError)):
+        return True
+    code = getattr(error, "pgcode", None) or getattr(error, "code", None)
+    return isinstance(code, str) and code[:2] in ("22", "23")
+
+
+class MessageWriteBehind:
+    def __init__(self, insert_batch, max_batch=50, flush_interval=0.2, max_retries=5, retry_backoff=0.5,
+                 on_success=None, dead_letter_path=None, is_row_error=is_row_level_error):
+        self.insert_batch = insert_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_success = on_success
+        self.dead_letter_path = dead_letter_path
+        self.is_row_error = is_row_error
+        self._failing = False
+        self._dead_letter_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._latencies = deque(maxlen=200)
+        self._batch_sizes = deque(maxlen=200)
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "retries": 0, "splits": 0, "failed": 0}
+        self.dead_letters = deque(maxlen=1000)
+        self._thread = threading.Thread(target=self._run, name="message-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # -------------------------
+    # API publique
+    # -------------------------
+    def enqueue(self, row):
+        """Ajoute une ligne à écrire ; retourne immédiatement son identifiant"""
+        if self._closed:
+            raise RuntimeError("MessageWriteBehind fermé")
+        with self._cond:
+            self._pending += 1
+            self._stats["enqueued"] += 1
+        self._queue.put((time.monotonic(), row))
+        return row.get("id")
+
+    def flush(self, timeout=None):
+        """Attend que toutes les lignes en file soient écrites (ou abandonnées) ; retourne False si timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=1.0)
+
+    @property
+    def failing(self):
+        """Vrai tant que la dernière écriture a échoué sur une erreur transitoire (base indisponible)"""
+        return self._failing
+
+    def requeue_dead_letters(self):
+        """Remet en file les lignes du fichier de lettres mortes (après correction de la cause) ;
+        retourne leur nombre. Les ids étant conservés, une ligne déjà écrite n'est pas dupliquée."""
+        if not self.dead_letter_path:
+            return 0
+        with self._dead_letter_lock:
+            if not os.path.exists(self.dead_letter_path):
+                return 0
+            with open(self.dead_letter_path, "r", encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.dead_letter_path)
+        for entry in entries:
+            self.enqueue(entry["row"])
+        return len(entries)
+
+    def metrics(self):
+        with self._cond:
+            latencies = sorted(self._latencies)
+            sizes = list(self._batch_sizes)
+            return {
+                "queue_depth": self._pending,
+                **self._stats,
+                "flush_latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                "flush_latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            }
+
+    # -------------------------
+    # Interne
+    # -------------------------
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _insert_isolating(self, rows):
+        """Coupe en deux un lot refusé pour erreur de ligne, jusqu'à isoler les lignes fautives.
+        Une erreur transitoire en cours de route arrête la coupe pour ce sous-lot.
+        Retourne (lignes écrites, [(ligne, erreur)] échouées)."""
+        with self._cond:
+            self._stats["splits"] += 1
+        written, failed = [], []
+        middle = len(rows) // 2
+        for half in (rows[:middle], rows[middle:]):
+            try:
+                self.insert_batch(half)
+                written.extend(half)
+            except Exception as e:
+                if not self.is_row_error(e) or len(half) == 1:
+                    failed.extend((row, e) for row in half)
+                    continue
+                done, bad = self._insert_isolating(half)
+                written.extend(done)
+                failed.extend(bad)
+        return written, failed
+
+    def _write(self, batch):
+        rows = [row for _, row in batch]
+        started = time.monotonic()
+        written = []
+        failed = []
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.insert_batch(rows)
+                written, failed = rows, []
+                self._failing = False
+                break
+            except Exception as e:
+                if self.is_row_error(e):
+                    logger.warning("Écriture de %d messages refusée, isolement des lignes fautives: %s", len(rows), e)
+                    written, failed = self._insert_isolating(rows) if len(rows) > 1 else ([], [(rows[0], e)])
+                    self._failing = False
+                    break
+                # Panne probable de la base : le lot entier est rejoué après une pause, sans le découper
+                self._failing = True
+                failed = [(row, e) for row in rows]
+                logger.warning("Écriture de %d messages échouée (tentative %d): %s", len(rows), attempt + 1, e)
+                if attempt == self.max_retries:
+                    break
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        finished = time.monotonic()
+        if written and self.on_success:
+            try:
+                self.on_success(written)
+            except Exception as e:
+                logger.warning("on_success: %s", e)
+        if failed:
+            logger.error("Abandon de %d messages sur %d", len(failed), len(batch))
+            self._dead_letter(failed)
+        with self._cond:
+            self._pending -= len(batch)
+            self._stats["batches"] += 1
+            self._stats["written"] += len(written)
+            self._stats["failed"] += len(failed)
+            self._batch_sizes.append(len(batch))
+            for enqueued_at, _ in batch:
+                self._latencies.append(finished - enqueued_at)
+            self._cond.notify_all()
+        logger.debug("Lot de %d messages écrit en %.3fs", len(batch), finished - started)
+
+    def _dead_letter(self, failed):
+        self.dead_letters.extend(row for row, _ in failed)
+        if not self.dead_letter_path:
+            return
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for row, error in failed:
+                    f.write(json.dumps({"row": row, "error": str(error), "failed_at": time.time()},
+                                       ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.error("Lettres mortes non persistées (%s): %s", self.dead_letter_path, e)
@@ -0,0 +1,142 @@
+"""Applique les migrations SQL versionnées de migrations/ sur PostgreSQL.
+
+Chaque fichier NNNN_nom.sql est appliqué une seule fois, dans l'ordre des
+versions, dans sa propre transaction ; la table public.schema_migrations garde
+la version, le nom, l'empreinte du fichier et la date d'application. Un verrou
+consultatif empêche deux exécutions concurrentes. Connexion via
+DB_HOST/DB_NAME/DB_USER/DB_PASSWORD/DB_PORT (.env).
+
+Usage:
+    python migrate.py status
+    python migrate.py up
+    python migrate.py up --target 0005
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+
+import psycopg2
+
+from repository import postgres_settings_from_env
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+# Identifiant arbitraire du verrou consultatif pg_advisory_lock
+LOCK_ID = 72_301_145
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append({
+            "version": match.group(1),
+            "name": match.group(2),
+            "sql": sql,
+            "checksum": hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+        })
+    versions = [m["version"] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Deux migrations portent le même numéro de version")
+    return migrations
+
+
+def ensure_history_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS public.schema_migrations (
+                version TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+    conn.commit()
+
+
+def applied_migrations(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT version, name, checksum, applied_at FROM public.schema_migrations ORDER BY version")
+        return {row[0]: {"name": row[1], "checksum": row[2], "applied_at": row[3]} for row in cur.fetchall()}
+
+
+def status(conn, migrations):
+    applied = applied_migrations(conn)
+    for m in migrations:
+        done = applied.get(m["version"])
+        if not done:
+            print(f"  {m['version']} {m['name']:32s} en attente")
+        elif done["checksum"] != m["checksum"]:
+            print(f"⚠️ {m['version']} {m['name']:32s} appliquée le {done['applied_at']:%Y-%m-%d %H:%M}, fichier modifié depuis")
+        else:
+            print(f"✅ {m['version']} {m['name']:32s} appliquée le {done['applied_at']:%Y-%m-%d %H:%M}")
+    unknown = sorted(set(applied) - {m["version"] for m in migrations})
+    for version in unknown:
+        print(f"❓ {version} {applied[version]['name']:32s} appliquée mais absente de migrations/")
+
+
+def up(conn, migrations, target=None):
+    applied = applied_migrations(conn)
+    pending = [m for m in migrations if m["version"] not in applied and (target is None or m["version"] <= target)]
+    for m in migrations:
+        done = applied.get(m["version"])
+        if done and done["checksum"] != m["checksum"]:
+            print(f"⚠️ {m['version']}_{m['name']}: fichier modifié après application (non rejoué)")
+    if not pending:
+        print("✅ Schéma à jour")
+        return 0
+    for m in pending:
+        print(f"… {m['version']}_{m['name']}")
+        try:
+            with conn.cursor() as cur:
+                cur.execute(m["sql"])
+                cur.execute(
+                    "INSERT INTO public.schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                    (m["version"], m["name"], m["checksum"])
+                )
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"❌ {m['version']}_{m['name']}: {e}")
+            return 1
+        for notice in conn.notices:
+            print(f"   {notice.strip()}")
+        del conn.notices[:]
+    print(f"✅ {len(pending)} migration(s) appliquée(s)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["status", "up"])
+    parser.add_argument("--target", help="dernière version à appliquer (ex. 0005)")
+    args = parser.parse_args()
+
+    migrations = load_migrations()
+    conn = psycopg2.connect(**postgres_settings_from_env())
+    try:
+        ensure_history_table(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+        conn.commit()
+        try:
+            if args.command == "status":
+                status(conn, migrations)
+                return 0
+            return up(conn, migrations, args.target)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
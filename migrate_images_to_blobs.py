@@ -0,0 +1,100 @@
+"""Migre les images base64 de messages.image_data vers le blob store.
+
+Traite les lignes par lots (image_data non nul, image_ref nul) : chaque image est
+décodée, stockée par empreinte SHA-256 (déduplication), puis la ligne reçoit
+image_ref et image_data est vidé. Relançable sans risque : une ligne déjà migrée
+n'est plus sélectionnée, et un blob déjà présent n'est pas réécrit. La miniature
+utilisée par l'historique du chat est générée au passage.
+
+Usage:
+    python migrate_images_to_blobs.py --batch-size 100 --sleep 0.5
+    python migrate_images_to_blobs.py --dry-run --limit 1000
+"""
+import argparse
+import base64
+import binascii
+import io
+import os
+import time
+
+from PIL import Image
+
+from supabase import create_client
+
+from blob_store import blob_ref, create_blob_store
+from image_derivatives import store_derivatives
+
+
+def fetch_batch(supabase, batch_size, after_id):
+    query = (
+        supabase.table("messages")
+        .select("id, image_data")
+        .not_.is_("image_data", "null")
+        .is_("image_ref", "null")
+        .order("id")
+        .limit(batch_size)
+    )
+    if after_id:
+        query = query.gt("id", after_id)
+    return query.execute().data or []
+
+
+def migrate(supabase, store, batch_size=100, sleep=0.5, limit=None, dry_run=False):
+    stats = {"rows": 0, "migrated": 0, "invalid": 0, "bytes_before": 0, "bytes_after": 0, "blobs": set()}
+    after_id = None
+    while limit is None or stats["rows"] < limit:
+        rows = fetch_batch(supabase, batch_size, after_id)
+        if not rows:
+            break
+        for row in rows:
+            after_id = row["id"]
+            stats["rows"] += 1
+            encoded = row.get("image_data") or ""
+            try:
+                data = base64.b64decode(encoded, validate=True)
+                image = Image.open(io.BytesIO(data))
+                image.load()
+            except (binascii.Error, ValueError, OSError):
+                stats["invalid"] += 1
+                print(f"⚠️ {row['id']}: image_data n'est pas une image base64 valide, ignoré")
+                continue
+            stats["bytes_before"] += len(encoded)
+            if dry_run:
+                ref = blob_ref(data)
+            else:
+                ref, thumb_ref = store_derivatives(store, image, data, "image/png")
+                supabase.table("messages").update({
+                    "image_ref": ref,
+                    "thumb_ref": thumb_ref,
+                    "image_data": None
+                }).eq("id", row["id"]).execute()
+            if ref not in stats["blobs"]:
+                stats["bytes_after"] += len(data)
+            stats["blobs"].add(ref)
+            stats["migrated"] += 1
+        print(f"… {stats['migrated']} lignes migrées ({stats['rows']} parcourues)")
+        # Pause entre les lots pour ne pas monopoliser la base
+        time.sleep(sleep)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--sleep", type=float, default=0.5, help="pause entre deux lots (secondes)")
+    parser.add_argument("--limit", type=int, default=None, help="nombre maximal de lignes à traiter")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    store = create_blob_store(supabase)
+    stats = migrate(supabase, store, args.batch_size, args.sleep, args.limit, args.dry_run)
+    print(
+        f"✅ {stats['migrated']} images migrées, {stats['invalid']} invalides, "
+        f"{len(stats['blobs'])} blobs distincts — "
+        f"{stats['bytes_before'] / 1e6:.1f} Mo base64 → {stats['bytes_after'] / 1e6:.1f} Mo de blobs"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+-- Table des jetons de réinitialisation de mot de passe (reprise de sql.txt)
+CREATE TABLE IF NOT EXISTS public.password_resets (
+    id BIGSERIAL PRIMARY KEY,
+    email TEXT NOT NULL,
+    reset_token TEXT NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL,
+    created_at TEXT NOT NULL,
+    used BOOLEAN DEFAULT FALSE,
+    used_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_password_resets_email_token ON public.password_resets(email, reset_token);
+CREATE INDEX IF NOT EXISTS idx_password_resets_expires ON public.password_resets(expires_at);
+
+ALTER TABLE public.password_resets ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policies
+        WHERE schemaname = 'public' AND tablename = 'password_resets'
+          AND policyname = 'Allow all operations on password_resets'
+    ) THEN
+        CREATE POLICY "Allow all operations on password_resets" ON public.password_resets
+        FOR ALL USING (true);
+    END IF;
+END $$;
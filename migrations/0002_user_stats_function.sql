@@ -0,0 +1,13 @@
+-- Statistiques utilisateur agrégées côté serveur (barre latérale "Vos statistiques")
+CREATE OR REPLACE FUNCTION public.get_user_stats(p_user_id UUID)
+RETURNS TABLE (conversations BIGINT, messages BIGINT, edits BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        (SELECT COUNT(*) FROM public.conversations c WHERE c.user_id = p_user_id),
+        (SELECT COUNT(*) FROM public.messages m
+            JOIN public.conversations c ON c.conversation_id = m.conversation_id
+            WHERE c.user_id = p_user_id),
+        (SELECT COUNT(*) FROM public.messages m
+            JOIN public.conversations c ON c.conversation_id = m.conversation_id
+            WHERE c.user_id = p_user_id AND m.edit_context IS NOT NULL);
+$$;
@@ -0,0 +1,14 @@
+-- Intégrité messages → conversations garantie par la base (add_message ne vérifie plus la conversation)
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'messages_conversation_id_fkey'
+    ) THEN
+        ALTER TABLE public.messages
+            ADD CONSTRAINT messages_conversation_id_fkey
+            FOREIGN KEY (conversation_id) REFERENCES public.conversations(conversation_id)
+            ON DELETE CASCADE NOT VALID;
+    END IF;
+END $$;
+
+ALTER TABLE public.messages VALIDATE CONSTRAINT messages_conversation_id_fkey;
@@ -0,0 +1,4 @@
+-- Images dans le blob store : référence de l'original et de la miniature (sha256:<hex>).
+-- image_data reste lisible pour les lignes pas encore migrées (migrate_images_to_blobs.py).
+ALTER TABLE public.messages ADD COLUMN IF NOT EXISTS image_ref TEXT;
+ALTER TABLE public.messages ADD COLUMN IF NOT EXISTS thumb_ref TEXT;
@@ -0,0 +1,31 @@
+-- created_at était écrit en texte ("YYYY-MM-DD HH:MM:SS") : tri et comparaisons
+-- lexicographiques, aucun fuseau. Conversion en timestamptz ; les valeurs sans
+-- fuseau sont interprétées en UTC. Chaque colonne n'est convertie qu'une fois.
+SET LOCAL TIME ZONE 'UTC';
+
+DO $$
+DECLARE
+    col RECORD;
+BEGIN
+    FOR col IN
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND (table_name, column_name) IN (
+              ('users', 'created_at'),
+              ('conversations', 'created_at'),
+              ('messages', 'created_at'),
+              ('password_resets', 'created_at'),
+              ('password_resets', 'used_at')
+          )
+          AND data_type IN ('text', 'character varying', 'timestamp without time zone')
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE public.%I ALTER COLUMN %I TYPE timestamptz USING NULLIF(%I::text, '''')::timestamptz',
+            col.table_name, col.column_name, col.column_name
+        );
+    END LOOP;
+END $$;
+
+ALTER TABLE public.conversations ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE public.messages ALTER COLUMN created_at SET DEFAULT now();
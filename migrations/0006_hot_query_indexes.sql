@@ -0,0 +1,16 @@
+-- Index des requêtes fréquentes (vérifiés par explain_hot_queries.py)
+
+-- Historique du chat : WHERE conversation_id = ? ORDER BY created_at DESC, id DESC LIMIT n
+-- (et pagination par clé (created_at, id) < (?, ?))
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created
+    ON public.messages (conversation_id, created_at, id);
+
+-- Liste des conversations de la barre latérale : WHERE user_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_conversations_user_created
+    ON public.conversations (user_id, created_at DESC);
+
+-- Connexion et réinitialisation de mot de passe : WHERE email = ?
+CREATE INDEX IF NOT EXISTS idx_users_email ON public.users (email);
+
+-- Statistiques admin : COUNT(*) WHERE type = 'text' | 'image'
+CREATE INDEX IF NOT EXISTS idx_messages_type ON public.messages (type);
@@ -0,0 +1,29 @@
+-- Intégrité conversations → users. Ajoutée seulement si les types concordent ;
+-- validée seulement s'il n'existe aucune conversation orpheline (sinon la
+-- contrainte reste NOT VALID : appliquée aux nouvelles lignes, à valider après nettoyage).
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'conversations_user_id_fkey') THEN
+        RETURN;
+    END IF;
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'conversations' AND column_name = 'user_id')
+       IS DISTINCT FROM
+       (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'users' AND column_name = 'id') THEN
+        RAISE NOTICE 'conversations.user_id et users.id de types différents : clé étrangère non ajoutée';
+        RETURN;
+    END IF;
+    ALTER TABLE public.conversations
+        ADD CONSTRAINT conversations_user_id_fkey
+        FOREIGN KEY (user_id) REFERENCES public.users(id)
+        ON DELETE CASCADE NOT VALID;
+    IF NOT EXISTS (
+        SELECT 1 FROM public.conversations c
+        WHERE NOT EXISTS (SELECT 1 FROM public.users u WHERE u.id = c.user_id)
+    ) THEN
+        ALTER TABLE public.conversations VALIDATE CONSTRAINT conversations_user_id_fkey;
+    ELSE
+        RAISE NOTICE 'conversations orphelines : conversations_user_id_fkey laissée NOT VALID';
+    END IF;
+END $$;
@@ -0,0 +1,16 @@
+-- Pages d'administration : nombre de messages des conversations affichées en une
+-- seule requête groupée (au lieu d'un COUNT par conversation), servie par
+-- idx_messages_conversation_created.
+CREATE OR REPLACE FUNCTION public.conversation_message_counts(p_conversation_ids UUID[])
+RETURNS TABLE (conversation_id UUID, messages BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT m.conversation_id, COUNT(*)
+    FROM public.messages m
+    WHERE m.conversation_id = ANY(p_conversation_ids)
+    GROUP BY m.conversation_id;
+$$;
+
+-- Tris par défaut des listes paginées (plus récents d'abord)
+CREATE INDEX IF NOT EXISTS idx_users_created ON public.users (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_created
+    ON public.conversations (created_at DESC, conversation_id DESC);
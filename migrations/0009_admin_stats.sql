@@ -0,0 +1,59 @@
+-- Statistiques de l'onglet admin : les sept compteurs en un seul aller-retour.
+-- p_estimated = TRUE lit les statistiques du planificateur (pg_class.reltuples,
+-- fréquences pg_stats des valeurs courantes) au lieu de compter : coût constant,
+-- précision celle du dernier ANALYZE. Repli sur le comptage exact si une table
+-- n'a jamais été analysée.
+
+CREATE OR REPLACE FUNCTION public.estimated_value_count(p_table TEXT, p_column TEXT, p_value TEXT)
+RETURNS BIGINT
+LANGUAGE sql STABLE AS $$
+    SELECT COALESCE((
+        SELECT (mcv.freq * GREATEST(c.reltuples, 0))::BIGINT
+        FROM pg_stats s
+        CROSS JOIN LATERAL unnest(s.most_common_vals::TEXT::TEXT[], s.most_common_freqs) AS mcv(val, freq)
+        JOIN pg_class c ON c.oid = format('public.%I', p_table)::regclass
+        WHERE s.schemaname = 'public' AND s.tablename = p_table AND s.attname = p_column
+          AND mcv.val = p_value
+    ), 0);
+$$;
+
+CREATE OR REPLACE FUNCTION public.get_admin_stats(p_estimated BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (
+    users BIGINT,
+    conversations BIGINT,
+    messages BIGINT,
+    admins BIGINT,
+    regular_users BIGINT,
+    text_messages BIGINT,
+    image_messages BIGINT,
+    estimated BOOLEAN
+)
+LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    IF p_estimated AND NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE oid IN ('public.users'::regclass, 'public.conversations'::regclass, 'public.messages'::regclass)
+          AND reltuples < 0
+    ) THEN
+        RETURN QUERY SELECT
+            (SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'public.users'::regclass),
+            (SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'public.conversations'::regclass),
+            (SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'public.messages'::regclass),
+            public.estimated_value_count('users', 'role', 'admin'),
+            public.estimated_value_count('users', 'role', 'user'),
+            public.estimated_value_count('messages', 'type', 'text'),
+            public.estimated_value_count('messages', 'type', 'image'),
+            TRUE;
+        RETURN;
+    END IF;
+    RETURN QUERY SELECT
+        (SELECT COUNT(*) FROM public.users),
+        (SELECT COUNT(*) FROM public.conversations),
+        (SELECT COUNT(*) FROM public.messages),
+        (SELECT COUNT(*) FROM public.users WHERE role = 'admin'),
+        (SELECT COUNT(*) FROM public.users WHERE role = 'user'),
+        (SELECT COUNT(*) FROM public.messages WHERE type = 'text'),
+        (SELECT COUNT(*) FROM public.messages WHERE type = 'image'),
+        FALSE;
+END;
+$$;
@@ -0,0 +1,96 @@
+-- Agrégats quotidiens pour les tendances de la page admin (jours UTC).
+-- refresh_daily_rollups() est incrémental par point de reprise : chaque appel ne
+-- recalcule que les jours depuis le dernier passage (moins une marge pour les
+-- lignes écrites en retard par la file d'écriture différée), jamais toute la table.
+-- Les jours sont recalculés entièrement, donc les utilisateurs actifs (COUNT DISTINCT) restent exacts.
+
+CREATE INDEX IF NOT EXISTS idx_messages_created ON public.messages (created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON public.conversations (created_at);
+
+CREATE TABLE IF NOT EXISTS public.daily_message_stats (
+    day DATE PRIMARY KEY,
+    messages BIGINT NOT NULL DEFAULT 0,
+    text_messages BIGINT NOT NULL DEFAULT 0,
+    image_messages BIGINT NOT NULL DEFAULT 0,
+    edits BIGINT NOT NULL DEFAULT 0,
+    active_users BIGINT NOT NULL DEFAULT 0,
+    new_conversations BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.rollup_watermarks (
+    name TEXT PRIMARY KEY,
+    processed_until TIMESTAMPTZ NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION public.refresh_daily_rollups(p_late_margin INTERVAL DEFAULT INTERVAL '10 minutes')
+RETURNS TABLE (days_refreshed INTEGER, processed_until TIMESTAMPTZ)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_watermark TIMESTAMPTZ;
+    v_from TIMESTAMPTZ;
+    v_to TIMESTAMPTZ := now();
+    v_days INTEGER;
+BEGIN
+    -- Un seul rafraîchissement à la fois
+    PERFORM pg_advisory_xact_lock(hashtext('refresh_daily_rollups'));
+    SELECT w.processed_until INTO v_watermark FROM public.rollup_watermarks w WHERE w.name = 'daily_message_stats';
+    IF v_watermark IS NULL THEN
+        SELECT MIN(created_at) INTO v_watermark FROM public.messages;
+    END IF;
+    v_from := date_trunc('day', COALESCE(v_watermark, v_to) - p_late_margin, 'UTC');
+
+    INSERT INTO public.daily_message_stats AS d
+        (day, messages, text_messages, image_messages, edits, active_users, new_conversations, updated_at)
+    SELECT
+        days.day,
+        COALESCE(m.messages, 0), COALESCE(m.text_messages, 0), COALESCE(m.image_messages, 0),
+        COALESCE(m.edits, 0), COALESCE(m.active_users, 0), COALESCE(c.new_conversations, 0),
+        now()
+    FROM (
+        SELECT (g AT TIME ZONE 'UTC')::DATE AS day
+        FROM generate_series(v_from, v_to, INTERVAL '1 day') AS g
+    ) days
+    LEFT JOIN (
+        SELECT
+            (m.created_at AT TIME ZONE 'UTC')::DATE AS day,
+            COUNT(*) AS messages,
+            COUNT(*) FILTER (WHERE m.type = 'text') AS text_messages,
+            COUNT(*) FILTER (WHERE m.type = 'image') AS image_messages,
+            COUNT(*) FILTER (WHERE m.edit_context IS NOT NULL) AS edits,
+            COUNT(DISTINCT c.user_id) FILTER (WHERE m.sender = 'user') AS active_users
+        FROM public.messages m
+        JOIN public.conversations c ON c.conversation_id = m.conversation_id
+        WHERE m.created_at >= v_from AND m.created_at < v_to
+        GROUP BY 1
+    ) m ON m.day = days.day
+    LEFT JOIN (
+        SELECT (created_at AT TIME ZONE 'UTC')::DATE AS day, COUNT(*) AS new_conversations
+        FROM public.conversations
+        WHERE created_at >= v_from AND created_at < v_to
+        GROUP BY 1
+    ) c ON c.day = days.day
+    ON CONFLICT (day) DO UPDATE SET
+        messages = EXCLUDED.messages,
+        text_messages = EXCLUDED.text_messages,
+        image_messages = EXCLUDED.image_messages,
+        edits = EXCLUDED.edits,
+        active_users = EXCLUDED.active_users,
+        new_conversations = EXCLUDED.new_conversations,
+        updated_at = EXCLUDED.updated_at;
+    GET DIAGNOSTICS v_days = ROW_COUNT;
+
+    INSERT INTO public.rollup_watermarks (name, processed_until) VALUES ('daily_message_stats', v_to)
+    ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until;
+
+    RETURN QUERY SELECT v_days, v_to;
+END;
+$$;
+
+-- Planification côté base si l'extension pg_cron est disponible (Supabase : Database → Extensions)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('refresh_daily_rollups', '*/5 * * * *', 'SELECT public.refresh_daily_rollups()');
+    END IF;
+END $$;
@@ -0,0 +1,57 @@
+-- Recherche plein texte dans messages.content.
+-- Configuration 'simple' (sans racinisation) : les contenus mêlent français,
+-- anglais (légendes BLIP) et autres langues ; une configuration de langue
+-- unique raterait les mots des autres. Colonne générée : toujours à jour, sans
+-- déclencheur ni modification de add_message. L'ajout réécrit la table une fois.
+ALTER TABLE public.messages
+    ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_messages_content_tsv ON public.messages USING GIN (content_tsv);
+
+-- Résultats classés par pertinence (ts_rank_cd), puis plus récents d'abord.
+-- p_user_id restreint aux conversations d'un utilisateur (NULL = tout, pour
+-- l'administration). Le classement porte sur au plus p_max_candidates
+-- correspondances lues via l'index GIN : un terme très fréquent ne force pas
+-- le classement de millions de lignes. Les extraits surlignés (ts_headline,
+-- coûteux) ne sont calculés que pour la page demandée.
+CREATE OR REPLACE FUNCTION public.search_messages(
+    p_query TEXT,
+    p_user_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0,
+    p_max_candidates INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    sender TEXT,
+    type TEXT,
+    created_at TIMESTAMPTZ,
+    rank REAL,
+    snippet TEXT
+)
+LANGUAGE sql STABLE AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('simple', p_query) AS tsq
+    ),
+    candidates AS (
+        SELECT m.id, m.conversation_id, m.sender, m.type, m.created_at, m.content,
+               ts_rank_cd(m.content_tsv, q.tsq) AS rank
+        FROM public.messages m, q
+        WHERE m.content_tsv @@ q.tsq
+          AND (p_user_id IS NULL OR m.conversation_id IN (
+                SELECT c.conversation_id FROM public.conversations c WHERE c.user_id = p_user_id))
+        LIMIT p_max_candidates
+    ),
+    page AS (
+        SELECT * FROM candidates
+        ORDER BY rank DESC, created_at DESC, id
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT p.id, p.conversation_id, p.sender, p.type, p.created_at, p.rank,
+           ts_headline('simple', coalesce(p.content, ''), q.tsq,
+                       'StartSel=**, StopSel=**, MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "')
+    FROM page p, q
+    ORDER BY p.rank DESC, p.created_at DESC, p.id;
+$$;
@@ -0,0 +1,104 @@
+-- Rétention (retention_worker.py) : archivage des vieilles conversations,
+-- compactage des images anciennes, purge des jetons de réinitialisation expirés.
+
+-- Conversations archivées : une archive JSON Lines gzip par conversation dans
+-- le magasin froid (ARCHIVE_STORE), référencée ici pour la restauration.
+-- blob_refs : images encore référencées par l'archive, à ne pas supprimer.
+CREATE TABLE IF NOT EXISTS public.conversation_archives (
+    conversation_id UUID PRIMARY KEY,
+    user_id TEXT,
+    description TEXT,
+    created_at TIMESTAMPTZ,
+    last_message_at TIMESTAMPTZ,
+    message_count INTEGER NOT NULL,
+    archive_ref TEXT NOT NULL,
+    archive_bytes BIGINT NOT NULL,
+    blob_refs TEXT[] NOT NULL DEFAULT '{}',
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_conversation_archives_user ON public.conversation_archives (user_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_archives_blob_refs
+    ON public.conversation_archives USING GIN (blob_refs);
+
+-- Palier appliqué à l'image d'un message : NULL (original), 'downsampled',
+-- 'thumbnail' (original supprimé), 'invalid' (illisible, ignoré ensuite)
+ALTER TABLE public.messages ADD COLUMN IF NOT EXISTS image_tier TEXT;
+
+-- Candidats au compactage, du plus ancien au plus récent : l'index partiel ne
+-- contient que les images pas encore traitées et rétrécit à chaque lot.
+CREATE INDEX IF NOT EXISTS idx_messages_image_retention
+    ON public.messages (created_at, id)
+    WHERE image_tier IS NULL AND (image_ref IS NOT NULL OR image_data IS NOT NULL);
+
+-- Blobs partagés (adressage par contenu) : vérification des références avant suppression
+CREATE INDEX IF NOT EXISTS idx_messages_image_ref ON public.messages (image_ref) WHERE image_ref IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_messages_thumb_ref ON public.messages (thumb_ref) WHERE thumb_ref IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.blob_ref_in_use(p_ref TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE AS $$
+    SELECT EXISTS (SELECT 1 FROM public.messages WHERE image_ref = p_ref)
+        OR EXISTS (SELECT 1 FROM public.messages WHERE thumb_ref = p_ref)
+        OR EXISTS (SELECT 1 FROM public.conversation_archives WHERE blob_refs @> ARRAY[p_ref]);
+$$;
+
+-- Conversations sans activité depuis p_before, les plus anciennes d'abord.
+-- Dernier message lu par idx_messages_conversation_created (une descente d'index).
+CREATE OR REPLACE FUNCTION public.retention_archivable_conversations(p_before TIMESTAMPTZ, p_limit INTEGER)
+RETURNS TABLE (conversation_id UUID, last_message_at TIMESTAMPTZ)
+LANGUAGE sql STABLE AS $$
+    SELECT c.conversation_id, lm.last_message_at
+    FROM public.conversations c
+    LEFT JOIN LATERAL (
+        SELECT m.created_at AS last_message_at
+        FROM public.messages m
+        WHERE m.conversation_id = c.conversation_id
+        ORDER BY m.created_at DESC
+        LIMIT 1
+    ) lm ON true
+    WHERE c.created_at < p_before
+      AND (lm.last_message_at IS NULL OR lm.last_message_at < p_before)
+    ORDER BY c.created_at
+    LIMIT p_limit;
+$$;
+
+-- Suppression d'une conversation archivée, en une transaction : seulement les
+-- messages couverts par l'archive ; la conversation n'est supprimée que si
+-- aucun message plus récent n'est arrivé entre-temps.
+CREATE OR REPLACE FUNCTION public.retention_drop_conversation(p_conversation_id UUID, p_until TIMESTAMPTZ)
+RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    deleted BIGINT;
+BEGIN
+    DELETE FROM public.messages m
+    WHERE m.conversation_id = p_conversation_id
+      AND (p_until IS NULL OR m.created_at <= p_until);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    DELETE FROM public.conversations c
+    WHERE c.conversation_id = p_conversation_id
+      AND NOT EXISTS (SELECT 1 FROM public.messages m WHERE m.conversation_id = p_conversation_id);
+    RETURN deleted;
+END;
+$$;
+
+-- Jetons expirés (expires_at en secondes epoch), par lots via idx_password_resets_expires ;
+-- SKIP LOCKED : ne bloque pas une réinitialisation en cours.
+CREATE OR REPLACE FUNCTION public.purge_expired_password_resets(p_limit INTEGER DEFAULT 1000)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM public.password_resets
+    WHERE id IN (
+        SELECT id FROM public.password_resets
+        WHERE expires_at < extract(epoch FROM now())
+        ORDER BY expires_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$;
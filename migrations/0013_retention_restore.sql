@@ -0,0 +1,44 @@
+-- Rétention : une conversation restaurée (retention_worker.py --restore) repart
+-- pour un délai complet avant de pouvoir être réarchivée.
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS restored_at TIMESTAMPTZ;
+
+CREATE OR REPLACE FUNCTION public.retention_archivable_conversations(p_before TIMESTAMPTZ, p_limit INTEGER)
+RETURNS TABLE (conversation_id UUID, last_message_at TIMESTAMPTZ)
+LANGUAGE sql STABLE AS $$
+    SELECT c.conversation_id, lm.last_message_at
+    FROM public.conversations c
+    LEFT JOIN LATERAL (
+        SELECT m.created_at AS last_message_at
+        FROM public.messages m
+        WHERE m.conversation_id = c.conversation_id
+        ORDER BY m.created_at DESC
+        LIMIT 1
+    ) lm ON true
+    WHERE c.created_at < p_before
+      AND (c.restored_at IS NULL OR c.restored_at < p_before)
+      AND (lm.last_message_at IS NULL OR lm.last_message_at < p_before)
+    ORDER BY c.created_at
+    LIMIT p_limit;
+$$;
+
+-- p_until = created_at du dernier message de l'archive. NULL (archive sans
+-- message) : aucun message n'est supprimé ; un message arrivé après la lecture
+-- de l'archive n'est jamais perdu, il garde la conversation en base.
+CREATE OR REPLACE FUNCTION public.retention_drop_conversation(p_conversation_id UUID, p_until TIMESTAMPTZ)
+RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    deleted BIGINT := 0;
+BEGIN
+    IF p_until IS NOT NULL THEN
+        DELETE FROM public.messages m
+        WHERE m.conversation_id = p_conversation_id
+          AND m.created_at <= p_until;
+        GET DIAGNOSTICS deleted = ROW_COUNT;
+    END IF;
+    DELETE FROM public.conversations c
+    WHERE c.conversation_id = p_conversation_id
+      AND NOT EXISTS (SELECT 1 FROM public.messages m WHERE m.conversation_id = p_conversation_id);
+    RETURN deleted;
+END;
+$$;
@@ -0,0 +1,66 @@
+-- search_messages (0011) : le LIMIT des candidats n'avait pas d'ORDER BY, un
+-- terme très fréquent classait un sous-ensemble arbitraire des correspondances.
+-- Les candidats sont désormais les p_max_candidates correspondances les plus
+-- récentes, et la colonne capped signale à l'interface que la limite a été
+-- atteinte (résultats plus anciens non classés : préciser la recherche).
+-- Extraits : termes encadrés par U+E000 / U+E001 (search_snippets.py) au lieu
+-- de ** , pour que l'interface puisse échapper le contenu des messages.
+-- Le type de retour change : CREATE OR REPLACE ne suffit pas.
+DROP FUNCTION IF EXISTS public.search_messages(TEXT, UUID, INTEGER, INTEGER, INTEGER);
+
+CREATE FUNCTION public.search_messages(
+    p_query TEXT,
+    p_user_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0,
+    p_max_candidates INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    sender TEXT,
+    type TEXT,
+    created_at TIMESTAMPTZ,
+    rank REAL,
+    snippet TEXT,
+    capped BOOLEAN
+)
+LANGUAGE sql STABLE AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('simple', p_query) AS tsq
+    ),
+    -- Une ligne de plus que la limite : sa présence indique que la limite est atteinte
+    matches AS (
+        SELECT m.id, m.conversation_id, m.sender, m.type, m.created_at, m.content, m.content_tsv
+        FROM public.messages m, q
+        WHERE m.content_tsv @@ q.tsq
+          AND (p_user_id IS NULL OR m.conversation_id IN (
+                SELECT c.conversation_id FROM public.conversations c WHERE c.user_id = p_user_id))
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT p_max_candidates + 1
+    ),
+    cap AS (
+        SELECT count(*) > p_max_candidates AS capped FROM matches
+    ),
+    candidates AS (
+        SELECT r.id, r.conversation_id, r.sender, r.type, r.created_at, r.content,
+               ts_rank_cd(r.content_tsv, q.tsq) AS rank
+        FROM (
+            SELECT * FROM matches
+            ORDER BY created_at DESC, id DESC
+            LIMIT p_max_candidates
+        ) r, q
+    ),
+    page AS (
+        SELECT * FROM candidates
+        ORDER BY rank DESC, created_at DESC, id
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT p.id, p.conversation_id, p.sender, p.type, p.created_at, p.rank,
+           ts_headline('simple', coalesce(p.content, ''), q.tsq,
+                       'StartSel=' || chr(57344) || ', StopSel=' || chr(57345)
+                       || ', MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'),
+           cap.capped
+    FROM page p, q, cap
+    ORDER BY p.rank DESC, p.created_at DESC, p.id;
+$$;
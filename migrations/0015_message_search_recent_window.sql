@@ -0,0 +1,88 @@
+-- search_messages (0014) triait par date toutes les correspondances GIN avant
+-- d'appliquer la limite : pour un terme courant, toutes les lignes de
+-- l'utilisateur étaient lues puis triées. Les correspondances sont désormais
+-- cherchées dans une fenêtre récente qui s'élargit (7 jours, 30 jours, 1 an,
+-- tout l'historique) : on s'arrête à la première fenêtre qui dépasse
+-- p_max_candidates. Le filtre created_at >= v_since permet au planificateur de
+-- combiner idx_messages_content_tsv et idx_messages_created (BitmapAnd) : seules
+-- les correspondances de la fenêtre sont lues dans la table et triées. Un terme
+-- rare parcourt toutes les fenêtres, mais ses correspondances sont peu nombreuses.
+CREATE OR REPLACE FUNCTION public.search_messages(
+    p_query TEXT,
+    p_user_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0,
+    p_max_candidates INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    id UUID,
+    conversation_id UUID,
+    sender TEXT,
+    type TEXT,
+    created_at TIMESTAMPTZ,
+    rank REAL,
+    snippet TEXT,
+    capped BOOLEAN
+)
+LANGUAGE plpgsql STABLE AS $$
+#variable_conflict use_column
+DECLARE
+    v_tsq TSQUERY := websearch_to_tsquery('simple', p_query);
+    v_window INTERVAL;
+    v_since TIMESTAMPTZ := '-infinity';
+    v_found INTEGER;
+BEGIN
+    FOREACH v_window IN ARRAY ARRAY['7 days', '30 days', '365 days']::INTERVAL[] LOOP
+        -- Comptage borné, sans tri : s'arrête à p_max_candidates + 1 correspondances
+        SELECT count(*) INTO v_found
+        FROM (
+            SELECT 1 FROM public.messages m
+            WHERE m.content_tsv @@ v_tsq
+              AND m.created_at >= now() - v_window
+              AND (p_user_id IS NULL OR m.conversation_id IN (
+                    SELECT c.conversation_id FROM public.conversations c WHERE c.user_id = p_user_id))
+            LIMIT p_max_candidates + 1
+        ) probe;
+        IF v_found > p_max_candidates THEN
+            v_since := now() - v_window;
+            EXIT;
+        END IF;
+    END LOOP;
+
+    RETURN QUERY
+    WITH matches AS (
+        SELECT m.id, m.conversation_id, m.sender, m.type, m.created_at, m.content, m.content_tsv
+        FROM public.messages m
+        WHERE m.content_tsv @@ v_tsq
+          AND m.created_at >= v_since
+          AND (p_user_id IS NULL OR m.conversation_id IN (
+                SELECT c.conversation_id FROM public.conversations c WHERE c.user_id = p_user_id))
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT p_max_candidates + 1
+    ),
+    cap AS (
+        SELECT count(*) > p_max_candidates AS capped FROM matches
+    ),
+    candidates AS (
+        SELECT r.id, r.conversation_id, r.sender, r.type, r.created_at, r.content,
+               ts_rank_cd(r.content_tsv, v_tsq) AS rank
+        FROM (
+            SELECT mt.* FROM matches mt
+            ORDER BY mt.created_at DESC, mt.id DESC
+            LIMIT p_max_candidates
+        ) r
+    ),
+    page AS (
+        SELECT cd.* FROM candidates cd
+        ORDER BY cd.rank DESC, cd.created_at DESC, cd.id
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT p.id, p.conversation_id, p.sender, p.type, p.created_at, p.rank,
+           ts_headline('simple', coalesce(p.content, ''), v_tsq,
+                       'StartSel=' || chr(57344) || ', StopSel=' || chr(57345)
+                       || ', MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'),
+           cap.capped
+    FROM page p, cap
+    ORDER BY p.rank DESC, p.created_at DESC, p.id;
+END;
+$$;
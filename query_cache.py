@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# -------------------------
+# Cache TTL des requêtes des pages d'administration
+# -------------------------
+# Chaque clic Streamlit réexécute tout le script, onglets compris : sans cache,
+# chaque changement d'onglet ou de page relit utilisateurs, conversations et
+# messages. Le cache est partagé par toutes les sessions du processus
+# (st.cache_resource). Clé = (espace de noms, paramètres de la requête et de
+# pagination) ; l'espace de noms permet d'invalider d'un coup tout ce qui
+# dépend d'une table après une écriture. Chaque entrée garde l'heure de sa
+# lecture pour afficher « données au ... ».
+
+
+class QueryCache:
+    def __init__(self, ttl=60, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # clé -> (expire_à monotone, lue_le UTC, valeur)
+        self._entries = OrderedDict()
+        # Un verrou par clé : des sessions simultanées ne relancent pas la même requête
+        self._loading = {}
+        # Incrémenté à chaque invalidation : une lecture commencée avant n'est pas mise en cache
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def fetch(self, namespace, params, loader, refresh=False):
+        """Retourne (valeur, lue_le) ; appelle loader() si la clé est absente, expirée ou refresh=True"""
+        key = (namespace, params)
+        if not refresh:
+            entry = self._get(key)
+            if entry is not None:
+                return entry
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            if not refresh:
+                # Une autre session a pu charger la clé pendant l'attente
+                entry = self._get(key, count=False)
+                if entry is not None:
+                    return entry
+            with self._lock:
+                self._stats["misses"] += 1
+                generation = self._generation
+            try:
+                value = loader()
+                fetched_at = datetime.now(timezone.utc)
+                with self._lock:
+                    if generation != self._generation:
+                        return value, fetched_at
+                    self._entries[key] = (time.monotonic() + self.ttl, fetched_at, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return value, fetched_at
+
+    def invalidate(self, *namespaces, where=None):
+        """Supprime les entrées des espaces de noms donnés (toutes si aucun) ; where(params)
+        restreint aux entrées dont les paramètres correspondent"""
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key for key in self._entries
+                if (not namespaces or key[0] in namespaces) and (where is None or where(key[1]))
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+            return len(stale)
+
+    def update(self, namespace, transform):
+        """Applique transform(params, valeur) -> valeur aux entrées d'un espace de noms, sans relire la base
+        (mise à jour optimiste après une écriture dont on connaît le résultat)"""
+        with self._lock:
+            self._generation += 1
+            updated = 0
+            for key, (expires_at, fetched_at, value) in list(self._entries.items()):
+                if key[0] == namespace:
+                    self._entries[key] = (expires_at, fetched_at, transform(key[1], value))
+                    updated += 1
+            return updated
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                ttl=self.ttl,
+                hit_ratio=self._stats["hits"] / lookups if lookups else 0.0,
+            )
+
+    def _get(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, fetched_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self._stats["hits"] += 1
+            return value, fetched_at
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# -------------------------
+# Registre des quotas Google CSE / YouTube Data API
+# -------------------------
+# Les quotas Google sont remis à zéro à minuit, heure du Pacifique. Les compteurs
+# sont persistés dans un fichier JSON pour survivre aux redémarrages.
+
+logger = logging.getLogger("vision_ai.quota_ledger")
+
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Coût en unités de quota de chaque appel, et pool de quota auquel il est imputé
+ENDPOINT_COSTS = {
+    "google_cse": ("google_cse", 1),
+    "youtube_search": ("youtube", 100),
+    "youtube_videos": ("youtube", 1),
+    "youtube_comments": ("youtube", 1),
+}
+
+DEFAULT_DAILY_LIMITS = {
+    "google_cse": 100,
+    "youtube": 10000,
+}
+
+# Raisons d'erreur Google (error.errors[].reason) qui signalent un quota épuisé.
+# Les autres 403 (keyInvalid, accessNotConfigured, commentsDisabled, forbidden…)
+# concernent la clé ou la ressource et ne doivent pas couper le pool.
+QUOTA_ERROR_REASONS = {"quotaExceeded", "dailyLimitExceeded", "rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def quota_error_reasons(response):
+    """Raisons listées dans le corps d'erreur JSON d'une API Google (vide si illisible)"""
+    try:
+        errors = response.json().get("error", {}).get("errors", [])
+        return {e.get("reason") for e in errors if isinstance(e, dict) and e.get("reason")}
+    except (ValueError, AttributeError):
+        return set()
+
+
+def is_quota_exhausted(response):
+    """Vrai si la réponse signale un quota épuisé : 429, ou 403 avec une raison de quota"""
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and bool(quota_error_reasons(response) & QUOTA_ERROR_REASONS)
+
+
+def _hours_between(start, end):
+    # Différence en temps absolu : entre deux datetimes de même tzinfo, Python
+    # soustrait les heures murales et se trompe d'une heure les jours de changement d'heure
+    return (end.astimezone(timezone.utc) - start.astimezone(timezone.utc)).total_seconds() / 3600
+
+
+class QuotaLedger:
+    def __init__(self, path, daily_limits=None, low_water=0.1):
+        self.path = path
+        self.daily_limits = dict(DEFAULT_DAILY_LIMITS, **(daily_limits or {}))
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    # -------------------------
+    # API publique
+    # -------------------------
+    def can_afford(self, endpoint, calls=1):
+        """Indique si l'appel doit partir vers l'API payante ou être routé vers le fournisseur gratuit"""
+        pool, cost = ENDPOINT_COSTS[endpoint]
+        with self._lock:
+            self._roll_day_locked()
+            usage = self._state["pools"][pool]
+            if usage["exhausted"]:
+                return False
+            remaining = self.daily_limits[pool] - usage["used"]
+            needed = cost * calls
+            if remaining < needed:
+                return False
+            # Sous la réserve basse, seules les requêtes sans épuisement prévu avant la remise à zéro passent
+            if remaining - needed < self.daily_limits[pool] * self.low_water:
+                return not self._exhaustion_predicted_locked(pool)
+            return True
+
+    def record(self, endpoint, calls=1):
+        pool, cost = ENDPOINT_COSTS[endpoint]
+        with self._lock:
+            self._roll_day_locked()
+            self._state["pools"][pool]["used"] += cost * calls
+            self._state["endpoints"][endpoint] = self._state["endpoints"].get(endpoint, 0) + calls
+            self._save_locked()
+
+    def mark_exhausted(self, endpoint):
+        """À appeler quand l'API répond 429 ou 403 quota (voir is_quota_exhausted) : plus d'appels jusqu'à la remise à zéro"""
+        pool, _ = ENDPOINT_COSTS[endpoint]
+        with self._lock:
+            self._roll_day_locked()
+            self._state["pools"][pool]["exhausted"] = True
+            self._save_locked()
+
+    def snapshot(self):
+        """État par pool pour l'onglet Statistiques de l'admin"""
+        with self._lock:
+            self._roll_day_locked()
+            now = datetime.now(QUOTA_TIMEZONE)
+            pools = {}
+            for pool, limit in self.daily_limits.items():
+                usage = self._state["pools"][pool]
+                rate = self._rate_per_hour_locked(pool, now)
+                remaining = 0 if usage["exhausted"] else max(0, limit - usage["used"])
+                exhaustion_at = None
+                if rate > 0 and remaining > 0:
+                    exhaustion_at = (now.astimezone(timezone.utc) + timedelta(hours=remaining / rate)).astimezone(QUOTA_TIMEZONE)
+                pools[pool] = {
+                    "limit": limit,
+                    "used": usage["used"],
+                    "remaining": remaining,
+                    "exhausted": usage["exhausted"],
+                    "rate_per_hour": rate,
+                    "predicted_exhaustion": exhaustion_at if exhaustion_at and _hours_between(exhaustion_at, self._next_reset(now)) > 0 else None,
+                }
+            return {
+                "day": self._state["day"],
+                "resets_at": self._next_reset(now),
+                "pools": pools,
+                "endpoints": dict(self._state["endpoints"]),
+            }
+
+    # -------------------------
+    # Interne
+    # -------------------------
+    def _today(self):
+        return datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+    def _start_of_day(self, now):
+        return datetime.combine(now.astimezone(QUOTA_TIMEZONE).date(), time.min, tzinfo=QUOTA_TIMEZONE)
+
+    def _next_reset(self, now):
+        # Minuit du jour suivant, heure du Pacifique : reconstruit depuis la date
+        # locale, le décalage (PST/PDT) est celui de ce minuit-là
+        next_day = now.astimezone(QUOTA_TIMEZONE).date() + timedelta(days=1)
+        return datetime.combine(next_day, time.min, tzinfo=QUOTA_TIMEZONE)
+
+    def _empty_state(self):
+        return {
+            "day": self._today(),
+            "pools": {pool: {"used": 0, "exhausted": False} for pool in self.daily_limits},
+            "endpoints": {},
+        }
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("day") != self._today():
+                return self._empty_state()
+            for pool in self.daily_limits:
+                state["pools"].setdefault(pool, {"used": 0, "exhausted": False})
+            state.setdefault("endpoints", {})
+            return state
+        except (OSError, ValueError, KeyError, AttributeError):
+            return self._empty_state()
+
+    def _save_locked(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("QuotaLedger: sauvegarde impossible (%s): %s", self.path, e)
+
+    def _roll_day_locked(self):
+        if self._state["day"] != self._today():
+            self._state = self._empty_state()
+            self._save_locked()
+
+    def _rate_per_hour_locked(self, pool, now):
+        elapsed_hours = max(_hours_between(self._start_of_day(now), now), 0.25)
+        return self._state["pools"][pool]["used"] / elapsed_hours
+
+    def _exhaustion_predicted_locked(self, pool):
+        now = datetime.now(QUOTA_TIMEZONE)
+        rate = self._rate_per_hour_locked(pool, now)
+        remaining = self.daily_limits[pool] - self._state["pools"][pool]["used"]
+        hours_left = _hours_between(now, self._next_reset(now))
+        return rate * hours_left >= remaining
@@ -0,0 +1,45 @@
+"""Rafraîchit les agrégats quotidiens (daily_message_stats) hors de l'application.
+
+À lancer périodiquement (cron, tâche planifiée) quand pg_cron n'est pas disponible ;
+chaque passage ne recalcule que les jours depuis le dernier point de reprise.
+
+Usage:
+    python refresh_rollups.py
+    python refresh_rollups.py --interval 300
+    python refresh_rollups.py --backend postgres
+"""
+import argparse
+import os
+import time
+
+from repository import create_repository
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=float, default=0, help="secondes entre deux passages (0 = un seul)")
+    parser.add_argument("--backend", choices=["supabase", "postgres"], default=None)
+    args = parser.parse_args()
+
+    supabase = None
+    if (args.backend or os.environ.get("DB_BACKEND", "supabase")) == "supabase":
+        from supabase import create_client
+        supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    repository = create_repository(supabase, kind=args.backend)
+    try:
+        while True:
+            started = time.monotonic()
+            result = repository.refresh_daily_rollups()
+            print(
+                f"✅ {result.get('days_refreshed', 0)} jour(s) recalculé(s) jusqu'à {result.get('processed_until')} "
+                f"en {time.monotonic() - started:.2f}s"
+            )
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    finally:
+        repository.close()
+
+
+if __name__ == "__main__":
+    main()
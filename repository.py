@@ -0,0 +1,654 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+# -------------------------
+# Accès aux données : users / conversations / messages
+# -------------------------
+# Deux backends derrière la même interface :
+#   - SupabaseRepository : client supabase-py (HTTP + PostgREST), backend historique
+#   - PostgresRepository : connexion directe psycopg2, pool de connexions et
+#     requêtes préparées (PREPARE/EXECUTE) une fois par connexion
+# Sélection par DB_BACKEND=supabase|postgres ; le backend postgres lit
+# DB_HOST/DB_NAME/DB_USER/DB_PASSWORD/DB_PORT (.env) et DB_POOL_MIN/DB_POOL_MAX.
+# Les lignes retournées ont la même forme que les réponses PostgREST (dict,
+# dates en ISO 8601) pour que l'application ne dépende pas du backend.
+
+# Sans image_data : le base64 des lignes pas encore migrées pèse des centaines de Ko
+# par ligne ; il n'est lu qu'à l'affichage, par get_message_image_data
+MESSAGE_HISTORY_COLUMNS = ("id", "sender", "content", "created_at", "type", "image_ref", "thumb_ref",
+                           "edit_context")
+MESSAGE_INSERT_COLUMNS = ("id", "conversation_id", "sender", "content", "type", "created_at", "image_ref",
+                          "thumb_ref", "edit_context")
+CONVERSATION_COLUMNS = ("conversation_id", "user_id", "description", "created_at")
+# Pages d'administration : jamais de mot de passe ni de jeton
+ADMIN_USER_COLUMNS = ("id", "email", "name", "role", "created_at")
+USER_SORT_COLUMNS = ("created_at", "email", "name", "role")
+CONVERSATION_SORT_COLUMNS = ("created_at", "description")
+ADMIN_STATS_FIELDS = ("users", "conversations", "messages", "admins", "regular_users", "text_messages",
+                      "image_messages")
+# Filtres in.(…) PostgREST : les ids passent dans l'URL du GET ; par paquets de
+# 100 UUID (~4 Ko encodés), sous les limites d'URL des proxys
+IN_FILTER_CHUNK = int(os.environ.get("DB_IN_FILTER_CHUNK", "100"))
+# Recherche plein texte : nombre de correspondances (les plus récentes) classées par requête
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", "10000"))
+
+
+logger = logging.getLogger("vision_ai.repository")
+_warned = set()
+
+
+def _warn_once(key, message, *args):
+    """Avertissement journalisé une seule fois par processus (les replis reviennent à chaque rerun)"""
+    if key not in _warned:
+        _warned.add(key)
+        logger.warning(message, *args)
+
+
+def _sort_column(sort, allowed):
+    if sort not in allowed:
+        raise ValueError(f"Tri non autorisé: {sort!r}")
+    return sort
+
+
+def _search_term(search):
+    """Terme de recherche sans les caractères réservés de la syntaxe de filtres PostgREST"""
+    return "".join(ch for ch in (search or "").strip() if ch not in ',()*%"\\')
+
+
+class Repository(ABC):
+    name = "base"
+
+    # Utilisateurs
+    @abstractmethod
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_user(self, row):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        raise NotImplementedError
+
+    # Conversations
+    @abstractmethod
+    def list_conversations(self, user_id):
+        """Conversations de l'utilisateur, plus récentes d'abord"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_conversation(self, row):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_conversation_description(self, conversation_id, description):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_conversation(self, conversation_id):
+        raise NotImplementedError
+
+    # Messages
+    @abstractmethod
+    def get_messages_page(self, conversation_id, limit, before=None):
+        """Jusqu'à limit lignes antérieures au curseur before=(created_at, id), de la plus récente à la plus ancienne"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_message_image_data(self, message_id):
+        """Image base64 d'une ligne pas encore migrée vers le blob store (None sinon)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_messages(self, rows):
+        """Insertion multi-lignes idempotente sur l'id généré côté client"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_stats(self, user_id, conversation_ids=None):
+        raise NotImplementedError
+
+    # Administration
+    @abstractmethod
+    def list_users_page(self, search=None, role=None, sort="created_at", descending=True, offset=0, limit=25):
+        """Page d'utilisateurs filtrée et triée côté serveur ; retourne (lignes, has_more)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_all_conversations_page(self, search=None, user_id=None, sort="created_at", descending=True,
+                                    offset=0, limit=25):
+        """Page de conversations de tous les utilisateurs ; retourne (lignes, has_more)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_messages_by_conversation(self, conversation_ids):
+        """Nombre de messages par conversation en une seule requête groupée"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_messages(self, query, user_id=None, offset=0, limit=20):
+        """Recherche plein texte classée dans le contenu des messages, avec extraits surlignés
+        (marqueurs de search_snippets) ; user_id restreint à ses conversations. Chaque ligne porte
+        capped : plus de SEARCH_MAX_CANDIDATES correspondances, seules les plus récentes sont
+        classées. Retourne (lignes, has_more)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user_role(self, user_id, role):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_users_role(self, user_ids, role):
+        """Attribue le même rôle à plusieurs utilisateurs en une seule écriture ; retourne les ids modifiés"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_admin_stats(self, estimated=False):
+        """Les sept compteurs de l'onglet Statistiques, plus "estimated" si issus du planificateur"""
+        raise NotImplementedError
+
+    # Agrégats quotidiens
+    @abstractmethod
+    def refresh_daily_rollups(self):
+        """Met à jour daily_message_stats depuis le dernier point de reprise ; retourne {days_refreshed, processed_until}"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_daily_rollups(self, since_day):
+        """Lignes de daily_message_stats à partir de since_day (date ISO), par jour croissant"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SupabaseRepository(Repository):
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_user_by_email(self, email):
+        response = self.client.table("users").select("*").eq("email", email).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def create_user(self, row):
+        response = self.client.table("users").insert(row).execute()
+        return response.data[0] if response.data else None
+
+    def delete_user(self, user_id):
+        self.client.table("users").delete().eq("id", user_id).execute()
+
+    def list_conversations(self, user_id):
+        response = (
+            self.client.table("conversations")
+            .select(", ".join(CONVERSATION_COLUMNS))
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .execute()
+        )
+        return response.data or []
+
+    def create_conversation(self, row):
+        response = self.client.table("conversations").insert(row).execute()
+        return response.data[0] if response.data else None
+
+    def update_conversation_description(self, conversation_id, description):
+        response = (
+            self.client.table("conversations")
+            .update({"description": description})
+            .eq("conversation_id", conversation_id)
+            .execute()
+        )
+        return bool(response.data)
+
+    def delete_conversation(self, conversation_id):
+        self.client.table("conversations").delete().eq("conversation_id", conversation_id).execute()
+
+    def get_messages_page(self, conversation_id, limit, before=None):
+        query = (
+            self.client.table("messages")
+            .select(", ".join(MESSAGE_HISTORY_COLUMNS))
+            .eq("conversation_id", conversation_id)
+        )
+        if before:
+            created_at, message_id = before
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id})'
+            )
+        response = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+        return response.data or []
+
+    def get_message_image_data(self, message_id):
+        response = self.client.table("messages").select("image_data").eq("id", message_id).limit(1).execute()
+        return response.data[0].get("image_data") if response.data else None
+
+    def insert_messages(self, rows):
+        self.client.table("messages").upsert(list(rows), on_conflict="id", ignore_duplicates=True).execute()
+
+    def get_user_stats(self, user_id, conversation_ids=None):
+        stats = {"conversations": 0, "messages": 0, "edits": 0}
+        try:
+            response = self.client.rpc("get_user_stats", {"p_user_id": user_id}).execute()
+            if response.data:
+                row = response.data[0]
+                return {k: int(row.get(k) or 0) for k in stats}
+        except Exception as e:
+            _warn_once("get_user_stats", "get_user_stats: RPC indisponible, repli sur COUNT (%s)", e)
+        if conversation_ids is None:
+            conversation_ids = [c["conversation_id"] for c in self.list_conversations(user_id)]
+        conversation_ids = list(conversation_ids)
+        stats["conversations"] = len(conversation_ids)
+        for start in range(0, len(conversation_ids), IN_FILTER_CHUNK):
+            chunk = conversation_ids[start:start + IN_FILTER_CHUNK]
+            messages = (
+                self.client.table("messages").select("id", count="exact", head=True)
+                .in_("conversation_id", chunk).execute()
+            )
+            edits = (
+                self.client.table("messages").select("id", count="exact", head=True)
+                .in_("conversation_id", chunk).not_.is_("edit_context", "null").execute()
+            )
+            stats["messages"] += messages.count or 0
+            stats["edits"] += edits.count or 0
+        return stats
+
+    def list_users_page(self, search=None, role=None, sort="created_at", descending=True, offset=0, limit=25):
+        query = self.client.table("users").select(", ".join(ADMIN_USER_COLUMNS))
+        term = _search_term(search)
+        if term:
+            query = query.or_(f"email.ilike.*{term}*,name.ilike.*{term}*")
+        if role:
+            query = query.eq("role", role)
+        rows = (
+            query.order(_sort_column(sort, USER_SORT_COLUMNS), desc=descending)
+            .order("id", desc=descending)
+            .range(offset, offset + limit)
+            .execute().data or []
+        )
+        return rows[:limit], len(rows) > limit
+
+    def list_all_conversations_page(self, search=None, user_id=None, sort="created_at", descending=True,
+                                    offset=0, limit=25):
+        query = self.client.table("conversations").select(", ".join(CONVERSATION_COLUMNS))
+        term = _search_term(search)
+        if term:
+            query = query.ilike("description", f"%{term}%")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        rows = (
+            query.order(_sort_column(sort, CONVERSATION_SORT_COLUMNS), desc=descending)
+            .order("conversation_id", desc=descending)
+            .range(offset, offset + limit)
+            .execute().data or []
+        )
+        return rows[:limit], len(rows) > limit
+
+    def count_messages_by_conversation(self, conversation_ids):
+        conversation_ids = list(conversation_ids)
+        if not conversation_ids:
+            return {}
+        response = self.client.rpc("conversation_message_counts", {"p_conversation_ids": conversation_ids}).execute()
+        counts = {c: 0 for c in conversation_ids}
+        counts.update({row["conversation_id"]: int(row["messages"]) for row in response.data or []})
+        return counts
+
+    def search_messages(self, query, user_id=None, offset=0, limit=20):
+        if not (query or "").strip():
+            return [], False
+        rows = self.client.rpc("search_messages", {
+            "p_query": query,
+            "p_user_id": user_id,
+            "p_limit": limit + 1,
+            "p_offset": offset,
+            "p_max_candidates": SEARCH_MAX_CANDIDATES,
+        }).execute().data or []
+        return rows[:limit], len(rows) > limit
+
+    def update_user_role(self, user_id, role):
+        response = (
+            self.client.table("users")
+            .update({"role": role, "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+            .eq("id", user_id)
+            .execute()
+        )
+        return bool(response.data)
+
+    def update_users_role(self, user_ids, role):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        response = (
+            self.client.table("users")
+            .update({"role": role, "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+            .in_("id", user_ids)
+            .execute()
+        )
+        return [row["id"] for row in response.data or []]
+
+    def get_admin_stats(self, estimated=False):
+        try:
+            response = self.client.rpc("get_admin_stats", {"p_estimated": estimated}).execute()
+            if response.data:
+                row = response.data[0]
+                stats = {k: int(row.get(k) or 0) for k in ADMIN_STATS_FIELDS}
+                stats["estimated"] = bool(row.get("estimated"))
+                return stats
+        except Exception as e:
+            _warn_once("get_admin_stats", "get_admin_stats: RPC indisponible, repli sur des requêtes HEAD (%s)", e)
+        # Requêtes HEAD : seul l'en-tête Content-Range revient, aucune ligne n'est transférée
+        count = "planned" if estimated else "exact"
+        head = lambda table, column: self.client.table(table).select(column, count=count, head=True)
+        return {
+            "users": head("users", "id").execute().count or 0,
+            "conversations": head("conversations", "conversation_id").execute().count or 0,
+            "messages": head("messages", "id").execute().count or 0,
+            "admins": head("users", "id").eq("role", "admin").execute().count or 0,
+            "regular_users": head("users", "id").eq("role", "user").execute().count or 0,
+            "text_messages": head("messages", "id").eq("type", "text").execute().count or 0,
+            "image_messages": head("messages", "id").eq("type", "image").execute().count or 0,
+            "estimated": estimated,
+        }
+
+    def refresh_daily_rollups(self):
+        response = self.client.rpc("refresh_daily_rollups", {}).execute()
+        return response.data[0] if response.data else {}
+
+    def get_daily_rollups(self, since_day):
+        response = (
+            self.client.table("daily_message_stats").select("*")
+            .gte("day", since_day).order("day").execute()
+        )
+        return response.data or []
+
+
+# -------------------------
+# Backend PostgreSQL direct
+# -------------------------
+
+# nom -> SQL ; les types des paramètres sont déduits des colonnes par PREPARE
+PREPARED_STATEMENTS = {
+    "user_by_email": "SELECT * FROM public.users WHERE email = $1 LIMIT 1",
+    "user_delete": "DELETE FROM public.users WHERE id = $1",
+    "conversations_by_user": (
+        f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM public.conversations "
+        "WHERE user_id = $1 ORDER BY created_at DESC"
+    ),
+    "conversation_update_description": (
+        "UPDATE public.conversations SET description = $2 WHERE conversation_id = $1 RETURNING conversation_id"
+    ),
+    "conversation_delete": "DELETE FROM public.conversations WHERE conversation_id = $1",
+    "message_image_data": "SELECT image_data FROM public.messages WHERE id = $1",
+    "messages_latest": (
+        f"SELECT {', '.join(MESSAGE_HISTORY_COLUMNS)} FROM public.messages "
+        "WHERE conversation_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2"
+    ),
+    "messages_before": (
+        f"SELECT {', '.join(MESSAGE_HISTORY_COLUMNS)} FROM public.messages "
+        "WHERE conversation_id = $1 AND (created_at, id) < ($2, $3) "
+        "ORDER BY created_at DESC, id DESC LIMIT $4"
+    ),
+    "user_stats": "SELECT conversations, messages, edits FROM public.get_user_stats($1)",
+    # psycopg2 envoie une liste Python de str comme ARRAY['…'] (text[]) : le paramètre est
+    # déclaré text[] puis converti explicitement, sinon EXECUTE échoue (uuid = text)
+    "message_counts": (
+        "SELECT conversation_id, COUNT(*) AS messages FROM public.messages "
+        "WHERE conversation_id = ANY($1::text[]::uuid[]) GROUP BY conversation_id"
+    ),
+    "messages_search": (
+        "SELECT id, conversation_id, sender, type, created_at, rank, snippet, capped "
+        "FROM public.search_messages($1, $2, $3, $4, $5)"
+    ),
+    "user_update_role": "UPDATE public.users SET role = $2, updated_at = now() WHERE id = $1 RETURNING id",
+    "users_update_role": (
+        "UPDATE public.users SET role = $2, updated_at = now() "
+        "WHERE id = ANY($1::text[]::uuid[]) RETURNING id"
+    ),
+    "admin_stats": f"SELECT {', '.join(ADMIN_STATS_FIELDS)}, estimated FROM public.get_admin_stats($1)",
+    "rollups_refresh": "SELECT days_refreshed, processed_until FROM public.refresh_daily_rollups()",
+    "rollups_since": "SELECT * FROM public.daily_message_stats WHERE day >= $1 ORDER BY day",
+}
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _make_connection_factory():
+    import psycopg2.extensions
+
+    class PreparedConnection(psycopg2.extensions.connection):
+        """Connexion qui mémorise les requêtes déjà préparées sur sa session"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+
+    return PreparedConnection
+
+
+class PostgresRepository(Repository):
+    name = "postgres"
+
+    def __init__(self, dsn=None, min_connections=1, max_connections=10, **connect_kwargs):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self._pool = ThreadedConnectionPool(
+            min_connections, max_connections, dsn,
+            connection_factory=_make_connection_factory(), **connect_kwargs
+        )
+        # ThreadedConnectionPool lève une erreur au-delà de max_connections : on attend plutôt
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    @contextmanager
+    def _connection(self):
+        with self._slots:
+            conn = self._pool.getconn()
+            broken = False
+            try:
+                if not conn.autocommit:
+                    conn.autocommit = True
+                yield conn
+            except Exception:
+                broken = bool(conn.closed)
+                raise
+            finally:
+                self._pool.putconn(conn, close=broken)
+
+    @staticmethod
+    def _rows(cur):
+        if cur.description is None:
+            return []
+        columns = [c.name for c in cur.description]
+        return [{k: _jsonable(v) for k, v in zip(columns, row)} for row in cur.fetchall()]
+
+    def _execute(self, name, params=()):
+        """Exécute une requête préparée ; retourne les lignes sous forme de dicts"""
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                if name not in conn.prepared:
+                    cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+                    conn.prepared.add(name)
+                placeholders = ", ".join(["%s"] * len(params))
+                cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+                return self._rows(cur)
+
+    def _query(self, sql, params=()):
+        """Requête non préparée (filtres et tris variables des pages d'administration)"""
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return self._rows(cur)
+
+    def _page(self, table, columns, where, params, sort, tiebreak, descending, offset, limit):
+        direction = "DESC" if descending else "ASC"
+        sql = f"SELECT {', '.join(columns)} FROM public.{table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort} {direction}, {tiebreak} {direction} LIMIT %s OFFSET %s"
+        rows = self._query(sql, list(params) + [limit + 1, offset])
+        return rows[:limit], len(rows) > limit
+
+    def _insert(self, table, row):
+        columns = list(row)
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"INSERT INTO public.{table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join(['%s'] * len(columns))}) RETURNING *",
+                    [row[c] for c in columns]
+                )
+                names = [c.name for c in cur.description]
+                return {k: _jsonable(v) for k, v in zip(names, cur.fetchone())}
+
+    def get_user_by_email(self, email):
+        rows = self._execute("user_by_email", (email,))
+        return rows[0] if rows else None
+
+    def create_user(self, row):
+        return self._insert("users", row)
+
+    def delete_user(self, user_id):
+        self._execute("user_delete", (user_id,))
+
+    def list_conversations(self, user_id):
+        return self._execute("conversations_by_user", (user_id,))
+
+    def create_conversation(self, row):
+        return self._insert("conversations", row)
+
+    def update_conversation_description(self, conversation_id, description):
+        return bool(self._execute("conversation_update_description", (conversation_id, description)))
+
+    def delete_conversation(self, conversation_id):
+        self._execute("conversation_delete", (conversation_id,))
+
+    def get_messages_page(self, conversation_id, limit, before=None):
+        if before:
+            created_at, message_id = before
+            return self._execute("messages_before", (conversation_id, created_at, message_id, limit))
+        return self._execute("messages_latest", (conversation_id, limit))
+
+    def get_message_image_data(self, message_id):
+        rows = self._execute("message_image_data", (message_id,))
+        return rows[0]["image_data"] if rows else None
+
+    def insert_messages(self, rows):
+        from psycopg2.extras import execute_values
+
+        rows = list(rows)
+        if not rows:
+            return
+        # Nombre de lignes variable : un seul INSERT multi-lignes plutôt qu'une requête préparée par ligne
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO public.messages ({', '.join(MESSAGE_INSERT_COLUMNS)}) VALUES %s "
+                    "ON CONFLICT (id) DO NOTHING",
+                    [tuple(row.get(c) for c in MESSAGE_INSERT_COLUMNS) for row in rows],
+                    page_size=len(rows)
+                )
+
+    def get_user_stats(self, user_id, conversation_ids=None):
+        rows = self._execute("user_stats", (user_id,))
+        row = rows[0] if rows else {}
+        return {k: int(row.get(k) or 0) for k in ("conversations", "messages", "edits")}
+
+    def list_users_page(self, search=None, role=None, sort="created_at", descending=True, offset=0, limit=25):
+        where, params = [], []
+        term = _search_term(search)
+        if term:
+            where.append("(email ILIKE %s OR name ILIKE %s)")
+            params += [f"%{term}%"] * 2
+        if role:
+            where.append("role = %s")
+            params.append(role)
+        return self._page("users", ADMIN_USER_COLUMNS, where, params, _sort_column(sort, USER_SORT_COLUMNS),
+                          "id", descending, offset, limit)
+
+    def list_all_conversations_page(self, search=None, user_id=None, sort="created_at", descending=True,
+                                    offset=0, limit=25):
+        where, params = [], []
+        term = _search_term(search)
+        if term:
+            where.append("description ILIKE %s")
+            params.append(f"%{term}%")
+        if user_id:
+            where.append("user_id = %s")
+            params.append(user_id)
+        return self._page("conversations", CONVERSATION_COLUMNS, where, params,
+                          _sort_column(sort, CONVERSATION_SORT_COLUMNS), "conversation_id", descending, offset, limit)
+
+    def count_messages_by_conversation(self, conversation_ids):
+        conversation_ids = list(conversation_ids)
+        if not conversation_ids:
+            return {}
+        counts = {c: 0 for c in conversation_ids}
+        for row in self._execute("message_counts", (conversation_ids,)):
+            counts[str(row["conversation_id"])] = int(row["messages"])
+        return counts
+
+    def search_messages(self, query, user_id=None, offset=0, limit=20):
+        if not (query or "").strip():
+            return [], False
+        rows = self._execute("messages_search", (query, user_id, limit + 1, offset, SEARCH_MAX_CANDIDATES))
+        return rows[:limit], len(rows) > limit
+
+    def update_user_role(self, user_id, role):
+        return bool(self._execute("user_update_role", (user_id, role)))
+
+    def update_users_role(self, user_ids, role):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        return [str(row["id"]) for row in self._execute("users_update_role", (user_ids, role))]
+
+    def get_admin_stats(self, estimated=False):
+        row = self._execute("admin_stats", (estimated,))[0]
+        stats = {k: int(row.get(k) or 0) for k in ADMIN_STATS_FIELDS}
+        stats["estimated"] = bool(row.get("estimated"))
+        return stats
+
+    def refresh_daily_rollups(self):
+        rows = self._execute("rollups_refresh")
+        return rows[0] if rows else {}
+
+    def get_daily_rollups(self, since_day):
+        return self._execute("rollups_since", (since_day,))
+
+    def close(self):
+        self._pool.closeall()
+
+
+def postgres_settings_from_env():
+    return {
+        "host": os.environ.get("DB_HOST", "localhost"),
+        "port": int(os.environ.get("DB_PORT", "5432")),
+        "dbname": os.environ.get("DB_NAME", "postgres"),
+        "user": os.environ.get("DB_USER", "postgres"),
+        "password": os.environ.get("DB_PASSWORD", ""),
+    }
+
+
+def create_repository(supabase_client=None, kind=None):
+    """Construit le backend configuré par DB_BACKEND (supabase par défaut)"""
+    kind = (kind or os.environ.get("DB_BACKEND", "supabase")).lower()
+    if kind == "supabase":
+        if not supabase_client:
+            raise ValueError("DB_BACKEND=supabase nécessite un client Supabase")
+        return SupabaseRepository(supabase_client)
+    if kind == "postgres":
+        return PostgresRepository(
+            min_connections=int(os.environ.get("DB_POOL_MIN", "1")),
+            max_connections=int(os.environ.get("DB_POOL_MAX", "10")),
+            **postgres_settings_from_env()
+        )
+    raise ValueError(f"DB_BACKEND inconnu: {kind}")
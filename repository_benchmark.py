@@ -0,0 +1,158 @@
+"""Benchmark des backends d'accès aux données (Supabase REST vs PostgreSQL direct).
+
+Crée un utilisateur et une conversation de test, y insère --seed-messages messages,
+puis mesure chaque opération du dépôt : latence par appel (p50/p95/moyenne) et
+débit avec --threads clients concurrents. Les données de test sont supprimées à la fin.
+
+Cible prévue : une base locale, par exemple la pile `supabase start` (PostgREST
+sur SUPABASE_URL, PostgreSQL sur DB_HOST/DB_PORT=54322) pour comparer les deux
+chemins sur le même serveur.
+
+Usage:
+    python repository_benchmark.py --backend both --iterations 200 --threads 4
+    python repository_benchmark.py --backend postgres --seed-messages 5000
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import uuid
+
+from repository import create_repository
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def message_rows(conversation_id, count, start=0):
+    base = time.time() - 86400
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": f"message de test {i}",
+            "type": "text",
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(base + i)),
+            "image_ref": None,
+            "thumb_ref": None,
+            "edit_context": None,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def seed(repository, messages):
+    user_id = str(uuid.uuid4())
+    email = f"bench-{user_id[:8]}@example.invalid"
+    repository.create_user({
+        "id": user_id,
+        "email": email,
+        "name": "benchmark",
+        "role": "user",
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    conversation_id = str(uuid.uuid4())
+    repository.create_conversation({
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "description": "benchmark",
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    for start in range(0, messages, 500):
+        repository.insert_messages(message_rows(conversation_id, min(500, messages - start), start))
+    # Curseur au milieu de l'historique pour la page "messages plus anciens"
+    page = repository.get_messages_page(conversation_id, max(1, messages // 2))
+    cursor = (page[-1]["created_at"], page[-1]["id"]) if page else None
+    return {"user_id": user_id, "email": email, "conversation_id": conversation_id, "cursor": cursor}
+
+
+def operations(repository, ctx, insert_batch):
+    counter = iter(range(10 ** 9))
+    return {
+        "user_by_email": lambda: repository.get_user_by_email(ctx["email"]),
+        "list_conversations": lambda: repository.list_conversations(ctx["user_id"]),
+        "messages_latest": lambda: repository.get_messages_page(ctx["conversation_id"], 51),
+        "messages_before": lambda: repository.get_messages_page(ctx["conversation_id"], 51, ctx["cursor"]),
+        "user_stats": lambda: repository.get_user_stats(ctx["user_id"]),
+        f"insert_messages x{insert_batch}": lambda: repository.insert_messages(
+            message_rows(ctx["conversation_id"], insert_batch, 10 ** 6 + next(counter) * insert_batch)
+        ),
+    }
+
+
+def measure(call, iterations, threads):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(1, iterations // threads)
+
+    def worker():
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                call()
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    call()  # préchauffage : connexion du pool, PREPARE
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - started
+    return latencies, errors, wall
+
+
+def run_backend(kind, args):
+    supabase = None
+    if kind == "supabase":
+        from supabase import create_client
+        supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    repository = create_repository(supabase, kind=kind)
+    ctx = seed(repository, args.seed_messages)
+    print(f"\n== {kind} ({args.seed_messages} messages, {args.threads} clients) ==")
+    print(f"{'opération':24s} {'p50':>8s} {'p95':>8s} {'moyenne':>8s} {'débit':>10s} erreurs")
+    try:
+        for name, call in operations(repository, ctx, args.insert_batch).items():
+            latencies, errors, wall = measure(call, args.iterations, args.threads)
+            print(
+                f"{name:24s} {percentile(latencies, 50) * 1000:6.1f}ms {percentile(latencies, 95) * 1000:6.1f}ms "
+                f"{(statistics.mean(latencies) if latencies else 0) * 1000:6.1f}ms "
+                f"{len(latencies) / wall if wall else 0:7.0f}/s {len(errors)}"
+            )
+            if errors:
+                print(f"   ⚠️ {errors[0]}")
+    finally:
+        repository.delete_conversation(ctx["conversation_id"])
+        repository.delete_user(ctx["user_id"])
+        repository.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["supabase", "postgres", "both"], default="both")
+    parser.add_argument("--iterations", type=int, default=200, help="appels par opération")
+    parser.add_argument("--threads", type=int, default=4, help="clients concurrents")
+    parser.add_argument("--seed-messages", type=int, default=2000)
+    parser.add_argument("--insert-batch", type=int, default=10, help="lignes par insertion multi-lignes")
+    args = parser.parse_args()
+
+    for kind in (["supabase", "postgres"] if args.backend == "both" else [args.backend]):
+        run_backend(kind, args)
+
+
+if __name__ == "__main__":
+    main()
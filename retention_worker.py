@@ -0,0 +1,335 @@
+"""Politique de rétention : archive, compacte et purge les données anciennes, par lots bornés.
+
+Trois paliers, appliqués dans cet ordre à chaque passage :
+  1. jetons password_resets expirés : supprimés par lots (idx_password_resets_expires) ;
+  2. images des messages de plus de --image-days jours : l'original est réduit
+     (--image-policy downsample, plus grand côté --downsample-edge) ou supprimé
+     (drop) ; la miniature est toujours conservée (créée si absente, pour les
+     lignes base64 pas encore migrées). Un blob n'est supprimé que si plus
+     aucun message ni aucune archive ne le référence ;
+  3. conversations sans activité depuis --archive-days jours : exportées en JSON
+     Lines gzip dans le magasin froid (ARCHIVE_STORE), référencées dans
+     conversation_archives, puis supprimées de la base en une transaction.
+
+Chaque palier traite au plus --max-batches lots de --batch-size lignes, avec une
+pause --sleep entre deux lots : un passage reste court et ne monopolise ni la
+base ni les verrous. Le reste est repris au passage suivant. Relançable sans
+risque : une ligne traitée sort de l'ensemble des candidats.
+
+Usage:
+    python retention_worker.py --dry-run
+    python retention_worker.py
+    python retention_worker.py --interval 3600
+    python retention_worker.py --archive-days 180 --image-days 30 --image-policy drop
+    python retention_worker.py --restore <conversation_id>
+"""
+import argparse
+import base64
+import binascii
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image
+
+from supabase import create_client
+
+from blob_store import BlobNotFound, create_blob_store, is_blob_ref
+from export_engine import supabase_pages
+from image_derivatives import ImageEncodingPolicy, make_thumbnail
+
+ARCHIVE_MESSAGE_COLUMNS = ("id", "conversation_id", "sender", "content", "type", "created_at", "image_data",
+                           "image_ref", "thumb_ref", "image_tier", "edit_context")
+IMAGE_POLICIES = ("downsample", "drop", "keep")
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, str(default)))
+
+
+def cutoff(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(timespec="seconds")
+
+
+def count_rows(query):
+    return query.execute().count or 0
+
+
+# -------------------------
+# Palier 1 : jetons expirés
+# -------------------------
+
+def purge_password_resets(supabase, batch_size, max_batches, sleep):
+    purged = 0
+    for _ in range(max_batches):
+        deleted = supabase.rpc("purge_expired_password_resets", {"p_limit": batch_size}).execute().data or 0
+        purged += deleted
+        if deleted < batch_size:
+            break
+        time.sleep(sleep)
+    return purged
+
+
+# -------------------------
+# Palier 2 : images anciennes
+# -------------------------
+
+def image_candidates(supabase, before, limit, head=False):
+    query = supabase.table("messages")
+    query = query.select("id", count="exact", head=True) if head else query.select(
+        "id, created_at, image_ref, thumb_ref, image_data"
+    )
+    query = (
+        query.is_("image_tier", "null")
+        .or_("image_ref.not.is.null,image_data.not.is.null")
+        .lt("created_at", before)
+    )
+    if head:
+        return query
+    return query.order("created_at").order("id").limit(limit).execute().data or []
+
+
+def load_original(store, row):
+    """(octets, image PIL) de l'original : blob, ou base64 pour les lignes pas encore migrées"""
+    if row.get("image_ref"):
+        data = store.get(row["image_ref"])
+    else:
+        data = base64.b64decode(row["image_data"], validate=True)
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return data, image
+
+
+def release_blob(supabase, store, ref):
+    """Supprime un blob devenu inutile ; retourne le nombre d'octets libérés (0 s'il est encore référencé)"""
+    if not is_blob_ref(ref) or supabase.rpc("blob_ref_in_use", {"p_ref": ref}).execute().data:
+        return 0
+    try:
+        size = len(store.get(ref))
+    except BlobNotFound:
+        return 0
+    store.delete(ref)
+    return size
+
+
+def compact_image(supabase, store, row, policy, encoder):
+    """Applique le palier à une ligne ; retourne les octets libérés"""
+    try:
+        data, image = load_original(store, row)
+    except (BlobNotFound, binascii.Error, ValueError, OSError) as e:
+        print(f"⚠️ {row['id']}: image illisible ({e}), ignorée")
+        supabase.table("messages").update({"image_tier": "invalid"}).eq("id", row["id"]).execute()
+        return 0
+    update = {"image_data": None}
+    thumb_ref = row.get("thumb_ref")
+    if not thumb_ref:
+        thumb_bytes, thumb_type = make_thumbnail(image)
+        thumb_ref = store.put(thumb_bytes, thumb_type)
+        update["thumb_ref"] = thumb_ref
+    if policy == "drop":
+        update.update(image_ref=None, image_tier="thumbnail")
+        new_size = 0
+    else:
+        encoded = encoder.encode(image, source_bytes=len(data))
+        if encoded.size == image.size and len(encoded.data) >= len(data) and row.get("image_ref"):
+            # Déjà assez petite : l'original est conservé tel quel
+            supabase.table("messages").update({"image_tier": "downsampled"}).eq("id", row["id"]).execute()
+            return 0
+        update.update(image_ref=store.put(encoded.data, encoded.content_type), image_tier="downsampled")
+        new_size = len(encoded.data)
+    supabase.table("messages").update(update).eq("id", row["id"]).execute()
+    freed = len(row.get("image_data") or "") - new_size
+    if row.get("image_ref") and row["image_ref"] != update.get("image_ref"):
+        freed += release_blob(supabase, store, row["image_ref"])
+    return max(freed, 0)
+
+
+def compact_images(supabase, store, policy, days, downsample_edge, batch_size, max_batches, sleep):
+    stats = {"images": 0, "bytes_freed": 0}
+    if policy == "keep":
+        return stats
+    before = cutoff(days)
+    encoder = ImageEncodingPolicy.from_env()
+    encoder.max_edge = downsample_edge
+    for _ in range(max_batches):
+        rows = image_candidates(supabase, before, batch_size)
+        for row in rows:
+            stats["bytes_freed"] += compact_image(supabase, store, row, policy, encoder)
+            stats["images"] += 1
+        if len(rows) < batch_size:
+            break
+        time.sleep(sleep)
+    return stats
+
+
+# -------------------------
+# Palier 3 : archivage des conversations
+# -------------------------
+
+def build_archive(supabase, conversation):
+    """JSON Lines gzip : la conversation puis ses messages, lus page par page.
+    Retourne (octets, nombre de messages, refs d'images, created_at du dernier message archivé)."""
+    buffer = io.BytesIO()
+    messages = 0
+    refs = set()
+    archived_until = None
+    # mtime=0 : archive identique pour un même contenu (référence par empreinte stable)
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as archive:
+        archive.write((json.dumps({"conversation": conversation}, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        pages = supabase_pages(supabase, "messages", columns=ARCHIVE_MESSAGE_COLUMNS,
+                               key_columns=("created_at", "id"), date_column="created_at",
+                               filters={"conversation_id": conversation["conversation_id"]})
+        for rows in pages:
+            for row in rows:
+                archive.write((json.dumps({"message": row}, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+                refs.update(ref for ref in (row.get("image_ref"), row.get("thumb_ref")) if ref)
+            messages += len(rows)
+            # Pages triées par (created_at, id) : la dernière ligne borne l'instantané
+            archived_until = rows[-1].get("created_at")
+    return buffer.getvalue(), messages, sorted(refs), archived_until
+
+
+def archive_conversation(supabase, archive_store, conversation_id):
+    rows = supabase.table("conversations").select("*").eq("conversation_id", conversation_id).execute().data
+    if not rows:
+        return 0, 0
+    conversation = rows[0]
+    data, messages, refs, archived_until = build_archive(supabase, conversation)
+    archive_ref = archive_store.put(data, "application/gzip")
+    # Enregistrée avant la suppression : si le passage s'interrompt, la conversation
+    # est simplement réarchivée (même contenu, même référence) au passage suivant
+    supabase.table("conversation_archives").upsert({
+        "conversation_id": conversation_id,
+        "user_id": str(conversation.get("user_id")) if conversation.get("user_id") else None,
+        "description": conversation.get("description"),
+        "created_at": conversation.get("created_at"),
+        "last_message_at": archived_until,
+        "message_count": messages,
+        "archive_ref": archive_ref,
+        "archive_bytes": len(data),
+        "blob_refs": refs,
+        "archived_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }).execute()
+    # Ne supprime que les messages de l'instantané (NULL : conversation vide, supprimée
+    # seulement si elle l'est encore) ; un message arrivé entre-temps garde la conversation
+    supabase.rpc("retention_drop_conversation", {
+        "p_conversation_id": conversation_id,
+        "p_until": archived_until,
+    }).execute()
+    return messages, len(data)
+
+
+def archive_conversations(supabase, archive_store, days, batch_size, max_batches, sleep):
+    stats = {"conversations": 0, "messages": 0, "archive_bytes": 0}
+    before = cutoff(days)
+    for _ in range(max_batches):
+        candidates = supabase.rpc("retention_archivable_conversations", {
+            "p_before": before,
+            "p_limit": batch_size,
+        }).execute().data or []
+        for candidate in candidates:
+            messages, size = archive_conversation(supabase, archive_store, candidate["conversation_id"])
+            stats["conversations"] += 1
+            stats["messages"] += messages
+            stats["archive_bytes"] += size
+        if len(candidates) < batch_size:
+            break
+        time.sleep(sleep)
+    return stats
+
+
+def restore_conversation(supabase, archive_store, conversation_id, batch_size):
+    """Réinsère une conversation archivée et ses messages, puis retire l'archive"""
+    rows = supabase.table("conversation_archives").select("*").eq("conversation_id", conversation_id).execute().data
+    if not rows:
+        raise SystemExit(f"❌ Aucune archive pour {conversation_id}")
+    archive = rows[0]
+    lines = gzip.decompress(archive_store.get(archive["archive_ref"])).decode("utf-8").splitlines()
+    records = [json.loads(line) for line in lines if line]
+    conversation = next(r["conversation"] for r in records if "conversation" in r)
+    messages = [r["message"] for r in records if "message" in r]
+    # Nouveau délai de grâce : sans restored_at, une conversation restaurée, toujours
+    # inactive, serait réarchivée au passage suivant
+    conversation["restored_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    supabase.table("conversations").upsert(conversation).execute()
+    for start in range(0, len(messages), batch_size):
+        supabase.table("messages").upsert(messages[start:start + batch_size]).execute()
+    supabase.table("conversation_archives").delete().eq("conversation_id", conversation_id).execute()
+    archive_store.delete(archive["archive_ref"])
+    return len(messages)
+
+
+# -------------------------
+# Passage complet
+# -------------------------
+
+def dry_run(supabase, args):
+    resets = count_rows(
+        supabase.table("password_resets").select("id", count="exact", head=True)
+        .lt("expires_at", time.time())
+    )
+    images = count_rows(image_candidates(supabase, cutoff(args.image_days), 0, head=True))
+    conversations = supabase.rpc("retention_archivable_conversations", {
+        "p_before": cutoff(args.archive_days),
+        "p_limit": args.batch_size * args.max_batches,
+    }).execute().data or []
+    print(f"… {resets} jetons expirés à purger")
+    print(f"… {images} images de plus de {args.image_days} jours ({args.image_policy})")
+    print(f"… {len(conversations)} conversations sans activité depuis {args.archive_days} jours"
+          f" (au plus {args.batch_size * args.max_batches} comptées)")
+
+
+def run_once(supabase, store, archive_store, args):
+    started = time.monotonic()
+    purged = purge_password_resets(supabase, args.batch_size, args.max_batches, args.sleep)
+    images = compact_images(supabase, store, args.image_policy, args.image_days, args.downsample_edge,
+                            args.batch_size, args.max_batches, args.sleep)
+    archived = archive_conversations(supabase, archive_store, args.archive_days,
+                                     args.batch_size, args.max_batches, args.sleep)
+    print(
+        f"✅ {purged} jetons purgés, {images['images']} images compactées "
+        f"({images['bytes_freed'] / 1e6:.1f} Mo libérés), {archived['conversations']} conversations archivées "
+        f"({archived['messages']} messages → {archived['archive_bytes'] / 1e6:.1f} Mo gzip) "
+        f"en {time.monotonic() - started:.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archive-days", type=int, default=env_int("RETENTION_ARCHIVE_DAYS", 365))
+    parser.add_argument("--image-days", type=int, default=env_int("RETENTION_IMAGE_DAYS", 90))
+    parser.add_argument("--image-policy", choices=IMAGE_POLICIES,
+                        default=os.environ.get("RETENTION_IMAGE_POLICY", "downsample"))
+    parser.add_argument("--downsample-edge", type=int, default=env_int("RETENTION_DOWNSAMPLE_EDGE", 1024))
+    parser.add_argument("--batch-size", type=int, default=env_int("RETENTION_BATCH_SIZE", 100))
+    parser.add_argument("--max-batches", type=int, default=env_int("RETENTION_MAX_BATCHES", 20),
+                        help="lots au plus par palier et par passage")
+    parser.add_argument("--sleep", type=float, default=0.5, help="pause entre deux lots (secondes)")
+    parser.add_argument("--interval", type=float, default=0, help="secondes entre deux passages (0 = un seul)")
+    parser.add_argument("--dry-run", action="store_true", help="compter les candidats sans rien modifier")
+    parser.add_argument("--restore", metavar="CONVERSATION_ID", help="restaurer une conversation archivée")
+    args = parser.parse_args()
+
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    store = create_blob_store(supabase)
+    archive_store = create_blob_store(supabase, env_prefix="ARCHIVE_STORE", default_dir="archive_store",
+                                      default_bucket="conversation-archives")
+    if args.restore:
+        count = restore_conversation(supabase, archive_store, args.restore, args.batch_size)
+        print(f"✅ Conversation {args.restore} restaurée ({count} messages)")
+        return
+    if args.dry_run:
+        dry_run(supabase, args)
+        return
+    while True:
+        run_once(supabase, store, archive_store, args)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# -------------------------
+# Cache des résultats de recherche + préchargement spéculatif
+# -------------------------
+# Le cache est partagé par tout le processus ; chaque session possède son propre
+# SearchPrefetcher (budget, statistiques, minuteur de debounce).
+
+
+def normalize_search_key(search_type, query):
+    return (search_type, re.sub(r"\s+", " ", (query or "").strip().lower()))
+
+
+class SearchResultCache:
+    def __init__(self, ttl=600, max_entries=256, max_workers=2):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-prefetch")
+
+    def get_or_compute(self, key, compute):
+        """Retourne (valeur, source) avec source dans {"cache", "inflight", "fresh"}"""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                return value, "cache"
+            future = self._inflight.get(key)
+            if future is None:
+                # Calcul au premier plan enregistré comme en cours : un préchargement
+                # déclenché pendant ce temps (minuteur de debounce) n'en lance pas un second
+                own = Future()
+                self._inflight[key] = own
+        if future is not None:
+            try:
+                return future.result(), "inflight"
+            except Exception:
+                return self.get_or_compute(key, compute)
+        try:
+            value = compute()
+            self.put(key, value)
+        except BaseException as e:
+            own.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        own.set_result(value)
+        return value, "fresh"
+
+    def prefetch(self, key, compute):
+        """Lance compute en arrière-plan si la clé n'est ni en cache ni déjà en cours"""
+        with self._lock:
+            if self._get_locked(key) is not None or key in self._inflight:
+                return False
+            future = self._executor.submit(self._run_prefetch, key, compute)
+            self._inflight[key] = future
+            return True
+
+    def contains(self, key):
+        with self._lock:
+            return self._get_locked(key) is not None or key in self._inflight
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _run_prefetch(self, key, compute):
+        try:
+            value = compute()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+
+class SearchPrefetcher:
+    def __init__(self, cache, detect_intent, compute, budget=10, debounce=0.8):
+        self.cache = cache
+        self.detect_intent = detect_intent
+        self.compute = compute
+        self.budget = budget
+        self.debounce = debounce
+        self._timer = None
+        self._lock = threading.Lock()
+        self._outstanding = set()
+        self.stats = {"prefetched": 0, "hits": 0, "wasted": 0, "skipped_budget": 0}
+
+    def on_draft(self, text):
+        """Appelé à chaque changement du brouillon ; le préchargement part après le debounce"""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            if not text or not text.strip():
+                self._timer = None
+                return
+            self._timer = threading.Timer(self.debounce, self._fire, args=(text,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def lookup(self, search_type, query):
+        """Résultats pour la requête envoyée, en comptant hits et préchargements gaspillés"""
+        key = normalize_search_key(search_type, query)
+        # Le brouillon est envoyé : un préchargement encore en attente de debounce est inutile
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        value, source = self.cache.get_or_compute(key, lambda: self.compute(query, search_type))
+        with self._lock:
+            if key in self._outstanding and source != "fresh":
+                self.stats["hits"] += 1
+            self._outstanding.discard(key)
+            self.stats["wasted"] += len(self._outstanding)
+            self._outstanding.clear()
+        return value
+
+    def report(self):
+        prefetched = self.stats["prefetched"]
+        return {
+            **self.stats,
+            "remaining_budget": max(0, self.budget - prefetched),
+            "hit_ratio": self.stats["hits"] / prefetched if prefetched else 0.0,
+            "waste_ratio": self.stats["wasted"] / prefetched if prefetched else 0.0,
+        }
+
+    def _fire(self, text):
+        search_type, query = self.detect_intent(text)
+        if not search_type or not query:
+            return
+        key = normalize_search_key(search_type, query)
+        with self._lock:
+            if key in self._outstanding or self.cache.contains(key):
+                return
+            if self.stats["prefetched"] >= self.budget:
+                self.stats["skipped_budget"] += 1
+                return
+            self.stats["prefetched"] += 1
+            self._outstanding.add(key)
+        self.cache.prefetch(key, lambda: self.compute(query, search_type))
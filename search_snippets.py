@@ -0,0 +1,35 @@
+import re
+
+# -------------------------
+# Extraits surlignés de la recherche plein texte
+# -------------------------
+# search_messages (migration 0014) encadre les termes trouvés par deux caractères
+# d'usage privé Unicode, absents des contenus réels, plutôt que par ** : le
+# contenu d'un message peut contenir du Markdown, des liens ou du LaTeX. Le rendu
+# échappe tout le texte puis ne remet en gras que les segments encadrés.
+
+SNIPPET_START = "\ue000"
+SNIPPET_STOP = "\ue001"
+
+# Ponctuation interprétée par st.markdown (Markdown, $ pour LaTeX, :…: pour les
+# emojis et couleurs Streamlit) ; en CommonMark toute ponctuation ASCII s'échappe
+_MARKDOWN_SPECIAL = set("\\`*_{}[]()#+-.!|~<>$:=\"'&")
+
+
+def escape_markdown(text):
+    """Texte brut affichable tel quel par st.markdown"""
+    escaped = "".join("\\" + ch if ch in _MARKDOWN_SPECIAL else ch for ch in text)
+    # Sauts de ligne : un extrait tient sur une ligne, sans titre ni liste implicite
+    return re.sub(r"\s+", " ", escaped)
+
+
+def snippet_markdown(snippet):
+    """Extrait échappé, termes trouvés en gras"""
+    parts = []
+    for i, chunk in enumerate((snippet or "").split(SNIPPET_START)):
+        highlighted, _, rest = chunk.partition(SNIPPET_STOP) if i else ("", "", chunk)
+        if highlighted.strip():
+            parts.append(f"**{escape_markdown(highlighted.strip())}**")
+        if rest:
+            parts.append(escape_markdown(rest))
+    return "".join(parts)
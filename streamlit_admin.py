@@ -1,11 +1,56 @@
 import streamlit as st
 import pandas as pd
-import io
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone, time as dt_time
 from supabase import create_client
 
+from export_engine import export, export_partitioned, supabase_pages
+from query_cache import QueryCache
+
 st.set_page_config(page_title="Vision AI Admin", layout="wide")
+logger = logging.getLogger("vision_ai.admin")
 ADMIN_EMAIL = "essice34@gmail,com"
 ADMIN_PASSWORD = "4Us,T}17!"
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "vision_ai_exports")
+os.makedirs(EXPORT_DIR, exist_ok=True)
+# Exports servis depuis Supabase Storage par URL signée : le fichier ne transite
+# jamais par la mémoire du serveur Streamlit. Fichiers locaux supprimés dès
+# l'envoi ; objets du bucket supprimés après EXPORT_RETENTION_HOURS.
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET", "admin-exports")
+EXPORT_RETENTION_HOURS = float(os.environ.get("EXPORT_RETENTION_HOURS", "24"))
+EXPORT_URL_TTL = int(os.environ.get("EXPORT_URL_TTL", "900"))
+# Colonnes sensibles exclues par défaut des exports
+SENSITIVE_COLUMNS = {"password", "reset_token", "reset_token_expires", "reset_token_created"}
+# Aperçu affiché ; les exports parcourent toute la table
+PREVIEW_ROWS = 200
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", "60"))
+
+@st.cache_resource
+def init_supabase():
+    try:
+        return create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    except Exception as e:
+        st.error(f"Erreur connexion Supabase: {e}")
+        return None
+
+supabase = init_supabase()
+
+@st.cache_resource
+def get_query_cache():
+    """Cache des requêtes du tableau de bord, partagé entre les sessions"""
+    return QueryCache(ttl=ADMIN_CACHE_TTL)
+
+def cached_query(namespace, params, loader):
+    """Résultat en cache (ou lu si absent/expiré) et son heure de lecture"""
+    return get_query_cache().fetch(namespace, params, loader)
+
+def data_as_of(fetched_at):
+    age = int((datetime.now(timezone.utc) - fetched_at).total_seconds())
+    st.caption(f"Données au {fetched_at.strftime('%H:%M:%S')} UTC (il y a {age}s)")
 
 if "admin_logged" not in st.session_state:
     st.session_state.admin_logged = False
@@ -25,40 +70,180 @@ if not st.session_state.admin_logged:
             st.error("Email ou mot de passe incorrect")
     st.stop()
 
+# -------------------------
+# Export en flux
+# -------------------------
+def table_columns(table):
+    """Colonnes d'une table, lues sur une seule ligne"""
+    rows, _ = cached_query("columns", (table,), lambda: supabase.table(table).select("*").limit(1).execute().data)
+    return list(rows[0].keys()) if rows else []
+
+def export_controls(table, label, key_columns=("id",)):
+    """Export CSV/Parquet page par page vers un fichier temporaire, puis téléchargement"""
+    with st.expander(f"💾 Exporter {label}"):
+        columns = table_columns(table)
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key=f"export_fmt_{table}")
+        selected = st.multiselect(
+            "Colonnes", columns,
+            default=[c for c in columns if c not in SENSITIVE_COLUMNS],
+            key=f"export_cols_{table}"
+        )
+        since = until = None
+        if st.checkbox("Limiter à une période", key=f"export_range_{table}"):
+            col1, col2 = st.columns(2)
+            start_date = col1.date_input("Du", key=f"export_since_{table}")
+            end_date = col2.date_input("Au (inclus)", key=f"export_until_{table}")
+            since = datetime.combine(start_date, dt_time.min).isoformat()
+            until = datetime.combine(end_date, dt_time.max).isoformat()
+        if st.button("Préparer l'export", key=f"export_run_{table}", disabled=not selected):
+            cleanup_exports()
+            path = os.path.join(EXPORT_DIR, f"{table}_{int(time.time())}.{fmt}")
+            with st.spinner("Export en cours..."):
+                pages = supabase_pages(supabase, table, columns=selected, key_columns=key_columns,
+                                       since=since, until=until)
+                count = export(pages, path, fmt, selected, table=table)
+            publish_export(f"export_{table}", path, f"{count} lignes")
+        offer_download(f"export_{table}")
+
+EXPORT_MIME_TYPES = {".csv": "text/csv", ".parquet": "application/vnd.apache.parquet", ".zip": "application/zip"}
+
+def cleanup_exports():
+    """Supprime les fichiers locaux orphelins et les objets du bucket plus vieux que la rétention"""
+    limit = time.time() - EXPORT_RETENTION_HOURS * 3600
+    for filename in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, filename)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+    try:
+        bucket = supabase.storage.from_(EXPORT_BUCKET)
+        expired = [
+            obj["name"] for obj in bucket.list() or []
+            if obj.get("created_at")
+            and datetime.fromisoformat(obj["created_at"].replace("Z", "+00:00")).timestamp() < limit
+        ]
+        if expired:
+            bucket.remove(expired)
+    except Exception as e:
+        logger.warning("Nettoyage des exports: %s", e)
+
+def publish_export(state_key, path, summary):
+    """Envoie le fichier préparé dans le bucket d'exports, puis le supprime du disque local"""
+    name = os.path.basename(path)
+    extension = os.path.splitext(name)[1]
+    size = os.path.getsize(path)
+    try:
+        with open(path, "rb") as f:
+            supabase.storage.from_(EXPORT_BUCKET).upload(
+                name, f, {"content-type": EXPORT_MIME_TYPES.get(extension, "application/octet-stream")}
+            )
+    finally:
+        os.remove(path)
+    st.session_state[state_key] = {"object": name, "summary": summary, "size": size}
+
+def offer_download(state_key):
+    """Lien de téléchargement signé et temporaire : le navigateur lit le fichier directement
+    depuis le stockage, sans le charger dans la mémoire du serveur Streamlit"""
+    done = st.session_state.get(state_key)
+    if not done:
+        return
+    if done.get("url_expires", 0) < time.time() + 60:
+        signed = supabase.storage.from_(EXPORT_BUCKET).create_signed_url(
+            done["object"], EXPORT_URL_TTL, {"download": done["object"]}
+        )
+        done["url"] = signed.get("signedURL") or signed.get("signedUrl")
+        done["url_expires"] = time.time() + EXPORT_URL_TTL
+    extension = os.path.splitext(done["object"])[1]
+    st.caption(f"{done['summary']}, {done['size'] / 1e6:.1f} Mo — lien valable {EXPORT_URL_TTL // 60} min")
+    st.link_button(f"💾 Télécharger ({extension[1:].upper()})", done["url"])
+
+def archive_controls(table):
+    """Archive zip partitionnée par conversation, construite en un seul passage à la demande"""
+    with st.expander("🗂️ Archive par conversation"):
+        fmt = st.radio("Format des fichiers", ["csv", "parquet"], horizontal=True, key=f"archive_fmt_{table}")
+        st.caption("Un CSV par conversation, ou Parquet partitionné (conversation_id=<id>/part-0.parquet).")
+        if st.button("Préparer l'archive", key=f"archive_run_{table}"):
+            cleanup_exports()
+            path = os.path.join(EXPORT_DIR, f"{table}_par_conversation_{int(time.time())}.zip")
+            with st.spinner("Archive en cours..."):
+                pages = supabase_pages(supabase, table, key_columns=("conversation_id", "id"))
+                partitions, count = export_partitioned(pages, path, fmt, table=table)
+            publish_export(f"archive_{table}", path, f"{partitions} conversations, {count} lignes")
+        offer_download(f"archive_{table}")
+
+UUID_PATTERN = re.compile(r"^[0-9a-fA-F-]{36}$")
+
+def conversation_export_selector(table):
+    """Recherche d'une conversation (description ou identifiant) puis export de ses seuls messages"""
+    with st.expander("🔎 Exporter une conversation"):
+        search = st.text_input("Rechercher (description ou identifiant)", key=f"conv_search_{table}").strip()
+
+        def search_conversations():
+            query = supabase.table("conversations").select("conversation_id, description, created_at")
+            if UUID_PATTERN.match(search):
+                query = query.eq("conversation_id", search)
+            elif search:
+                query = query.ilike("description", f"%{search}%")
+            return query.order("created_at", desc=True).limit(50).execute().data or []
+
+        matches, _ = cached_query("conversations", (search,), search_conversations)
+        if not matches:
+            st.info("Aucune conversation trouvée")
+            return
+        labels = {
+            f"{c.get('description') or 'Sans titre'} — {str(c.get('created_at') or '')[:16]} ({c['conversation_id'][:8]})": c["conversation_id"]
+            for c in matches
+        }
+        selected = st.selectbox(f"{len(matches)} résultat(s)", list(labels), key=f"conv_pick_{table}")
+        conversation_id = labels[selected]
+        if st.button("Préparer le CSV", key=f"conv_run_{table}"):
+            cleanup_exports()
+            path = os.path.join(EXPORT_DIR, f"conversation_{conversation_id}_{int(time.time())}.csv")
+            pages = supabase_pages(supabase, table, filters={"conversation_id": conversation_id})
+            count = export(pages, path, "csv")
+            publish_export(f"conv_export_{table}", path, f"{count} messages")
+        offer_download(f"conv_export_{table}")
+
 # -------------------------
 # Dashboard
 # -------------------------
 st.title("🛠️ Admin Dashboard")
 st.sidebar.success("Connecté en tant qu'admin")
+st.sidebar.caption(f"Requêtes en cache {ADMIN_CACHE_TTL}s")
+if st.sidebar.button("🔄 Rafraîchir les données"):
+    get_query_cache().invalidate()
+    st.rerun()
 
 # Utilisateurs
 st.header("👥 Utilisateurs")
 try:
-    users = db.supabase.table("users").select("*").execute().data
+    users, fetched_at = cached_query(
+        "users", (PREVIEW_ROWS,),
+        lambda: supabase.table("users").select("*").order("created_at", desc=True).limit(PREVIEW_ROWS).execute().data
+    )
+    data_as_of(fetched_at)
     if users:
-        df_users = pd.DataFrame(users)
-        st.dataframe(df_users)
-        csv_buffer = io.StringIO()
-        df_users.to_csv(csv_buffer, index=False)
-        st.download_button("💾 Télécharger les utilisateurs (CSV)", csv_buffer.getvalue(), "users.csv", "text/csv")
+        st.caption(f"{len(users)} utilisateurs les plus récents — les exports couvrent toute la table")
+        st.dataframe(pd.DataFrame(users).drop(columns=list(SENSITIVE_COLUMNS), errors="ignore"))
+    export_controls("users", "les utilisateurs")
 except Exception as e:
     st.error(f"Erreur récupération utilisateurs: {e}")
 
 # Conversations
 st.header("💬 Conversations")
 try:
-    convs = db.supabase.table("messager").select("*").order("created_at").execute().data
+    convs, fetched_at = cached_query(
+        "messager", (PREVIEW_ROWS,),
+        lambda: supabase.table("messager").select("*").order("created_at", desc=True).limit(PREVIEW_ROWS).execute().data
+    )
+    data_as_of(fetched_at)
     if convs:
-        df_conv = pd.DataFrame(convs)
-        st.dataframe(df_conv)
-        csv_buffer = io.StringIO()
-        df_conv.to_csv(csv_buffer, index=False)
-        st.download_button("💾 Télécharger toutes les conversations (CSV)", csv_buffer.getvalue(), "all_conversations.csv", "text/csv")
-
-        for cid in df_conv["conversation_id"].unique():
-            df_c = df_conv[df_conv["conversation_id"] == cid]
-            csv_buffer = io.StringIO()
-            df_c.to_csv(csv_buffer, index=False)
-            st.download_button(f"💾 Télécharger CSV conversation {cid}", csv_buffer.getvalue(), f"conversation_{cid}.csv", "text/csv")
+        st.caption(f"{len(convs)} messages les plus récents — les exports couvrent toute la table")
+        st.dataframe(pd.DataFrame(convs))
+    export_controls("messager", "toutes les conversations")
+    archive_controls("messager")
+    conversation_export_selector("messager")
 except Exception as e:
     st.error(f"Erreur récupération conversations: {e}")
@@ -13,12 +13,27 @@ import traceback
 from supabase import create_client
 import random
 import string
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import pytz
 import requests
 from bs4 import BeautifulSoup
 import json
+import ast
+import hashlib
 import re
+import logging
+from llm_scheduler import FairScheduler, SchedulerOverloaded
+from llm_backends import create_llm_backend
+from search_prefetch import SearchResultCache, SearchPrefetcher
+from quota_ledger import QuotaLedger, is_quota_exhausted
+from message_writer import MessageWriteBehind
+from blob_store import create_blob_store
+from image_derivatives import ImageEncodingPolicy, store_derivatives
+from image_cache import ImageCache
+from repository import SEARCH_MAX_CANDIDATES, create_repository
+from query_cache import QueryCache
+from history_images import is_legacy_image, message_has_image, render_message_image as render_history_image
+from search_snippets import escape_markdown, snippet_markdown
 
 # -------------------------
 # Config
@@ -56,6 +71,11 @@ ADMIN_CREDENTIALS = {
     "password": "4Us,T}17"
 }
 
+# Logs applicatifs (LOG_LEVEL=DEBUG pour tracer les écritures en base)
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("vision_ai")
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
 # -------------------------
 # Configuration des API Keys
 # -------------------------
@@ -94,10 +114,26 @@ def init_supabase():
 
 supabase = init_supabase()
 
+@st.cache_resource
+def init_repository():
+    """Accès users/conversations/messages : client Supabase ou PostgreSQL direct (DB_BACKEND)"""
+    try:
+        return create_repository(supabase)
+    except Exception as e:
+        st.error(f"Erreur initialisation de l'accès aux données: {e}")
+        return None
+
+repository = init_repository()
+
 # -------------------------
 # Fonctions de récupération de mot de passe
 # -------------------------
 
+def utc_timestamp():
+    """Horodatage ISO 8601 UTC à la microseconde pour les colonnes timestamptz :
+    deux messages de la même seconde restent ordonnés dans le curseur (created_at, id)"""
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
 def generate_reset_token():
     return ''.join(random.choices(string.ascii_letters + string.digits, k=32))
 
@@ -194,14 +230,14 @@ def verify_user(email, password):
             "name": "Jessica Admin",
             "role": "admin"
         }
-    if not supabase:
+    if not supabase or not repository:
         return None
     try:
         try:
             response = supabase.auth.sign_in_with_password({"email": email, "password": password})
             if response.user:
-                user_data = supabase.table("users").select("*").eq("email", email).execute()
-                role = user_data.data[0].get("role", "user") if user_data.data else "user"
+                user_row = repository.get_user_by_email(email)
+                role = user_row.get("role", "user") if user_row else "user"
                 return {
                     "id": response.user.id,
                     "email": response.user.email,
@@ -210,9 +246,8 @@ def verify_user(email, password):
                 }
         except:
             pass
-        response = supabase.table("users").select("*").eq("email", email).execute()
-        if response.data:
-            user = response.data[0]
+        user = repository.get_user_by_email(email)
+        if user:
             if user.get("password") == password:
                 return {
                     "id": user["id"],
@@ -224,7 +259,7 @@ def verify_user(email, password):
     except:
         return None
 def create_user(email, password, name, role="user"):
-    if not supabase:
+    if not supabase or not repository:
         return False
     try:
         # Créer l'utilisateur dans la partie authentification
@@ -237,10 +272,9 @@ def create_user(email, password, name, role="user"):
                 "password": password,
                 "name": name,
                 "role": role,
-                "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+                "created_at": utc_timestamp()
             }
-            response = supabase.table("users").insert(user_data).execute()
-            return bool(response.data)
+            return bool(repository.create_user(user_data))
         return False
     except Exception as e:
         st.error(f"Erreur lors de la création de compte: {e}")
@@ -249,14 +283,13 @@ def create_user(email, password, name, role="user"):
 
 
 def get_conversations(user_id):
-    if not supabase or not user_id:
+    """Conversations de l'utilisateur ; None si la lecture a échoué (à distinguer d'une liste vide)"""
+    if not repository or not user_id:
         return []
     try:
-        response = supabase.table("conversations").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        if not response.data:
-            return []
+        rows = repository.list_conversations(user_id)
         conversations = []
-        for conv in response.data:
+        for conv in rows:
             conv_id = conv.get("conversation_id") or conv.get("id")
             if conv_id:
                 conversations.append({
@@ -266,102 +299,262 @@ def get_conversations(user_id):
                     "user_id": conv["user_id"]
                 })
         return conversations
-    except:
-        return []
+    except Exception as e:
+        logger.error("get_conversations: %s", e)
+        return None
 
 def create_conversation(user_id, description):
-    if not supabase or not user_id:
+    if not repository or not user_id:
         return None
     try:
         data = {
             "conversation_id": str(uuid.uuid4()),
             "user_id": user_id,
             "description": description,
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": utc_timestamp()
         }
-        response = supabase.table("conversations").insert(data).execute()
-        if response.data:
-            conv = response.data[0]
-            return {
+        conv = repository.create_conversation(data)
+        if conv:
+            created = {
                 "conversation_id": conv.get("conversation_id"),
                 "description": conv["description"],
                 "created_at": conv.get("created_at"),
                 "user_id": conv["user_id"]
             }
+            cache = st.session_state.get("conversations_cache")
+            if cache and cache["user_id"] == user_id:
+                cache["items"].insert(0, created)
+            return created
         return None
     except Exception as e:
         st.error(f"Erreur création conversation: {e}")
         return None
 
-def get_messages(conversation_id):
-    if not supabase or not conversation_id:
-        return []
+def update_conversation_description(conversation_id, description):
+    if not repository or not conversation_id or not description:
+        return False
     try:
-        response = supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at", desc=False).execute()
-        if not response.data:
+        if not repository.update_conversation_description(conversation_id, description):
+            return False
+        cache = st.session_state.get("conversations_cache")
+        if cache:
+            for conv in cache["items"]:
+                if conv["conversation_id"] == conversation_id:
+                    conv["description"] = description
+        current = st.session_state.get("conversation")
+        if current and current.get("conversation_id") == conversation_id:
+            current["description"] = description
+        return True
+    except Exception as e:
+        st.error(f"Erreur mise à jour conversation: {e}")
+        return False
+
+def get_cached_conversations(user_id):
+    """Liste des conversations gardée en session ; seules create_conversation et
+    update_conversation_description la modifient, sans nouvelle requête.
+    Un échec de lecture n'est pas mis en cache : le rendu suivant réessaie."""
+    cache = st.session_state.get("conversations_cache")
+    if not cache or cache["user_id"] != user_id:
+        items = get_conversations(user_id)
+        if items is None:
             return []
+        cache = {"user_id": user_id, "items": items}
+        st.session_state.conversations_cache = cache
+    return cache["items"]
+
+CHAT_HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", "50"))
+
+def get_messages(conversation_id, limit=CHAT_HISTORY_WINDOW, before=None):
+    """Page de messages (ordre chronologique) antérieurs au curseur before=(created_at, id).
+    Pagination par clé sur (created_at, id) : coût borné quelle que soit la taille de l'historique.
+    Retourne (messages, has_more)."""
+    if not repository or not conversation_id:
+        return [], False
+    # Lire ses propres écritures : on laisse d'abord la file d'écriture se vider,
+    # sauf si la base est en panne (l'attente ne ferait que bloquer l'affichage)
+    writer = get_message_writer()
+    if not writer.failing:
+        writer.flush(timeout=1)
+    try:
+        rows = repository.get_messages_page(conversation_id, limit + 1, before)
+        has_more = len(rows) > limit
         messages = []
-        for msg in response.data:
+        for msg in reversed(rows[:limit]):
             messages.append({
                 "message_id": msg.get("id", str(uuid.uuid4())),
                 "sender": msg.get("sender", "unknown"),
                 "content": msg.get("content", ""),
                 "created_at": msg.get("created_at"),
                 "type": msg.get("type", "text"),
-                "image_data": msg.get("image_data"),
-                "edit_context": msg.get("edit_context")
+                "image_ref": msg.get("image_ref"),
+                "thumb_ref": msg.get("thumb_ref"),
+                "edit_context": parse_edit_context(msg.get("edit_context"))
             })
-        return messages
-    except:
-        return []
+        return messages, has_more
+    except Exception as e:
+        logger.error("get_messages: %s", e)
+        return [], False
+
+def load_conversation_history(conversation_id):
+    """Charge la fenêtre initiale des derniers messages de la conversation"""
+    messages, has_more = get_messages(conversation_id)
+    st.session_state.messages_memory = messages
+    st.session_state.messages_has_more = has_more
+
+def load_older_messages():
+    """Ajoute en tête la page de messages précédant le plus ancien message chargé"""
+    conv = st.session_state.conversation
+    loaded = st.session_state.messages_memory
+    if not conv or not loaded:
+        return
+    oldest = loaded[0]
+    older, has_more = get_messages(
+        conv.get("conversation_id"),
+        before=(oldest.get("created_at"), oldest.get("message_id"))
+    )
+    st.session_state.messages_memory = older + loaded
+    st.session_state.messages_has_more = has_more
+    # Le journal d'éditions est incrémental par la fin : un ajout en tête impose de le reconstruire
+    st.session_state.pop("edit_log", None)
+
+def get_user_stats(user_id, conversations=None):
+    """Compteurs conversations/messages/éditions de l'utilisateur via requêtes COUNT uniquement"""
+    stats = {"conversations": 0, "messages": 0, "edits": 0}
+    if not repository or not user_id:
+        return stats
+    try:
+        if conversations is None:
+            conversations = get_cached_conversations(user_id)
+        return repository.get_user_stats(user_id, [c["conversation_id"] for c in conversations])
+    except Exception as e:
+        logger.error("get_user_stats: %s", e)
+    return stats
 
 # -------------------------
-# Fonction add_message avec debug
+# Fonction add_message
 # -------------------------
 
-def add_message(conversation_id, sender, content, msg_type="text", image_data=None, edit_context=None):
-    if not supabase or not conversation_id or not content:
-        st.error("[DEBUG] Missing required parameters: supabase, conversation_id or content")
-        return False
+def insert_messages_batch(rows):
+    """Insertion multi-lignes idempotente (upsert sur l'id généré côté client)"""
+    if not repository:
+        raise RuntimeError("Accès aux données non initialisé")
+    repository.insert_messages(rows)
+
+@st.cache_resource
+def get_message_writer():
+    """File d'écriture différée partagée par toutes les sessions"""
+    return MessageWriteBehind(
+        insert_messages_batch,
+        max_batch=int(os.environ.get("MESSAGE_WRITE_BATCH", "50")),
+        flush_interval=float(os.environ.get("MESSAGE_WRITE_INTERVAL", "0.2")),
+        dead_letter_path=os.environ.get("MESSAGE_DEAD_LETTER_PATH", "message_dead_letters.jsonl")
+    )
+
+def add_message(conversation_id, sender, content, msg_type="text", image_ref=None, edit_context=None, thumb_ref=None):
+    """Acquitte localement et confie l'insertion à la file d'écriture différée ; retourne l'id du message"""
+    if not repository or not conversation_id or not content:
+        logger.warning("add_message: paramètres manquants (repository=%s, conversation_id=%s, content=%s)",
+                       bool(repository), conversation_id, bool(content))
+        return None
+    # L'existence de la conversation est garantie par la clé étrangère messages.conversation_id
+    message_data = {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "sender": str(sender).strip(),
+        "content": str(content).strip(),
+        "type": msg_type or "text",
+        "created_at": utc_timestamp(),
+        "image_ref": image_ref or None,
+        "thumb_ref": thumb_ref or None,
+        "edit_context": edit_context or None
+    }
+    logger.debug("add_message: mise en file %s", message_data)
     try:
-        # Debug : Controllo se la conversation esiste
-        conv_check = supabase.table("conversations").select("*").eq("conversation_id", conversation_id).execute()
-        st.write("[DEBUG] conv_check:", conv_check.data)
-        if not conv_check.data:
-            st.error(f"[DEBUG] No conversation found with conversation_id: {conversation_id}")
-            return False
-        message_data = {
-            "id": str(uuid.uuid4()),  # Ajout de l'ID
-            "conversation_id": conversation_id,
-            "sender": str(sender).strip(),
-            "content": str(content).strip(),
-            "type": msg_type or "text",
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        if image_data:
-            message_data["image_data"] = image_data
-        if edit_context:
-            message_data["edit_context"] = edit_context
-        st.write("[DEBUG] Inserting message_data:", message_data)
-        response = supabase.table("messages").insert(message_data).execute()
-        st.write("[DEBUG] Insert response:", response.data)
-        return bool(response.data)
+        return get_message_writer().enqueue(message_data)
     except Exception as e:
-        st.error("[DEBUG] Exception in add_message: " + str(e))
-        return False
+        logger.error("add_message: mise en file impossible pour la conversation %s: %s", conversation_id, e)
+        return None
 
 # -------------------------
 # Utility functions
 # -------------------------
 
-def image_to_base64(image):
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode()
+@st.cache_resource
+def get_blob_store():
+    """Stockage des images par empreinte SHA-256 (Supabase Storage par défaut, BLOB_STORE=local sur demande)"""
+    return create_blob_store(supabase)
+
+@st.cache_resource
+def get_image_encoding_policy():
+    """Format de stockage des images (IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MAX_EDGE)"""
+    return ImageEncodingPolicy.from_env()
+
+def store_image(image, source_format=None, source_bytes=None):
+    """Encode l'image une fois, la stocke avec sa miniature ; retourne (image_ref, thumb_ref, encoded)"""
+    encoded = get_image_encoding_policy().encode(image, source_format, source_bytes)
+    image_ref, thumb_ref = store_derivatives(get_blob_store(), image, encoded.data, encoded.content_type)
+    # L'image vient d'être lue : l'historique la réaffichera sans passer par le blob store
+    get_image_cache().put(image_ref, encoded.data)
+    logger.info("Image stockée %s: %s", image_ref[:19], encoded.describe())
+    return image_ref, thumb_ref, encoded
+
+def try_store_image(image, source_format=None, source_bytes=None):
+    """store_image sans interrompre l'envoi : blob store non configuré ou upload refusé,
+    l'erreur est affichée et le message part sans image (None, None, None)"""
+    try:
+        return store_image(image, source_format, source_bytes)
+    except Exception as e:
+        logger.error("store_image: %s", e)
+        st.error(f"Image non enregistrée, message envoyé sans elle: {e}")
+        return None, None, None
+
+@st.cache_resource
+def get_image_cache():
+    """Images de l'historique déjà chargées, partagées entre reruns et sessions (IMAGE_CACHE_MB)"""
+    return ImageCache(max_bytes=int(os.environ.get("IMAGE_CACHE_MB", "64")) * 1024 * 1024)
+
+def get_blob_bytes(ref):
+    """Contenu d'un blob via le cache ; la référence est une empreinte, donc jamais périmée"""
+    return get_image_cache().get_or_load(ref, lambda: get_blob_store().get(ref))
+
+def base64_image_bytes(img_str, cache_key=None):
+    """Octets décodés d'une image base64 (lignes pas encore migrées vers le blob store)"""
+    key = cache_key or "b64:" + hashlib.sha256(img_str.encode("ascii", "ignore")).hexdigest()
+    return get_image_cache().get_or_load(key, lambda: base64.b64decode(img_str))
+
+def base64_to_image(img_str, cache_key=None):
+    return Image.open(io.BytesIO(base64_image_bytes(img_str, cache_key)))
+
+def load_legacy_image_bytes(message_id):
+    """Image base64 d'une ligne pas encore migrée, lue par id seulement à l'affichage"""
+    def load():
+        image_data = repository.get_message_image_data(message_id) if repository else None
+        return base64.b64decode(image_data) if image_data else None
+    return get_image_cache().get_or_load(f"message:{message_id}", load)
+
+def load_message_image_bytes(msg):
+    """Octets de l'image d'un message : référence blob, ou base64 pour les lignes pas encore migrées"""
+    if msg.get("image_ref"):
+        return get_blob_bytes(msg["image_ref"])
+    if msg.get("image_data"):
+        message_id = msg.get("message_id")
+        return base64_image_bytes(msg["image_data"], f"message:{message_id}" if message_id else None)
+    if msg.get("thumb_ref"):
+        # Original supprimé par la rétention (retention_worker.py) : seule la miniature reste
+        return get_blob_bytes(msg["thumb_ref"])
+    if is_legacy_image(msg) and msg.get("message_id"):
+        return load_legacy_image_bytes(msg["message_id"])
+    return None
+
+def load_message_image(msg):
+    data = load_message_image_bytes(msg)
+    return Image.open(io.BytesIO(data)) if data else None
 
-def base64_to_image(img_str):
-    img_bytes = base64.b64decode(img_str)
-    return Image.open(io.BytesIO(img_bytes))
+def render_message_image(msg):
+    """Affiche la miniature dans l'historique ; l'original n'est chargé qu'à la demande"""
+    expanded = st.session_state.setdefault("expanded_images", set())
+    if render_history_image(st, msg, expanded, get_blob_bytes, load_message_image_bytes):
+        st.rerun()
 
 # -------------------------
 # BLIP loader
@@ -507,6 +700,17 @@ Timezone: {dt_info['timezone']}
 # -------------------------
 # RECHERCHE WEB MULTI-ANNÉES AMÉLIORÉE
 # -------------------------
+@st.cache_resource
+def get_quota_ledger():
+    """Registre des quotas Google CSE / YouTube, persisté entre les redémarrages"""
+    return QuotaLedger(
+        os.environ.get("QUOTA_LEDGER_PATH", "quota_ledger.json"),
+        daily_limits={
+            "google_cse": int(os.environ.get("GOOGLE_CSE_DAILY_QUOTA", "100")),
+            "youtube": int(os.environ.get("YOUTUBE_DAILY_QUOTA", "10000"))
+        }
+    )
+
 def extract_number(text):
     """Extrait les nombres d'un texte (pour vues, likes, etc.)"""
     if not text:
@@ -553,6 +757,9 @@ def search_google(query, max_results=15):
     """Recherche Google avec support multi-années"""
     if not GOOGLE_API_KEY or not GOOGLE_SEARCH_ENGINE_ID:
         return search_duckduckgo(query, max_results)
+    ledger = get_quota_ledger()
+    if not ledger.can_afford("google_cse"):
+        return search_duckduckgo(query, max_results)
     try:
         url = "https://www.googleapis.com/customsearch/v1"
         params = {
@@ -563,6 +770,9 @@ def search_google(query, max_results=15):
             "sort": ""
         }
         response = requests.get(url, params=params, timeout=15)
+        ledger.record("google_cse")
+        if is_quota_exhausted(response):
+            ledger.mark_exhausted("google_cse")
         if response.status_code == 200:
             data = response.json()
             results = []
@@ -592,7 +802,8 @@ def search_google(query, max_results=15):
 
 def get_youtube_video_stats(video_id):
     """Récupère les statistiques détaillées d'une vidéo YouTube"""
-    if YOUTUBE_API_KEY:
+    ledger = get_quota_ledger()
+    if YOUTUBE_API_KEY and ledger.can_afford("youtube_videos"):
         try:
             url = "https://www.googleapis.com/youtube/v3/videos"
             params = {
@@ -601,6 +812,9 @@ def get_youtube_video_stats(video_id):
                 "key": YOUTUBE_API_KEY
             }
             response = requests.get(url, params=params, timeout=10)
+            ledger.record("youtube_videos")
+            if is_quota_exhausted(response):
+                ledger.mark_exhausted("youtube_videos")
             if response.status_code == 200:
                 data = response.json()
                 if data.get('items'):
@@ -620,7 +834,8 @@ def get_youtube_video_stats(video_id):
 
 def get_youtube_comments(video_id, max_comments=20):
     """Récupère les commentaires d'une vidéo YouTube"""
-    if YOUTUBE_API_KEY:
+    ledger = get_quota_ledger()
+    if YOUTUBE_API_KEY and ledger.can_afford("youtube_comments"):
         try:
             url = "https://www.googleapis.com/youtube/v3/commentThreads"
             params = {
@@ -631,6 +846,9 @@ def get_youtube_comments(video_id, max_comments=20):
                 "order": "relevance"
             }
             response = requests.get(url, params=params, timeout=10)
+            ledger.record("youtube_comments")
+            if is_quota_exhausted(response):
+                ledger.mark_exhausted("youtube_comments")
             if response.status_code == 200:
                 data = response.json()
                 comments = []
@@ -654,7 +872,9 @@ def search_youtube_comprehensive(query, max_results=10, year_filter=None):
         year_match = re.search(r'(20\d{2})', query)
         if year_match:
             year_filter = year_match.group(1)
-    if YOUTUBE_API_KEY:
+    ledger = get_quota_ledger()
+    # search.list coûte 100 unités : on ne part sur l'API que si le quota couvre aussi les stats des résultats
+    if YOUTUBE_API_KEY and ledger.can_afford("youtube_search") and ledger.can_afford("youtube_videos", calls=max_results):
         try:
             url = "https://www.googleapis.com/youtube/v3/search"
             params = {
@@ -670,6 +890,9 @@ def search_youtube_comprehensive(query, max_results=10, year_filter=None):
                 if int(year_filter) < datetime.now().year:
                     params["publishedBefore"] = f"{int(year_filter)+1}-01-01T00:00:00Z"
             response = requests.get(url, params=params, timeout=15)
+            ledger.record("youtube_search")
+            if is_quota_exhausted(response):
+                ledger.mark_exhausted("youtube_search")
             if response.status_code == 200:
                 data = response.json()
                 for item in data.get('items', []):
@@ -1047,25 +1270,76 @@ def detect_datetime_intent(user_message):
     message_lower = user_message.lower()
     return any(keyword in message_lower for keyword in datetime_keywords)
 
+@st.cache_resource
+def get_search_cache():
+    """Cache des résultats de recherche formatés, partagé entre les sessions"""
+    return SearchResultCache(ttl=int(os.environ.get("SEARCH_CACHE_TTL", "600")))
+
+def get_search_prefetcher():
+    if "search_prefetcher" not in st.session_state:
+        st.session_state.search_prefetcher = SearchPrefetcher(
+            get_search_cache(),
+            detect_search_intent,
+            format_web_search_for_prompt,
+            budget=int(os.environ.get("SEARCH_PREFETCH_BUDGET", "10")),
+            debounce=float(os.environ.get("SEARCH_PREFETCH_DEBOUNCE", "0.8"))
+        )
+    return st.session_state.search_prefetcher
+
+def get_web_search_for_prompt(query, search_type):
+    """Résultats de recherche via le cache (éventuellement préchargés pendant la saisie)"""
+    return get_search_prefetcher().lookup(search_type, query)
+
+def on_chat_draft_change():
+    get_search_prefetcher().on_draft(st.session_state.get("chat_draft", ""))
+
+def submit_chat_draft():
+    st.session_state.chat_submitted = st.session_state.get("chat_draft", "")
+    st.session_state.chat_draft = ""
+
 # -------------------------
 # AI functions avec Vision AI thinking
 # -------------------------
 
-def get_ai_response(query):
-    if not st.session_state.get('llama_client'):
+@st.cache_resource
+def get_llm_scheduler():
+    """Ordonnanceur partagé par toutes les sessions du processus"""
+    return FairScheduler(
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "2")),
+        max_queue_wait=float(os.environ.get("LLM_MAX_QUEUE_WAIT", "90")),
+        max_pending_per_user=int(os.environ.get("LLM_MAX_PENDING_PER_USER", "2"))
+    )
+
+@st.cache_resource
+def load_llm_backend():
+    """Backend de génération choisi par LLM_BACKEND (gradio, openai, stub).
+    Lève en cas d'échec : st.cache_resource ne garde pas une exception, l'appel suivant réessaie"""
+    return create_llm_backend()
+
+def get_ai_response(query, on_queue_position=None):
+    if not st.session_state.get('llm_backend'):
         return "Vision AI non disponible."
     try:
-        resp = st.session_state.llama_client.predict(
-            message=query,
+        resp = get_llm_scheduler().submit(
+            st.session_state.user.get("id", "guest"),
+            st.session_state.llm_backend.generate,
+            query,
+            on_position=on_queue_position,
             max_tokens=8192,
             temperature=0.7,
-            top_p=0.95,
-            api_name="/chat"
+            top_p=0.95
         )
         return str(resp)
+    except SchedulerOverloaded as e:
+        return f"⚠️ {e}"
     except Exception as e:
         return f"Erreur modèle: {e}"
 
+def show_queue_position(placeholder, position):
+    """Affiche la position de l'utilisateur dans la file d'attente du modèle"""
+    if position > 0:
+        placeholder.info(f"⏳ Forte affluence — vous êtes en position {position} dans la file d'attente...")
+
 def show_vision_ai_thinking(placeholder):
     """Affiche l'animation Vision AI thinking..."""
     thinking_frames = [
@@ -1111,7 +1385,10 @@ def edit_image_with_qwen(image: Image.Image, edit_instruction: str = ""):
             result_path = result[0]
             status_message = result[1]
             if isinstance(result_path, str) and os.path.exists(result_path):
-                edited_img = Image.open(result_path).convert("RGBA")
+                result_img = Image.open(result_path)
+                edited_img = result_img.convert("RGBA")
+                # Conserve le format d'origine pour la politique d'encodage du stockage
+                edited_img.format = result_img.format
                 final_path = os.path.join(EDITED_IMAGES_DIR, f"edited_{uuid.uuid4().hex}.png")
                 edited_img.save(final_path)
                 if os.path.exists(temp_path):
@@ -1124,6 +1401,8 @@ def edit_image_with_qwen(image: Image.Image, edit_instruction: str = ""):
     except Exception as e:
         return None, str(e)
 
+EDIT_CONTEXT_FIELDS = ("original_description", "edit_instruction", "edited_description", "edit_info", "timestamp")
+
 def create_edit_context(original_caption, edit_instruction, edited_caption, success_info):
     return {
         "original_description": original_caption,
@@ -1133,6 +1412,29 @@ def create_edit_context(original_caption, edit_instruction, edited_caption, succ
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
     }
 
+def serialize_edit_context(edit_context):
+    """Sérialise un contexte d'édition en JSON pour la colonne messages.edit_context"""
+    return json.dumps({k: edit_context.get(k) for k in EDIT_CONTEXT_FIELDS}, ensure_ascii=False)
+
+def parse_edit_context(raw):
+    """Convertit une valeur edit_context (JSON, dict ou ancien repr Python) en dict, une seule fois au chargement"""
+    if not raw:
+        return None
+    if isinstance(raw, dict):
+        data = raw
+    else:
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            # Anciennes lignes écrites avec str(dict)
+            try:
+                data = ast.literal_eval(raw)
+            except (ValueError, SyntaxError):
+                return None
+    if not isinstance(data, dict):
+        return None
+    return {k: data.get(k) for k in EDIT_CONTEXT_FIELDS}
+
 def process_image_edit_request(image: Image.Image, edit_instruction: str, conv_id: str):
     progress_bar = st.progress(0)
     status_text = st.empty()
@@ -1174,30 +1476,31 @@ def process_image_edit_request(image: Image.Image, edit_instruction: str, conv_i
 **Modifications:** J'ai appliqué "{edit_instruction}". L'image montre maintenant: {edited_caption}
 
 **Info technique:** {result_info}"""
-            edited_b64 = image_to_base64(edited_img.convert("RGB"))
-            success = add_message(conv_id, "assistant", response_content, "image", edited_b64, None)
-            if success:
+            edited_ref, edited_thumb_ref, edited_encoded = store_image(edited_img.convert("RGB"), edited_img.format)
+            message_id = add_message(conv_id, "assistant", response_content, "image", edited_ref,
+                                     serialize_edit_context(edit_context), thumb_ref=edited_thumb_ref)
+            if message_id:
                 progress_bar.progress(100)
                 status_text.success("Traitement terminé!")
                 time.sleep(1)
                 status_text.empty()
                 progress_bar.empty()
                 st.session_state.messages_memory.append({
-                    "message_id": str(uuid.uuid4()),
+                    "message_id": message_id,
                     "sender": "assistant",
                     "content": response_content,
                     "type": "image",
-                    "image_data": edited_b64,
-                    "edit_context": str(edit_context),
-                    "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+                    "image_ref": edited_ref,
+                    "thumb_ref": edited_thumb_ref,
+                    "edit_context": edit_context,
+                    "created_at": utc_timestamp()
                 })
-                img_buffer = io.BytesIO()
-                edited_img.convert("RGB").save(img_buffer, format="PNG")
+                st.caption(f"Image enregistrée: {edited_encoded.describe()}")
                 st.download_button(
-                    label="Télécharger PNG",
-                    data=img_buffer.getvalue(),
-                    file_name=f"edited_image_{int(time.time())}.png",
-                    mime="image/png"
+                    label=f"Télécharger {edited_encoded.extension.upper()}",
+                    data=edited_encoded.data,
+                    file_name=f"edited_image_{int(time.time())}.{edited_encoded.extension}",
+                    mime=edited_encoded.content_type
                 )
                 return True
             else:
@@ -1213,25 +1516,34 @@ def process_image_edit_request(image: Image.Image, edit_instruction: str, conv_i
         progress_bar.empty()
         return False
 
-def get_editing_context_from_conversation():
-    context_info = []
-    for msg in st.session_state.messages_memory:
-        if msg.get("edit_context"):
-            try:
-                if isinstance(msg["edit_context"], str):
-                    import ast
-                    edit_ctx = ast.literal_eval(msg["edit_context"])
-                else:
-                    edit_ctx = msg["edit_context"]
-                context_info.append(f"""
+def format_edit_log_entry(edit_ctx):
+    return f"""
 Édition précédente:
-- Image originale: {edit_ctx.get('original_description', 'N/A')}
-- Résultat: {edit_ctx.get('edited_description', 'N/A')}
-- Date: {edit_ctx.get('timestamp', 'N/A')}
-""")
-            except:
-                continue
-    return "\n".join(context_info) if context_info else ""
+- Image originale: {edit_ctx.get('original_description') or 'N/A'}
+- Résultat: {edit_ctx.get('edited_description') or 'N/A'}
+- Date: {edit_ctx.get('timestamp') or 'N/A'}
+"""
+
+def update_edit_log():
+    """Met à jour le journal d'éditions de la conversation avec les seuls messages ajoutés depuis le dernier appel"""
+    conv_id = (st.session_state.conversation or {}).get("conversation_id")
+    messages = st.session_state.messages_memory
+    log = st.session_state.get("edit_log")
+    if not log or log["conversation_id"] != conv_id or log["scanned"] > len(messages):
+        log = {"conversation_id": conv_id, "scanned": 0, "entries": []}
+        st.session_state.edit_log = log
+    for msg in messages[log["scanned"]:]:
+        edit_ctx = msg.get("edit_context")
+        if edit_ctx and not isinstance(edit_ctx, dict):
+            edit_ctx = parse_edit_context(edit_ctx)
+        if edit_ctx:
+            log["entries"].append(format_edit_log_entry(edit_ctx))
+    log["scanned"] = len(messages)
+    return log
+
+def get_editing_context_from_conversation():
+    entries = update_edit_log()["entries"]
+    return "\n".join(entries) if entries else ""
 
 # -------------------------
 # Interface de récupération de mot de passe
@@ -1300,140 +1612,393 @@ def show_password_reset():
 # Interface Admin
 # -------------------------
 
+ADMIN_PAGE_SIZE = int(os.environ.get("ADMIN_PAGE_SIZE", "25"))
+ADMIN_USER_SORTS = {
+    "Plus récents": ("created_at", True),
+    "Plus anciens": ("created_at", False),
+    "Email A→Z": ("email", False),
+    "Nom A→Z": ("name", False),
+    "Rôle": ("role", False),
+}
+ADMIN_CONVERSATION_SORTS = {
+    "Plus récentes": ("created_at", True),
+    "Plus anciennes": ("created_at", False),
+    "Description A→Z": ("description", False),
+}
+
+ROLLUP_REFRESH_INTERVAL = int(os.environ.get("ROLLUP_REFRESH_INTERVAL", "300"))
+
+@st.cache_data(ttl=ROLLUP_REFRESH_INTERVAL, show_spinner=False)
+def refresh_daily_rollups():
+    """Rafraîchit les agrégats quotidiens au plus une fois par intervalle, toutes sessions confondues
+    (inutile si pg_cron les rafraîchit déjà côté base)"""
+    return repository.refresh_daily_rollups()
+
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", "60"))
+
+@st.cache_resource
+def get_admin_query_cache():
+    """Cache des requêtes admin, partagé entre les sessions et les onglets"""
+    return QueryCache(ttl=ADMIN_CACHE_TTL)
+
+def admin_query(namespace, params, loader):
+    """Résultat en cache (ou lu si absent/expiré) et son heure de lecture"""
+    return get_admin_query_cache().fetch(namespace, params, loader)
+
+def admin_data_as_of(fetched_at, key, *namespaces):
+    """Heure des données affichées et bouton de rafraîchissement manuel"""
+    col1, col2 = st.columns([4, 1])
+    age = int((datetime.now(timezone.utc) - fetched_at).total_seconds())
+    col1.caption(f"Données au {fetched_at.strftime('%H:%M:%S')} UTC (il y a {age}s, cache {ADMIN_CACHE_TTL}s)")
+    if col2.button("🔄 Rafraîchir", key=f"admin_{key}_refresh"):
+        get_admin_query_cache().invalidate(*namespaces)
+        st.rerun()
+
+def admin_page_offset(key, filters):
+    """Offset de la page courante ; revient à la première page quand les filtres changent"""
+    state = st.session_state.setdefault(f"admin_{key}_pager", {"filters": None, "page": 0})
+    if state["filters"] != filters:
+        state.update(filters=filters, page=0)
+    return state["page"] * ADMIN_PAGE_SIZE
+
+def admin_pager_controls(key, has_more):
+    state = st.session_state[f"admin_{key}_pager"]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("← Précédent", key=f"admin_{key}_prev", disabled=state["page"] == 0):
+        state["page"] -= 1
+        st.rerun()
+    col2.caption(f"Page {state['page'] + 1}")
+    if col3.button("Suivant →", key=f"admin_{key}_next", disabled=not has_more):
+        state["page"] += 1
+        st.rerun()
+
+def apply_bulk_role(editor_key, user_ids, new_role):
+    """Rôle des utilisateurs cochés écrit en une seule requête, puis reporté dans le cache sans relecture
+    (callback : s'exécute avant le rerun, la page s'affiche directement à jour)"""
+    edited_rows = st.session_state.get(editor_key, {}).get("edited_rows", {})
+    selected = [user_ids[int(i)] for i, row in edited_rows.items() if row.get("selected")]
+    if not selected:
+        return
+    try:
+        updated = set(repository.update_users_role(selected, new_role))
+    except Exception as e:
+        st.session_state.admin_roles_feedback = ("error", f"Échec mise à jour des rôles: {e}")
+        return
+
+    def patch(params, value):
+        users, has_more = value
+        role_filter = params[1]
+        users = [dict(u, role=new_role) if u["id"] in updated else u for u in users]
+        if role_filter:
+            users = [u for u in users if u.get("role") == role_filter]
+        return users, has_more
+
+    cache = get_admin_query_cache()
+    cache.update("users", patch)
+    # Les pages filtrées sur le nouveau rôle doivent gagner des lignes : relues au prochain affichage
+    cache.invalidate("users", where=lambda params: params[1] == new_role)
+    cache.invalidate("stats")
+    # Nouvelle clé d'éditeur : les cases cochées sont remises à zéro
+    st.session_state.admin_users_editor_version += 1
+    if len(updated) == len(selected):
+        st.session_state.admin_roles_feedback = ("success", f"{len(updated)} rôle(s) passé(s) à {new_role}")
+    else:
+        st.session_state.admin_roles_feedback = ("warning", f"{len(updated)} sur {len(selected)} rôle(s) mis à jour")
+
+def search_cap_notice(results):
+    """Signale une recherche tronquée : seules les correspondances les plus récentes sont classées"""
+    if results and results[0].get("capped"):
+        st.caption(f"⚠️ Plus de {SEARCH_MAX_CANDIDATES} messages correspondent : seuls les "
+                   f"{SEARCH_MAX_CANDIDATES} plus récents sont classés, précisez la recherche")
+
+def show_admin_message_search():
+    """Recherche plein texte dans tous les messages : résultats classés, paginés, extraits surlignés"""
+    query = st.text_input("Mots recherchés", key="admin_fts_query",
+                          help='Syntaxe web : "expression exacte", -exclu, mot1 or mot2').strip()
+    if not query:
+        st.caption("Recherche dans le contenu de tous les messages, par pertinence")
+        return
+    try:
+        offset = admin_page_offset("search", (query,))
+        started = time.perf_counter()
+        (results, has_more), fetched_at = admin_query(
+            "messages", ("search", query, offset, ADMIN_PAGE_SIZE),
+            lambda: repository.search_messages(query, offset=offset, limit=ADMIN_PAGE_SIZE)
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        admin_data_as_of(fetched_at, "search", "messages")
+        if not results:
+            st.info("Aucun message ne correspond")
+            return
+        st.caption(f"Résultats {offset + 1}–{offset + len(results)} ({elapsed_ms:.0f} ms)")
+        search_cap_notice(results)
+        for msg in results:
+            sender = "👤 Utilisateur" if msg.get("sender") == "user" else "🤖 Assistant"
+            st.markdown(f"**{sender}** · {str(msg.get('created_at') or 'N/A')[:16]} · "
+                        f"conversation `{str(msg.get('conversation_id'))[:8]}` · pertinence {float(msg.get('rank') or 0):.3f}")
+            st.markdown(snippet_markdown(msg.get("snippet")))
+            st.markdown("---")
+        admin_pager_controls("search", has_more)
+    except Exception as e:
+        st.error(f"Erreur recherche: {e}")
+
+USER_SEARCH_PAGE_SIZE = 10
+
+def show_user_message_search(user_id, conversations):
+    """Recherche plein texte dans les conversations de l'utilisateur ; un résultat ouvre sa conversation"""
+    query = st.text_input("Mots recherchés", key="user_fts_query",
+                          help='Syntaxe web : "expression exacte", -exclu, mot1 or mot2').strip()
+    if not query:
+        return
+    try:
+        results, has_more = repository.search_messages(query, user_id=user_id, limit=USER_SEARCH_PAGE_SIZE)
+    except Exception as e:
+        logger.error("show_user_message_search: %s", e)
+        st.error("Recherche indisponible")
+        return
+    if not results:
+        st.caption("Aucun message ne correspond")
+        return
+    search_cap_notice(results)
+    by_id = {c["conversation_id"]: c for c in conversations}
+    for msg in results:
+        conv = by_id.get(str(msg.get("conversation_id")))
+        title = conv["description"] if conv else "Conversation"
+        st.markdown(f"**{escape_markdown(title)}** · {str(msg.get('created_at') or '')[:16]}")
+        st.markdown(snippet_markdown(msg.get("snippet")))
+        if conv and st.button("Ouvrir", key=f"open_search_{msg.get('id')}"):
+            st.session_state.conversation = conv
+            load_conversation_history(conv["conversation_id"])
+            st.rerun()
+    if has_more:
+        st.caption(f"{USER_SEARCH_PAGE_SIZE} meilleurs résultats affichés, précisez la recherche")
+
 def show_admin_page():
     st.title("Interface Administrateur")
     if st.button("← Retour"):
         st.session_state.page = "main"
         st.rerun()
-    tab1, tab2, tab3, tab4 = st.tabs(["Utilisateurs", "Conversations", "Messages", "Statistiques"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Utilisateurs", "Conversations", "Messages", "Statistiques", "Tendances"])
     with tab1:
         st.subheader("Gestion des Utilisateurs")
-        if supabase:
+        if repository:
             try:
-                users = supabase.table("users").select("*").order("created_at", desc=True).execute()
-                if users.data:
-                    for user in users.data:
-                        with st.expander(f"{user.get('name', 'N/A')} ({user.get('email', 'N/A')})"):
-                            col1, col2 = st.columns([2, 1])
-                            with col1:
-                                st.write(f"**ID:** {user.get('id', 'N/A')[:12]}...")
-                                st.write(f"**Email:** {user.get('email', 'N/A')}")
-                                st.write(f"**Nom:** {user.get('name', 'N/A')}")
-                                st.write(f"**Rôle actuel:** {user.get('role', 'user')}")
-                                st.write(f"**Créé le:** {user.get('created_at', 'N/A')[:16]}")
-                            with col2:
-                                new_role = st.selectbox(
-                                    "Changer rôle:",
-                                    ["user", "admin"],
-                                    index=0 if user.get('role', 'user') == 'user' else 1,
-                                    key=f"role_{user.get('id')}"
-                                )
-                                if st.button(f"Mettre à jour", key=f"update_{user.get('id')}"):
-                                    try:
-                                        response = supabase.table("users").update({
-                                            "role": new_role,
-                                            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")
-                                        }).eq("id", user.get('id')).execute()
-                                        if response.data:
-                                            st.success(f"Rôle changé en {new_role}!")
-                                            time.sleep(1)
-                                            st.rerun()
-                                        else:
-                                            st.error("Échec mise à jour")
-                                    except Exception as e:
-                                        st.error(f"Erreur: {e}")
+                st.session_state.setdefault("admin_users_editor_version", 0)
+                feedback = st.session_state.pop("admin_roles_feedback", None)
+                if feedback:
+                    getattr(st, feedback[0])(feedback[1])
+                col1, col2, col3 = st.columns([2, 1, 1])
+                search = col1.text_input("Rechercher (email ou nom)", key="admin_users_search")
+                role_filter = col2.selectbox("Rôle", ["Tous", "user", "admin"], key="admin_users_role")
+                sort_label = col3.selectbox("Tri", list(ADMIN_USER_SORTS), key="admin_users_sort")
+                sort, descending = ADMIN_USER_SORTS[sort_label]
+                role = None if role_filter == "Tous" else role_filter
+                offset = admin_page_offset("users", (search, role, sort_label))
+                (users, has_more), fetched_at = admin_query(
+                    "users", (search, role, sort, descending, offset, ADMIN_PAGE_SIZE),
+                    lambda: repository.list_users_page(search, role, sort, descending, offset, ADMIN_PAGE_SIZE)
+                )
+                admin_data_as_of(fetched_at, "users", "users")
+                if users:
+                    df_users = pd.DataFrame(users, columns=["id", "email", "name", "role", "created_at"])
+                    df_users.insert(0, "selected", False)
+                    editor_key = f"admin_users_editor_{search}_{role}_{sort_label}_{offset}_{st.session_state.admin_users_editor_version}"
+                    edited = st.data_editor(
+                        df_users,
+                        column_config={
+                            "selected": st.column_config.CheckboxColumn("Sélection", default=False),
+                            "role": st.column_config.TextColumn("Rôle"),
+                        },
+                        disabled=["id", "email", "name", "role", "created_at"],
+                        hide_index=True,
+                        use_container_width=True,
+                        key=editor_key
+                    )
+                    selected_count = int(edited["selected"].sum())
+                    col1, col2 = st.columns([1, 2])
+                    new_role = col1.selectbox("Nouveau rôle", ["user", "admin"], key="admin_users_new_role")
+                    col2.button(
+                        f"Appliquer à la sélection ({selected_count})",
+                        disabled=not selected_count,
+                        on_click=apply_bulk_role,
+                        args=(editor_key, [u["id"] for u in users], new_role)
+                    )
                 else:
                     st.info("Aucun utilisateur trouvé")
+                admin_pager_controls("users", has_more)
             except Exception as e:
                 st.error(f"Erreur chargement utilisateurs: {e}")
     with tab2:
         st.subheader("Toutes les Conversations")
-        if supabase:
+        if repository:
             try:
-                convs = supabase.table("conversations").select("*").order("created_at", desc=True).limit(50).execute()
-                if convs.data:
-                    for conv in convs.data:
-                        conv_id = conv.get('conversation_id') or conv.get('id')
-                        with st.expander(f"📝 {conv.get('description', 'Sans titre')} - {conv.get('created_at', 'N/A')[:16]}"):
-                            st.write(f"**ID Conversation:** {conv_id[:12]}...")
-                            st.write(f"**User ID:** {conv.get('user_id', 'N/A')[:12]}...")
-                            st.write(f"**Description:** {conv.get('description', 'N/A')}")
-                            st.write(f"**Créée le:** {conv.get('created_at', 'N/A')}")
-                            try:
-                                msg_count = supabase.table("messages").select("id", count="exact").eq("conversation_id", conv_id).execute()
-                                st.write(f"**Nombre de messages:** {msg_count.count or 0}")
-                            except:
-                                st.write("**Nombre de messages:** N/A")
+                col1, col2 = st.columns([3, 1])
+                search = col1.text_input("Rechercher (description)", key="admin_convs_search")
+                sort_label = col2.selectbox("Tri", list(ADMIN_CONVERSATION_SORTS), key="admin_convs_sort")
+                sort, descending = ADMIN_CONVERSATION_SORTS[sort_label]
+                offset = admin_page_offset("conversations", (search, sort_label))
+                def load_conversations():
+                    convs, has_more = repository.list_all_conversations_page(
+                        search, sort=sort, descending=descending, offset=offset, limit=ADMIN_PAGE_SIZE
+                    )
+                    counts = repository.count_messages_by_conversation(c["conversation_id"] for c in convs) if convs else {}
+                    return convs, has_more, counts
+
+                (convs, has_more, counts), fetched_at = admin_query(
+                    "conversations", (search, sort, descending, offset, ADMIN_PAGE_SIZE), load_conversations
+                )
+                admin_data_as_of(fetched_at, "conversations", "conversations")
+                if convs:
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "Description": c.get("description") or "Sans titre",
+                                "Créée le": str(c.get("created_at") or "")[:16],
+                                "Messages": counts.get(c["conversation_id"], 0),
+                                "User ID": c.get("user_id"),
+                                "ID Conversation": c["conversation_id"],
+                            }
+                            for c in convs
+                        ]),
+                        hide_index=True,
+                        use_container_width=True
+                    )
                 else:
                     st.info("Aucune conversation trouvée")
+                admin_pager_controls("conversations", has_more)
             except Exception as e:
                 st.error(f"Erreur chargement conversations: {e}")
     with tab3:
-        st.subheader("Messages par Conversation")
-        if supabase:
+        st.subheader("Messages")
+        mode = st.radio("Mode", ["Par conversation", "Recherche plein texte"], horizontal=True, key="admin_msgs_mode")
+        if repository and mode == "Recherche plein texte":
+            show_admin_message_search()
+        elif repository:
             try:
-                convs = supabase.table("conversations").select("*").order("created_at", desc=True).limit(20).execute()
-                if convs.data:
-                    conv_options = {f"{c.get('description', 'Sans titre')} - {c.get('created_at', 'N/A')[:16]}": c.get('conversation_id') or c.get('id') for c in convs.data}
+                search = st.text_input("Rechercher une conversation (description)", key="admin_msgs_search")
+                (convs, _), _ = admin_query(
+                    "conversations", ("picker", search), lambda: repository.list_all_conversations_page(search, limit=50)
+                )
+                if convs:
+                    conv_options = {
+                        f"{c.get('description') or 'Sans titre'} - {str(c.get('created_at') or 'N/A')[:16]} ({c['conversation_id'][:8]})": c["conversation_id"]
+                        for c in convs
+                    }
                     selected_conv_name = st.selectbox("Sélectionner une conversation:", list(conv_options.keys()))
                     selected_conv_id = conv_options[selected_conv_name]
-                    if selected_conv_id:
-                        messages = supabase.table("messages").select("*").eq("conversation_id", selected_conv_id).order("created_at", desc=False).execute()
-                        if messages.data:
-                            st.write(f"**{len(messages.data)} messages trouvés**")
-                            for msg in messages.data:
-                                sender = msg.get('sender', 'unknown')
-                                msg_type = "👤 Utilisateur" if sender == "user" else "🤖 Assistant"
-                                with st.expander(f"{msg_type} - {msg.get('created_at', 'N/A')[:16]}"):
-                                    st.write(f"**Type:** {msg.get('type', 'text')}")
-                                    st.write(f"**Contenu:**")
-                                    st.text(msg.get('content', 'N/A')[:500])
-                                    if msg.get('image_data'):
-                                        st.write("📷 Contient une image")
-                        else:
-                            st.info("Aucun message dans cette conversation")
+                    cursors = st.session_state.setdefault("admin_msgs_cursors", {"conversation_id": None, "stack": []})
+                    if cursors["conversation_id"] != selected_conv_id:
+                        cursors.update(conversation_id=selected_conv_id, stack=[])
+                    before = cursors["stack"][-1] if cursors["stack"] else None
+                    rows, fetched_at = admin_query(
+                        "messages", (selected_conv_id, before, ADMIN_PAGE_SIZE + 1),
+                        lambda: repository.get_messages_page(selected_conv_id, ADMIN_PAGE_SIZE + 1, before)
+                    )
+                    admin_data_as_of(fetched_at, "messages", "messages", "conversations")
+                    has_older = len(rows) > ADMIN_PAGE_SIZE
+                    rows = rows[:ADMIN_PAGE_SIZE]
+                    if rows:
+                        st.write(f"**{len(rows)} messages affichés** (page {len(cursors['stack']) + 1}, plus récents d'abord)")
+                        for msg in rows:
+                            sender = msg.get('sender', 'unknown')
+                            msg_type = "👤 Utilisateur" if sender == "user" else "🤖 Assistant"
+                            with st.expander(f"{msg_type} - {str(msg.get('created_at') or 'N/A')[:16]}"):
+                                st.write(f"**Type:** {msg.get('type', 'text')}")
+                                st.write(f"**Contenu:**")
+                                st.text((msg.get('content') or 'N/A')[:500])
+                                if msg.get('type') == "image" or msg.get('image_ref') or msg.get('thumb_ref'):
+                                    st.write("📷 Contient une image")
+                        col1, col2 = st.columns(2)
+                        if col1.button("← Plus récents", key="admin_msgs_newer", disabled=not cursors["stack"]):
+                            cursors["stack"].pop()
+                            st.rerun()
+                        if col2.button("Plus anciens →", key="admin_msgs_older", disabled=not has_older):
+                            cursors["stack"].append((rows[-1]["created_at"], rows[-1]["id"]))
+                            st.rerun()
+                    else:
+                        st.info("Aucun message dans cette conversation")
                 else:
                     st.info("Aucune conversation disponible")
             except Exception as e:
                 st.error(f"Erreur chargement messages: {e}")
     with tab4:
         st.subheader("Statistiques Globales")
-        if supabase:
+        if repository:
+            estimated = st.checkbox(
+                "Estimation rapide (statistiques du planificateur)",
+                key="admin_stats_estimated",
+                help="Coût constant sur les très grandes tables ; précision du dernier ANALYZE"
+            )
             try:
-                users_count = supabase.table("users").select("*", count="exact").execute()
-                convs_count = supabase.table("conversations").select("*", count="exact").execute()
-                messages_count = supabase.table("messages").select("*", count="exact").execute()
+                stats, fetched_at = admin_query("stats", (estimated,), lambda: repository.get_admin_stats(estimated))
+                admin_data_as_of(fetched_at, "stats", "stats")
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("👥 Utilisateurs", users_count.count or 0)
+                    st.metric("👥 Utilisateurs", stats["users"])
                 with col2:
-                    st.metric("💬 Conversations", convs_count.count or 0)
+                    st.metric("💬 Conversations", stats["conversations"])
                 with col3:
-                    st.metric("📨 Messages", messages_count.count or 0)
+                    st.metric("📨 Messages", stats["messages"])
                 st.markdown("---")
                 st.subheader("Détails")
-                try:
-                    admins = supabase.table("users").select("*", count="exact").eq("role", "admin").execute()
-                    users_regular = supabase.table("users").select("*", count="exact").eq("role", "user").execute()
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("Admins", admins.count or 0)
-                    with col2:
-                        st.metric("Users", users_regular.count or 0)
-                except Exception as e:
-                    st.warning(f"Erreur stats rôles: {e}")
-                try:
-                    text_msgs = supabase.table("messages").select("*", count="exact").eq("type", "text").execute()
-                    image_msgs = supabase.table("messages").select("*", count="exact").eq("type", "image").execute()
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("Messages texte", text_msgs.count or 0)
-                    with col2:
-                        st.metric("Messages image", image_msgs.count or 0)
-                except Exception as e:
-                    st.warning(f"Erreur stats messages: {e}")
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("Admins", stats["admins"])
+                with col2:
+                    st.metric("Users", stats["regular_users"])
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("Messages texte", stats["text_messages"])
+                with col2:
+                    st.metric("Messages image", stats["image_messages"])
+                if stats["estimated"]:
+                    st.caption("Valeurs estimées d'après les statistiques du planificateur")
             except Exception as e:
                 st.error(f"Erreur statistiques: {e}")
+        st.markdown("---")
+        st.subheader("Quotas API (Google CSE / YouTube)")
+        quotas = get_quota_ledger().snapshot()
+        st.caption(f"Journée quota {quotas['day']} — remise à zéro le {quotas['resets_at'].strftime('%Y-%m-%d %H:%M %Z')}")
+        quota_labels = {"google_cse": "Google Custom Search", "youtube": "YouTube Data API"}
+        cols = st.columns(len(quotas["pools"]))
+        for col, (pool, info) in zip(cols, quotas["pools"].items()):
+            with col:
+                st.metric(quota_labels.get(pool, pool), f"{info['remaining']} / {info['limit']}", help="Unités restantes aujourd'hui")
+                st.progress(min(1.0, info["used"] / info["limit"]) if info["limit"] else 1.0)
+                if info["exhausted"]:
+                    st.error("Quota épuisé → fournisseur gratuit")
+                elif info["predicted_exhaustion"]:
+                    st.warning(f"Épuisement prévu vers {info['predicted_exhaustion'].strftime('%H:%M')}")
+                st.caption(f"{info['rate_per_hour']:.1f} unités/heure")
+        if quotas["endpoints"]:
+            st.write("**Appels par endpoint:**", quotas["endpoints"])
+    with tab5:
+        st.subheader("Tendances quotidiennes")
+        if repository:
+            try:
+                refresh_daily_rollups()
+                period = st.selectbox("Période", [30, 90, 365], format_func=lambda d: f"{d} derniers jours", key="admin_trend_days")
+                since = (datetime.now(timezone.utc) - timedelta(days=period)).date().isoformat()
+                rollups, fetched_at = admin_query("rollups", (since,), lambda: repository.get_daily_rollups(since))
+                admin_data_as_of(fetched_at, "rollups", "rollups")
+                if rollups:
+                    df = pd.DataFrame(rollups)
+                    df["day"] = pd.to_datetime(df["day"])
+                    df = df.set_index("day")
+                    st.markdown("**Messages, utilisateurs actifs et éditions par jour**")
+                    st.line_chart(df[["messages", "active_users", "edits"]])
+                    st.markdown("**Messages texte / image**")
+                    st.bar_chart(df[["text_messages", "image_messages"]])
+                    share = (df["image_messages"] / df["messages"].where(df["messages"] > 0)).fillna(0)
+                    st.markdown("**Part des messages image**")
+                    st.line_chart(share.rename("part_image"))
+                    st.markdown("**Nouvelles conversations**")
+                    st.bar_chart(df[["new_conversations"]])
+                    st.caption(f"Agrégats mis à jour le {str(df['updated_at'].max())[:16]} (UTC)")
+                else:
+                    st.info("Aucun agrégat sur la période")
+            except Exception as e:
+                st.error(f"Erreur tendances: {e}")
 
 def cleanup_temp_files():
     try:
@@ -1463,11 +2028,13 @@ if "llava_client" not in st.session_state:
             st.success("✅ LLaVA-OneVision chargé avec succès!")
     except:
         st.session_state.llava_client = None
-if "llama_client" not in st.session_state:
+if not st.session_state.get("llm_backend"):
+    # Pas de None mémorisé en session : chaque rerun retente tant que le backend manque
     try:
-        st.session_state.llama_client = Client("muryshev/LLaMA-3.1-70b-it-NeMo")
-    except:
-        st.session_state.llama_client = None
+        st.session_state.llm_backend = load_llm_backend()
+    except Exception as e:
+        st.session_state.llm_backend = None
+        st.warning(f"Backend LLM non disponible: {e}")
 if "qwen_client" not in st.session_state:
     try:
         st.session_state.qwen_client = Client("Selfit/ImageEditPro")
@@ -1539,6 +2106,8 @@ else:
         st.session_state.user = {"id": "guest", "email": "Invité", "role": "guest"}
         st.session_state.conversation = None
         st.session_state.messages_memory = []
+        st.session_state.messages_has_more = False
+        st.session_state.pop("conversations_cache", None)
         st.rerun()
 
 # -------------------------
@@ -1552,10 +2121,11 @@ if st.session_state.user["id"] != "guest":
             if conv:
                 st.session_state.conversation = conv
                 st.session_state.messages_memory = []
+                st.session_state.messages_has_more = False
                 st.success("Créée!")
                 time.sleep(1)
                 st.rerun()
-    convs = get_conversations(st.session_state.user["id"])
+    convs = get_cached_conversations(st.session_state.user["id"])
     if convs:
         options = [f"{c['description']} ({c['created_at'][:16]})" for c in convs]
         current_idx = 0
@@ -1576,10 +2146,16 @@ if st.session_state.user["id"] != "guest":
             st.session_state.conversation.get("conversation_id") != selected_conv.get("conversation_id")):
             with st.spinner("Chargement..."):
                 st.session_state.conversation = selected_conv
-                messages = get_messages(selected_conv.get("conversation_id"))
-                st.session_state.messages_memory = messages
+                load_conversation_history(selected_conv.get("conversation_id"))
                 time.sleep(0.5)
                 st.rerun()
+        with st.sidebar.expander("✏️ Renommer la conversation"):
+            new_description = st.text_input("Titre", value=selected_conv.get("description", ""), key=f"rename_{selected_conv.get('conversation_id')}")
+            if st.button("Renommer", key="rename_conversation"):
+                if new_description.strip() and update_conversation_description(selected_conv.get("conversation_id"), new_description.strip()):
+                    st.rerun()
+        with st.sidebar.expander("🔎 Rechercher dans vos messages"):
+            show_user_message_search(st.session_state.user["id"], convs)
 
 # -------------------------
 # Interface principale
@@ -1590,23 +2166,31 @@ if st.session_state.conversation:
 tab1, tab2 = st.tabs(["Chat Normal", "Mode Éditeur"])
 with tab1:
     st.write("Mode chat avec analyse d'images et recherche web MULTI-ANNÉES avancée")
+    if st.session_state.get("messages_has_more"):
+        if st.button("⬆️ Charger les messages plus anciens", key="load_older"):
+            load_older_messages()
+            st.rerun()
     if st.session_state.messages_memory:
         for msg in st.session_state.messages_memory:
             role = "user" if msg.get("sender") == "user" else "assistant"
             with st.chat_message(role):
-                if msg.get("type") == "image" and msg.get("image_data"):
+                if msg.get("type") == "image" and message_has_image(msg):
                     try:
-                        st.image(base64_to_image(msg["image_data"]), width=300)
+                        render_message_image(msg)
                     except:
                         pass
                 st.markdown(msg.get("content", ""))
-    with st.form("chat_form", clear_on_submit=True):
+    if st.session_state.get("search_prefetch_enabled"):
+        # Hors formulaire : chaque validation du brouillon (Ctrl+Entrée ou perte du focus)
+        # déclenche le préchargement de la recherche probable
         col1, col2 = st.columns([3, 1])
         with col1:
-            user_input = st.text_area(
+            st.text_area(
                 "Votre message:",
                 height=100,
-                placeholder="Posez vos questions... (recherche sur toutes les années)"
+                placeholder="Posez vos questions... (recherche sur toutes les années)",
+                key="chat_draft",
+                on_change=on_chat_draft_change
             )
         with col2:
             uploaded_file = st.file_uploader(
@@ -1614,7 +2198,24 @@ with tab1:
                 type=["png", "jpg", "jpeg"],
                 key="chat_upload"
             )
-        submit_chat = st.form_submit_button("Envoyer")
+        submit_chat = st.button("Envoyer", key="chat_send", on_click=submit_chat_draft)
+        user_input = st.session_state.pop("chat_submitted", "") if submit_chat else ""
+    else:
+        with st.form("chat_form", clear_on_submit=True):
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                user_input = st.text_area(
+                    "Votre message:",
+                    height=100,
+                    placeholder="Posez vos questions... (recherche sur toutes les années)"
+                )
+            with col2:
+                uploaded_file = st.file_uploader(
+                    "Image",
+                    type=["png", "jpg", "jpeg"],
+                    key="chat_upload"
+                )
+            submit_chat = st.form_submit_button("Envoyer")
 with tab2:
     st.write("Mode éditeur avec Qwen-Image-Edit")
     col1, col2 = st.columns([1, 1])
@@ -1633,7 +2234,7 @@ with tab2:
                     editor_image,
                     st.session_state.processor,
                     st.session_state.model,
-                    st.session_state.llama_client,
+                    st.session_state.llm_backend,
                     st.session_state.llava_client
                 )
                 final_desc = descriptions.get('final', descriptions.get('blip', 'N/A'))
@@ -1678,21 +2279,24 @@ with tab2:
             if st.session_state.conversation:
                 original_caption = generate_caption(editor_image, st.session_state.processor, st.session_state.model)
                 user_msg = f"**Édition demandée**\n\n**Image:** {original_caption}\n\n**Instruction:** {edit_instruction}"
-                original_b64 = image_to_base64(editor_image.convert("RGB"))
-                add_message(
+                original_ref, original_thumb_ref, _ = try_store_image(editor_image.convert("RGB"), editor_file.type, editor_file.size)
+                original_type = "image" if original_ref else "text"
+                message_id = add_message(
                     st.session_state.conversation.get("conversation_id"),
                     "user",
                     user_msg,
-                    "image",
-                    original_b64
+                    original_type,
+                    original_ref,
+                    thumb_ref=original_thumb_ref
                 )
                 st.session_state.messages_memory.append({
-                    "message_id": str(uuid.uuid4()),
+                    "message_id": message_id or str(uuid.uuid4()),
                     "sender": "user",
                     "content": user_msg,
-                    "type": "image",
-                    "image_data": original_b64,
-                    "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+                    "type": original_type,
+                    "image_ref": original_ref,
+                    "thumb_ref": original_thumb_ref,
+                    "created_at": utc_timestamp()
                 })
                 success = process_image_edit_request(
                     editor_image,
@@ -1712,17 +2316,18 @@ if 'submit_chat' in locals() and submit_chat and (user_input.strip() or uploaded
                 st.stop()
     conv_id = st.session_state.conversation.get("conversation_id")
     message_content = user_input.strip()
-    image_data = None
+    image_ref = None
+    thumb_ref = None
     msg_type = "text"
     if uploaded_file:
         with st.spinner("Analyse rapide de l'image..."):
             image = Image.open(uploaded_file)
-            image_data = image_to_base64(image)
+            image_ref, thumb_ref, _ = try_store_image(image, uploaded_file.type, uploaded_file.size)
             descriptions = generate_comprehensive_description(
                 image,
                 st.session_state.processor,
                 st.session_state.model,
-                st.session_state.llama_client,
+                st.session_state.llm_backend,
                 st.session_state.llava_client
             )
             preview = descriptions.get('final', descriptions.get('blip', 'N/A'))
@@ -1732,15 +2337,18 @@ if 'submit_chat' in locals() and submit_chat and (user_input.strip() or uploaded
             message_content = format_image_analysis_for_prompt(descriptions)
             if user_input.strip():
                 message_content += f"\n\nQuestion utilisateur: {user_input.strip()}"
-            msg_type = "image"
+            # Sans référence (stockage en échec) : message texte, pas une image introuvable
+            msg_type = "image" if image_ref else "text"
     if message_content:
-        add_message(conv_id, "user", message_content, msg_type, image_data)
+        message_id = add_message(conv_id, "user", message_content, msg_type, image_ref, thumb_ref=thumb_ref)
         user_msg = {
+            "message_id": message_id or str(uuid.uuid4()),
             "sender": "user",
             "content": message_content,
             "type": msg_type,
-            "image_data": image_data,
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            "image_ref": image_ref,
+            "thumb_ref": thumb_ref,
+            "created_at": utc_timestamp()
         }
         st.session_state.messages_memory.append(user_msg)
         lower = user_input.lower()
@@ -1763,7 +2371,7 @@ if 'submit_chat' in locals() and submit_chat and (user_input.strip() or uploaded
                 with st.spinner(f"🔍 Recherche {search_type} en cours (toutes années)..."):
                     search_info = st.empty()
                     search_info.info(f"Recherche de '{search_query}' sur {search_type.upper()} - TOUTES LES ANNÉES...")
-                    web_results = format_web_search_for_prompt(search_query, search_type)
+                    web_results = get_web_search_for_prompt(search_query, search_type)
                     prompt += f"{web_results}\n\n"
                     search_info.success(f"✅ Recherche {search_type} terminée! (Multi-années)")
                     time.sleep(1)
@@ -1787,15 +2395,20 @@ Utilisateur: {message_content}"""
                 if edit_context and any(w in user_input.lower() for w in ["edit", "image", "avant", "après"]):
                     with st.spinner("Consultation mémoire..."):
                         time.sleep(1)
-                response = get_ai_response(prompt)
+                response = get_ai_response(
+                    prompt,
+                    on_queue_position=lambda position: show_queue_position(placeholder, position)
+                )
                 stream_response_with_thinking(response, placeholder)
-                add_message(conv_id, "assistant", response, "text")
+                message_id = add_message(conv_id, "assistant", response, "text")
                 ai_msg = {
+                    "message_id": message_id or str(uuid.uuid4()),
                     "sender": "assistant",
                     "content": response,
                     "type": "text",
-                    "image_data": None,
-                    "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+                    "image_ref": None,
+                    "thumb_ref": None,
+                    "created_at": utc_timestamp()
                 }
                 st.session_state.messages_memory.append(ai_msg)
                 st.rerun()
@@ -1841,19 +2454,31 @@ with col2:
     st.write("- Wikipedia FR/EN")
     st.write("- Google News RSS")
     
+# -------------------------
+# Préchargement des recherches (optionnel)
+# -------------------------
+with st.sidebar.expander("⚡ Préchargement des recherches"):
+    st.checkbox(
+        "Précharger la recherche web pendant la saisie",
+        key="search_prefetch_enabled",
+        help="Lance la recherche probable en arrière-plan dès que le brouillon est validé, dans la limite d'un budget par session."
+    )
+    if st.session_state.get("search_prefetcher"):
+        report = st.session_state.search_prefetcher.report()
+        st.write(f"Préchargements: {report['prefetched']} (budget restant: {report['remaining_budget']})")
+        st.write(f"Utilisés: {report['hits']} ({report['hit_ratio']:.0%})")
+        st.write(f"Gaspillés: {report['wasted']} ({report['waste_ratio']:.0%})")
+
 # -------------------------
 # Statistiques Sidebar
 # -------------------------
 with st.sidebar.expander("📊 Vos statistiques"):
     if supabase and st.session_state.user["id"] != "guest":
         try:
-            conv_count = len(get_conversations(st.session_state.user["id"]))
-            msg_count = sum(len(get_messages(conv["conversation_id"])) for conv in get_conversations(st.session_state.user["id"]))
-            edit_count = sum(1 for msg in st.session_state.messages_memory if msg.get("edit_context"))
-            
-            st.metric("Conversations", conv_count)
-            st.metric("Messages", msg_count)
-            st.metric("Éditions d'images", edit_count)
+            user_stats = get_user_stats(st.session_state.user["id"])
+            st.metric("Conversations", user_stats["conversations"])
+            st.metric("Messages", user_stats["messages"])
+            st.metric("Éditions d'images", user_stats["edits"])
         except:
             st.error("Erreur chargement statistiques")
 
@@ -1980,6 +2605,10 @@ with st.expander("⚙️ Configuration APIs & Tests Multi-Années"):
             st.error("❌ Supabase KO")
     else:
         st.error("❌ Supabase non initialisé")
+    if repository:
+        st.success(f"✅ Accès données OK (backend: {repository.name})")
+    else:
+        st.error("❌ Accès données non initialisé")
     
     # LLaVA-OneVision
     if st.session_state.llava_client:
@@ -1988,10 +2617,27 @@ with st.expander("⚙️ Configuration APIs & Tests Multi-Années"):
         st.error("❌ LLaVA-OneVision KO")
     
     # LLaMA
-    if st.session_state.llama_client:
-        st.success("✅ LLaMA 3.1 70B OK")
+    if st.session_state.llm_backend:
+        st.success(f"✅ LLM OK (backend: {st.session_state.llm_backend.name})")
     else:
         st.error("❌ LLaMA KO")
+    writer_stats = get_message_writer().metrics()
+    st.write(
+        f"Écriture messages: {writer_stats['queue_depth']} en file, {writer_stats['written']} écrits, "
+        f"{writer_stats['failed']} en échec — latence p50 {writer_stats['flush_latency_p50']*1000:.0f} ms, "
+        f"p95 {writer_stats['flush_latency_p95']*1000:.0f} ms, lots de {writer_stats['avg_batch_size']:.1f}"
+    )
+    image_cache_stats = get_image_cache().stats()
+    st.write(
+        f"Cache images: {image_cache_stats['entries']} images, "
+        f"{image_cache_stats['bytes'] / 1e6:.1f}/{image_cache_stats['max_bytes'] / 1e6:.0f} Mo — "
+        f"{image_cache_stats['hit_ratio']:.0%} de succès, {image_cache_stats['evictions']} évictions"
+    )
+    scheduler_stats = get_llm_scheduler().snapshot()
+    st.write(
+        f"File LLaMA: {scheduler_stats['active']} en cours, {scheduler_stats['queued']} en attente, "
+        f"{scheduler_stats['shed'] + scheduler_stats['rejected']} refusées"
+    )
     
     # Qwen
     if st.session_state.qwen_client:
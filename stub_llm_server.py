@@ -0,0 +1,128 @@
+"""Serveur LLM local déterministe, compatible avec l'API OpenAI /v1/chat/completions.
+
+Sert de remplaçant au Space LLaMA pour les tests de charge et les benchmarks hors ligne.
+La réponse dépend uniquement du prompt ; la latence suit --latency (délai avant le
+premier token) et --token-rate (tokens par seconde).
+
+Usage:
+    python stub_llm_server.py --port 8765 --latency 0.8 --token-rate 40 --tokens 120
+    LLM_BACKEND=stub LLM_STUB_URL=http://127.0.0.1:8765 streamlit run streamlit_app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = [
+    "vision", "image", "analyse", "réponse", "modèle", "contexte", "recherche",
+    "résultat", "couleur", "scène", "détail", "information", "source", "date",
+    "le", "la", "les", "un", "une", "des", "et", "avec", "pour", "dans", "sur",
+]
+
+
+def generate_tokens(prompt, n_tokens):
+    """Suite de tokens déterministe dérivée du prompt"""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) for _ in range(n_tokens)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config = {"latency": 0.8, "token_rate": 40.0, "tokens": 120}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path in ("/health", "/v1/models"):
+            self._send_json({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/v1/chat/completions":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_error(400, "JSON invalide")
+            return
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        n_tokens = min(int(body.get("max_tokens") or self.config["tokens"]), self.config["tokens"])
+        tokens = generate_tokens(prompt, n_tokens)
+        delay = 1.0 / self.config["token_rate"] if self.config["token_rate"] > 0 else 0.0
+
+        time.sleep(self.config["latency"])
+        if body.get("stream"):
+            self._stream(tokens, delay)
+            return
+        time.sleep(delay * len(tokens))
+        self._send_json({
+            "id": f"stub-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(tokens)},
+                "finish_reason": "length" if n_tokens == body.get("max_tokens") else "stop"
+            }],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens)}
+        })
+
+    def _stream(self, tokens, delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            chunk = {
+                "object": "chat.completion.chunk",
+                "model": "stub",
+                "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(host="127.0.0.1", port=8765, latency=0.8, token_rate=40.0, tokens=120):
+    StubHandler.config = {"latency": latency, "token_rate": token_rate, "tokens": tokens}
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8, help="secondes avant le premier token")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="tokens par seconde")
+    parser.add_argument("--tokens", type=int, default=120, help="longueur maximale d'une réponse")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency, args.token_rate, args.tokens)
+    print(f"✅ Stub LLM sur http://{args.host}:{args.port} (latence {args.latency}s, {args.token_rate} tokens/s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
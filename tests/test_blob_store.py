@@ -0,0 +1,41 @@
+import pytest
+
+from blob_store import LocalBlobStore, LocalStorageBucket, StorageBlobStore, create_blob_store
+
+
+class FakeStorage:
+    def from_(self, bucket):
+        self.bucket = bucket
+        return self
+
+
+class FakeSupabase:
+    storage = FakeStorage()
+
+
+def test_defaults_to_supabase_storage_when_client_available(monkeypatch):
+    monkeypatch.delenv("BLOB_STORE", raising=False)
+    store = create_blob_store(FakeSupabase())
+    assert isinstance(store, StorageBlobStore)
+
+
+def test_fails_without_configuration_or_client(monkeypatch):
+    monkeypatch.delenv("BLOB_STORE", raising=False)
+    with pytest.raises(ValueError):
+        create_blob_store(None)
+
+
+def test_local_only_when_explicit(monkeypatch, tmp_path):
+    monkeypatch.setenv("BLOB_STORE", "local")
+    monkeypatch.setenv("BLOB_STORE_DIR", str(tmp_path))
+    assert isinstance(create_blob_store(None), LocalBlobStore)
+
+
+def test_put_after_delete_from_another_process_reuploads(tmp_path):
+    app_store = StorageBlobStore(LocalStorageBucket(str(tmp_path)))
+    worker_store = StorageBlobStore(LocalStorageBucket(str(tmp_path)))
+    ref = app_store.put(b"image")
+    # Suppression par retention_worker.py, dans un autre processus
+    worker_store.delete(ref)
+    assert app_store.put(b"image") == ref
+    assert app_store.get(ref) == b"image"
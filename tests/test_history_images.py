@@ -0,0 +1,67 @@
+from history_images import message_has_image, render_message_image
+
+
+class FakeUI:
+    """Doublure de st : enregistre les appels de rendu"""
+
+    def __init__(self, clicked=False):
+        self.calls = []
+        self.clicked = clicked
+
+    def image(self, data, **kwargs):
+        self.calls.append(("image", data, kwargs))
+
+    def caption(self, text):
+        self.calls.append(("caption", text))
+
+    def button(self, label, key=None):
+        self.calls.append(("button", label, key))
+        return self.clicked
+
+
+def fail_original(msg):
+    raise AssertionError("l'original ne doit pas être chargé")
+
+
+def test_thumbnail_only_row_renders_thumbnail_and_note():
+    # Ligne après retention_worker.py --image-policy drop : ni image_ref ni image_data
+    msg = {"message_id": "m1", "type": "image", "image_ref": None, "image_data": None, "thumb_ref": "sha256:t"}
+    ui = FakeUI(clicked=True)
+    assert message_has_image(msg)
+    rerun = render_message_image(ui, msg, {"m1"}, lambda ref: b"thumb:" + ref.encode(), fail_original)
+    assert not rerun
+    assert ui.calls == [
+        ("image", b"thumb:sha256:t", {"width": 300}),
+        ("caption", "Original archivé : miniature uniquement"),
+    ]
+
+
+def test_thumbnail_with_original_offers_expansion():
+    msg = {"message_id": "m2", "type": "image", "image_ref": "sha256:o", "thumb_ref": "sha256:t"}
+    expanded = set()
+    ui = FakeUI(clicked=True)
+    assert render_message_image(ui, msg, expanded, lambda ref: b"thumb", fail_original)
+    assert expanded == {"m2"}
+    assert [call[0] for call in ui.calls] == ["image", "button"]
+
+
+def test_expanded_row_renders_original():
+    msg = {"message_id": "m3", "type": "image", "image_ref": "sha256:o", "thumb_ref": "sha256:t"}
+    ui = FakeUI()
+    render_message_image(ui, msg, {"m3"}, lambda ref: b"thumb", lambda m: b"original")
+    assert ui.calls == [("image", b"original", {"use_column_width": True})]
+
+
+def test_text_row_has_no_image():
+    assert not message_has_image({"type": "text", "content": "bonjour"})
+
+
+def test_legacy_row_without_refs_loads_image_data_lazily():
+    # Ligne pas encore migrée : image_data n'est pas dans la projection de l'historique
+    msg = {"message_id": "m4", "type": "image", "image_ref": None, "thumb_ref": None}
+    loaded = []
+    ui = FakeUI()
+    assert message_has_image(msg)
+    render_message_image(ui, msg, set(), lambda ref: b"thumb", lambda m: loaded.append(m["message_id"]) or b"legacy")
+    assert loaded == ["m4"]
+    assert ui.calls == [("image", b"legacy", {"width": 300})]
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from llm_scheduler import FairScheduler
+
+
+class StopRendering(BaseException):
+    """Doublure de l'exception levée par Streamlit quand l'utilisateur interrompt le rendu"""
+
+
+def occupy(scheduler, user_id):
+    """Occupe un créneau jusqu'à ce que l'événement retourné soit positionné"""
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=scheduler.submit, args=(user_id, work))
+    thread.start()
+    assert started.wait(5)
+    return release, thread
+
+
+def interrupt(position):
+    raise StopRendering()
+
+
+def test_interrupted_wait_leaves_the_queue():
+    scheduler = FairScheduler(max_concurrency=1, poll_interval=0.01)
+    release, thread = occupy(scheduler, "a")
+    with pytest.raises(StopRendering):
+        scheduler.submit("b", lambda: None, on_position=interrupt)
+    assert scheduler.snapshot()["queued"] == 0
+    release.set()
+    thread.join(5)
+    assert scheduler.snapshot()["active"] == 0
+    assert scheduler.submit("c", lambda: "ok") == "ok"
+
+
+def test_interrupted_wait_after_grant_returns_the_slot():
+    scheduler = FairScheduler(max_concurrency=1, poll_interval=0.01)
+    release, thread = occupy(scheduler, "a")
+
+    def grant_then_interrupt(position):
+        # Le créneau se libère pendant l'affichage de la position : le ticket est servi puis abandonné
+        release.set()
+        thread.join(5)
+        raise StopRendering()
+
+    with pytest.raises(StopRendering):
+        scheduler.submit("b", lambda: None, on_position=grant_then_interrupt)
+    snapshot = scheduler.snapshot()
+    assert snapshot["active"] == 0 and snapshot["queued"] == 0
+    assert scheduler.submit("c", lambda: "ok") == "ok"
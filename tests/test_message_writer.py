@@ -0,0 +1,59 @@
+import json
+
+from message_writer import MessageWriteBehind
+
+
+def test_bad_row_is_isolated_and_persisted(tmp_path):
+    path = tmp_path / "dead_letters.jsonl"
+    written = []
+
+    def insert_batch(rows):
+        if any(row["bad"] for row in rows):
+            raise ValueError("violation de clé étrangère")
+        written.extend(row["id"] for row in rows)
+
+    writer = MessageWriteBehind(insert_batch, max_batch=8, flush_interval=0.05, retry_backoff=0.01,
+                                dead_letter_path=str(path))
+    for i in range(8):
+        writer.enqueue({"id": str(i), "bad": i == 5})
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert sorted(written) == ["0", "1", "2", "3", "4", "6", "7"]
+    metrics = writer.metrics()
+    assert (metrics["written"], metrics["failed"], metrics["retries"]) == (7, 1, 0)
+    entries = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [entry["row"]["id"] for entry in entries] == ["5"]
+
+
+def test_requeue_dead_letters(tmp_path):
+    path = tmp_path / "dead_letters.jsonl"
+    path.write_text(json.dumps({"row": {"id": "x"}, "error": "panne"}) + "\n", encoding="utf-8")
+    written = []
+    writer = MessageWriteBehind(lambda rows: written.extend(rows), flush_interval=0.01, dead_letter_path=str(path))
+    assert writer.requeue_dead_letters() == 1
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert written == [{"id": "x"}]
+    assert not path.exists()
+
+
+def test_outage_retries_the_whole_batch_without_splitting(tmp_path):
+    calls = []
+
+    def insert_batch(rows):
+        calls.append(len(rows))
+        if len(calls) <= 2:
+            raise ConnectionError("base indisponible")
+
+    writer = MessageWriteBehind(insert_batch, max_batch=8, flush_interval=0.05, retry_backoff=0.01,
+                                dead_letter_path=str(tmp_path / "dead_letters.jsonl"))
+    for i in range(8):
+        writer.enqueue({"id": str(i)})
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert calls == [8, 8, 8]
+    metrics = writer.metrics()
+    assert (metrics["written"], metrics["failed"], metrics["retries"], metrics["splits"]) == (8, 0, 2, 0)
+    assert not writer.failing
@@ -0,0 +1,65 @@
+"""Aller-retour réel contre PostgreSQL (migrations appliquées).
+
+Ignoré sans base : définir DB_HOST/DB_NAME/DB_USER/DB_PASSWORD/DB_PORT, par
+exemple sur la pile locale `supabase start` après `python migrate.py up`.
+"""
+import os
+import time
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+if not os.environ.get("DB_HOST"):
+    pytest.skip("DB_HOST non défini : pas de base PostgreSQL de test", allow_module_level=True)
+
+import repository as repository_module
+from repository import PostgresRepository, postgres_settings_from_env
+
+
+@pytest.fixture
+def repository():
+    repo = PostgresRepository(min_connections=1, max_connections=2, **postgres_settings_from_env())
+    yield repo
+    repo.close()
+
+
+@pytest.fixture
+def seeded(repository):
+    user_id = str(uuid.uuid4())
+    conversation_id = str(uuid.uuid4())
+    now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+    repository.create_user({"id": user_id, "email": f"test-{user_id[:8]}@example.invalid", "name": "test",
+                            "role": "user", "created_at": now})
+    repository.create_conversation({"conversation_id": conversation_id, "user_id": user_id,
+                                    "description": "test", "created_at": now})
+    repository.insert_messages([
+        {"id": str(uuid.uuid4()), "conversation_id": conversation_id, "sender": "user",
+         "content": f"message {i}", "type": "text", "created_at": now,
+         "image_ref": None, "thumb_ref": None, "edit_context": None}
+        for i in range(3)
+    ])
+    yield {"user_id": user_id, "conversation_id": conversation_id}
+    repository.delete_conversation(conversation_id)
+    repository.delete_user(user_id)
+
+
+def test_count_messages_by_conversation(repository, seeded):
+    missing = str(uuid.uuid4())
+    counts = repository.count_messages_by_conversation([seeded["conversation_id"], missing])
+    assert counts == {seeded["conversation_id"]: 3, missing: 0}
+
+
+def test_update_users_role_in_one_statement(repository, seeded):
+    updated = repository.update_users_role([seeded["user_id"]], "admin")
+    assert updated == [seeded["user_id"]]
+    rows, _ = repository.list_users_page(role="admin", limit=1000)
+    assert seeded["user_id"] in {str(row["id"]) for row in rows}
+
+
+def test_search_messages_reports_capped_candidates(repository, seeded, monkeypatch):
+    rows, _ = repository.search_messages("message", user_id=seeded["user_id"])
+    assert len(rows) == 3 and not rows[0]["capped"]
+    monkeypatch.setattr(repository_module, "SEARCH_MAX_CANDIDATES", 2)
+    rows, _ = repository.search_messages("message", user_id=seeded["user_id"])
+    assert len(rows) == 2 and rows[0]["capped"]
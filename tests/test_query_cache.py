@@ -0,0 +1,27 @@
+from query_cache import QueryCache
+
+
+def test_invalidate_where_drops_only_matching_pages():
+    cache = QueryCache(ttl=60)
+    loads = []
+
+    def loader(role):
+        def load():
+            loads.append(role)
+            return [role]
+        return load
+
+    for role in (None, "user", "admin"):
+        cache.fetch("users", ("", role), loader(role))
+    assert cache.invalidate("users", where=lambda params: params[1] == "admin") == 1
+    for role in (None, "user", "admin"):
+        cache.fetch("users", ("", role), loader(role))
+    assert loads == [None, "user", "admin", "admin"]
+
+
+def test_update_patches_cached_values_in_place():
+    cache = QueryCache(ttl=60)
+    cache.fetch("users", ("",), lambda: [{"id": "1", "role": "user"}])
+    cache.update("users", lambda params, rows: [dict(r, role="admin") for r in rows])
+    value, _ = cache.fetch("users", ("",), lambda: [])
+    assert value == [{"id": "1", "role": "admin"}]
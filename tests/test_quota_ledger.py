@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from quota_ledger import QUOTA_TIMEZONE, QuotaLedger, _hours_between, is_quota_exhausted
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("pas de JSON")
+        return self._body
+
+
+def google_error(status_code, reason):
+    return FakeResponse(status_code, {"error": {"code": status_code, "errors": [{"reason": reason}]}})
+
+
+def test_only_quota_reasons_mark_exhausted():
+    assert is_quota_exhausted(google_error(403, "quotaExceeded"))
+    assert is_quota_exhausted(google_error(403, "dailyLimitExceeded"))
+    assert is_quota_exhausted(google_error(403, "rateLimitExceeded"))
+    assert is_quota_exhausted(FakeResponse(429))
+    # Clé invalide, API non activée, commentaires désactivés : le pool reste ouvert
+    assert not is_quota_exhausted(google_error(403, "keyInvalid"))
+    assert not is_quota_exhausted(google_error(403, "accessNotConfigured"))
+    assert not is_quota_exhausted(google_error(403, "commentsDisabled"))
+    assert not is_quota_exhausted(FakeResponse(403))
+    assert not is_quota_exhausted(FakeResponse(200, {}))
+
+
+def test_next_reset_across_dst_changes(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "ledger.json"))
+    # Veille du passage à l'heure d'été : le minuit suivant est encore en PST
+    now = datetime(2025, 3, 8, 12, 0, tzinfo=QUOTA_TIMEZONE)
+    reset = ledger._next_reset(now)
+    assert reset.isoformat() == "2025-03-09T00:00:00-08:00"
+    # Journée de 23 heures : de minuit à minuit, 23 heures réelles
+    day_start = datetime(2025, 3, 9, 0, 0, tzinfo=QUOTA_TIMEZONE)
+    assert _hours_between(day_start, ledger._next_reset(day_start)) == 23
+    # Retour à l'heure normale : journée de 25 heures, minuit suivant en PST
+    day_start = datetime(2025, 11, 2, 0, 0, tzinfo=QUOTA_TIMEZONE)
+    reset = ledger._next_reset(day_start)
+    assert reset.isoformat() == "2025-11-03T00:00:00-08:00"
+    assert _hours_between(day_start, reset) == 25
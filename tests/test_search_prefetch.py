@@ -0,0 +1,44 @@
+import threading
+import time
+
+from search_prefetch import SearchPrefetcher, SearchResultCache, normalize_search_key
+
+
+def test_prefetch_skips_key_computed_in_foreground():
+    cache = SearchResultCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append("foreground")
+        started.set()
+        release.wait(5)
+        return "résultats"
+
+    key = normalize_search_key("web", "météo paris")
+    worker = threading.Thread(target=lambda: cache.get_or_compute(key, slow))
+    worker.start()
+    assert started.wait(5)
+    # Le minuteur de debounce se déclenche pendant la recherche envoyée
+    assert not cache.prefetch(key, lambda: calls.append("prefetch"))
+    release.set()
+    worker.join(5)
+    assert calls == ["foreground"]
+    assert cache.get_or_compute(key, lambda: "autre") == ("résultats", "cache")
+
+
+def test_lookup_cancels_pending_debounce():
+    computed = []
+    prefetcher = SearchPrefetcher(
+        SearchResultCache(ttl=60),
+        detect_intent=lambda text: ("web", text),
+        compute=lambda query, search_type: computed.append(query) or query,
+        debounce=0.1,
+    )
+    prefetcher.on_draft("actualités")
+    assert prefetcher.lookup("web", "actualités") == "actualités"
+    time.sleep(0.3)
+    assert computed == ["actualités"]
+    assert prefetcher.report()["prefetched"] == 0
+    assert prefetcher.report()["wasted"] == 0
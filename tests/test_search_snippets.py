@@ -0,0 +1,21 @@
+from search_snippets import SNIPPET_START, SNIPPET_STOP, escape_markdown, snippet_markdown
+
+
+def highlight(term):
+    return f"{SNIPPET_START}{term}{SNIPPET_STOP}"
+
+
+def test_only_highlight_markers_become_bold():
+    snippet = f"voir [lien](https://exemple.fr) et {highlight('chat')} **pas gras** $x$ {highlight('noir')}"
+    assert snippet_markdown(snippet) == (
+        r"voir \[lien\]\(https\://exemple\.fr\) et **chat** \*\*pas gras\*\* \$x\$ **noir**"
+    )
+
+
+def test_line_breaks_cannot_start_markdown_blocks():
+    assert escape_markdown("a\n# titre\n- item") == r"a \# titre \- item"
+
+
+def test_empty_snippet():
+    assert snippet_markdown(None) == ""
+    assert snippet_markdown(highlight("seul")) == "**seul**"
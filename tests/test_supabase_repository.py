@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import repository
+from repository import SupabaseRepository
+
+
+class FakeQuery:
+    """Constructeur de requête PostgREST minimal : compte les lignes filtrées par in_"""
+
+    def __init__(self, client):
+        self.client = client
+        self.ids = []
+        self.edits_only = False
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def in_(self, column, values):
+        self.ids = list(values)
+        return self
+
+    @property
+    def not_(self):
+        return self
+
+    def is_(self, column, value):
+        self.edits_only = True
+        return self
+
+    def execute(self):
+        self.client.in_sizes.append(len(self.ids))
+        count = 2 * len(self.ids) if not self.edits_only else len(self.ids)
+        return SimpleNamespace(count=count, data=None)
+
+
+class FakeClient:
+    def __init__(self):
+        self.in_sizes = []
+
+    def rpc(self, name, params):
+        raise RuntimeError("fonction get_user_stats absente")
+
+    def table(self, name):
+        return FakeQuery(self)
+
+
+def test_user_stats_fallback_chunks_conversation_ids(monkeypatch):
+    monkeypatch.setattr(repository, "IN_FILTER_CHUNK", 100)
+    client = FakeClient()
+    ids = [f"c{i}" for i in range(250)]
+    stats = SupabaseRepository(client).get_user_stats("u1", ids)
+    assert stats == {"conversations": 250, "messages": 500, "edits": 250}
+    assert max(client.in_sizes) == 100
+    assert len(client.in_sizes) == 6